@@ -80,11 +80,15 @@ class Controller(common.OpenstackController):
 
         builder - the response model builder
         """
-        instance_list = self.compute_api.get_all(req.environ['nova.context'])
-        limited_list = self._limit_items(instance_list, req)
+        if is_detail:
+            columns = None
+        else:
+            columns = ('id', 'display_name')
+        instance_list = self._get_items(req.environ['nova.context'], req,
+                                        columns)
         builder = self._get_view_builder(req)
         servers = [builder.build(inst, is_detail)['server']
-                for inst in limited_list]
+                for inst in instance_list]
         return dict(servers=servers)
 
     @scheduler_api.redirect_handler
@@ -588,8 +592,12 @@ class ControllerV10(Controller):
         return nova.api.openstack.views.servers.ViewBuilderV10(
             addresses_builder)
 
-    def _limit_items(self, items, req):
-        return common.limited(items, req)
+    def _get_items(self, context, req, columns):
+        """Returns the page of instances requested by offset and limit."""
+        limit, offset = common.get_limit_and_offset(req)
+        instance_list = self.compute_api.get_all(context, columns=columns,
+                                                 limit=offset + limit)
+        return instance_list[offset:]
 
     def _parse_update(self, context, server_id, inst_dict, update_dict):
         if 'adminPass' in inst_dict['server']:
@@ -651,8 +659,11 @@ class ControllerV11(Controller):
         self.compute_api.set_admin_password(context, id, password)
         return exc.HTTPAccepted()
 
-    def _limit_items(self, items, req):
-        return common.limited_by_marker(items, req)
+    def _get_items(self, context, req, columns):
+        """Returns the page of instances requested by marker and limit."""
+        limit, marker = common.get_limit_and_marker(req)
+        return self.compute_api.get_all(context, columns=columns,
+                                        marker=marker, limit=limit)
 
     def _validate_metadata(self, metadata):
         """Ensure that we can work with the metadata given."""
@@ -42,6 +42,10 @@ LOG = logging.getLogger('nova.compute.api')
 
 FLAGS = flags.FLAGS
 flags.DECLARE('vncproxy_topic', 'nova.vnc')
+flags.DEFINE_bool('scheduler_batch_run_instances', False,
+                  'Send the instances of a reservation to the scheduler in '
+                  'one run_instances message, only once every scheduler '
+                  'runs a version that handles it')
 
 
 def generate_default_hostname(instance_id):
@@ -82,7 +86,8 @@ class API(base.Base):
         topic = self.db.queue_get_for(context, FLAGS.compute_topic, host)
         return rpc.call(context,
                         topic,
-                        {"method": "get_network_topic", "args": {'fake': 1}})
+                        {"method": "get_network_topic", "args": {'fake': 1}},
+                        timeout=FLAGS.rpc_api_call_timeout)
 
     def _check_injected_file_quota(self, context, injected_files):
         """Enforce quota limits on injected files.
@@ -244,17 +249,29 @@ class API(base.Base):
             instance = self.update(context, instance_id, **updates)
             instances.append(instance)
 
-            pid = context.project_id
-            uid = context.user_id
+        pid = context.project_id
+        uid = context.user_id
+        instance_ids = [instance['id'] for instance in instances]
+        args = {"topic": FLAGS.compute_topic,
+                "availability_zone": availability_zone,
+                "injected_files": injected_files}
+        if len(instance_ids) == 1 or not FLAGS.scheduler_batch_run_instances:
+            for instance_id in instance_ids:
+                LOG.debug(_("Casting to scheduler for %(pid)s/%(uid)s's"
+                        " instance %(instance_id)s") % locals())
+                rpc.cast(context,
+                         FLAGS.scheduler_topic,
+                         {"method": "run_instance",
+                          "args": dict(args, instance_id=instance_id)})
+        else:
+            # NOTE: the scheduler places a whole reservation at once
+            #       so it can spread or pack it over the hosts
             LOG.debug(_("Casting to scheduler for %(pid)s/%(uid)s's"
-                    " instance %(instance_id)s") % locals())
+                    " instances %(instance_ids)s") % locals())
             rpc.cast(context,
                      FLAGS.scheduler_topic,
-                     {"method": "run_instance",
-                      "args": {"topic": FLAGS.compute_topic,
-                               "instance_id": instance_id,
-                               "availability_zone": availability_zone,
-                               "injected_files": injected_files}})
+                     {"method": "run_instances",
+                      "args": dict(args, instance_ids=instance_ids)})
 
         for group_id in security_groups:
             self.trigger_security_group_members_refresh(elevated, group_id)
@@ -412,12 +429,17 @@ class API(base.Base):
         return self.get(context, instance_id)
 
     def get_all(self, context, project_id=None, reservation_id=None,
-                fixed_ip=None):
+                fixed_ip=None, columns=None, marker=None, limit=None):
         """Get all instances filtered by one of the given parameters.
 
         If there is no filter and the context is an admin, it will retreive
         all instances in the system.
 
+        Without a reservation_id or fixed_ip filter, the instances are
+        ordered by id and only the ones after the id marker are returned,
+        at most limit of them.  If columns are given, only those columns
+        of each instance are returned, as dicts.
+
         """
         if reservation_id is not None:
             return self.db.instance_get_all_by_reservation(
@@ -426,18 +448,27 @@ class API(base.Base):
         if fixed_ip is not None:
             return self.db.fixed_ip_get_instance(context, fixed_ip)
 
+        page = dict(marker=marker, limit=limit)
         if project_id or not context.is_admin:
             if not context.project:
+                if columns:
+                    return self.db.instance_get_all_columns_by_user(
+                        context, context.user_id, columns, **page)
                 return self.db.instance_get_all_by_user(
-                    context, context.user_id)
+                    context, context.user_id, **page)
 
             if project_id is None:
                 project_id = context.project_id
 
+            if columns:
+                return self.db.instance_get_all_columns_by_project(
+                    context, project_id, columns, **page)
             return self.db.instance_get_all_by_project(
-                context, project_id)
+                context, project_id, **page)
 
-        return self.db.instance_get_all(context)
+        if columns:
+            return self.db.instance_get_all_columns(context, columns, **page)
+        return self.db.instance_get_all(context, **page)
 
     def _cast_compute_message(self, method, context, instance_id, host=None,
                               params=None):
@@ -476,7 +507,8 @@ class API(base.Base):
         queue = self.db.queue_get_for(context, FLAGS.compute_topic, host)
         params['instance_id'] = instance_id
         kwargs = {'method': method, 'args': params}
-        return rpc.call(context, queue, kwargs)
+        return rpc.call(context, queue, kwargs,
+                        timeout=FLAGS.rpc_api_call_timeout)
 
     def _cast_scheduler_message(self, context, args):
         """Generic handler for RPC calls to the scheduler."""
@@ -679,7 +711,8 @@ class API(base.Base):
                  {'method': 'authorize_vnc_console',
                   'args': {'token': output['token'],
                            'host': output['host'],
-                           'port': output['port']}})
+                           'port': output['port']}},
+                 timeout=FLAGS.rpc_api_call_timeout)
 
         # hostignore and portignore are compatability params for noVNC
         return {'url': '%s/vnc_auto.html?token=%s&host=%s&port=%s' % (
@@ -45,6 +45,7 @@ import functools
 
 from eventlet import greenthread
 
+from nova import context
 from nova import exception
 from nova import flags
 from nova import log as logging
@@ -77,6 +78,8 @@ flags.DEFINE_integer("rescue_timeout", 0,
                      " Set to 0 to disable.")
 flags.DEFINE_bool('auto_assign_floating_ip', False,
                   'Autoassigning floating ip to VM')
+flags.DEFINE_integer('host_state_interval', 120,
+                     'Interval in seconds for querying the host status')
 
 
 LOG = logging.getLogger('nova.compute.manager')
@@ -132,6 +135,7 @@ class ComputeManager(manager.SchedulerDependentManager):
         self.volume_manager = utils.import_object(FLAGS.volume_manager)
         self.network_api = network.API()
         self._last_host_check = 0
+        self._host_stats = {}
         super(ComputeManager, self).__init__(service_name="compute",
                                              *args, **kwargs)
 
@@ -220,37 +224,48 @@ class ComputeManager(manager.SchedulerDependentManager):
         context = context.elevated()
         instance_ref = self.db.instance_get(context, instance_id)
         instance_ref.injected_files = kwargs.get('injected_files', [])
-        if instance_ref['name'] in self.driver.list_instances():
-            raise exception.Error(_("Instance has already been created"))
-        LOG.audit(_("instance %s: starting..."), instance_id,
-                  context=context)
-        self.db.instance_update(context,
-                                instance_id,
-                                {'host': self.host, 'launched_on': self.host})
+        try:
+            if instance_ref['name'] in self.driver.list_instances():
+                raise exception.Error(_("Instance has already been created"))
+            LOG.audit(_("instance %s: starting..."), instance_id,
+                      context=context)
+            self.db.instance_update(context,
+                                    instance_id,
+                                    {'host': self.host,
+                                     'launched_on': self.host})
+
+            self.db.instance_set_state(context,
+                                       instance_id,
+                                       power_state.NOSTATE,
+                                       'networking')
+
+            is_vpn = instance_ref['image_id'] == str(FLAGS.vpn_image_id)
+            # NOTE(vish): This could be a cast because we don't do anything
+            #             with the address currently, but I'm leaving it as
+            #             a call to ensure that network setup completes.  We
+            #             will eventually also need to save the address here.
+            if not FLAGS.stub_network:
+                address = rpc.call(context,
+                                   self.get_network_topic(context),
+                                   {"method": "allocate_fixed_ip",
+                                    "args": {"instance_id": instance_id,
+                                             "vpn": is_vpn}})
 
-        self.db.instance_set_state(context,
-                                   instance_id,
-                                   power_state.NOSTATE,
-                                   'networking')
-
-        is_vpn = instance_ref['image_id'] == str(FLAGS.vpn_image_id)
-        # NOTE(vish): This could be a cast because we don't do anything
-        #             with the address currently, but I'm leaving it as
-        #             a call to ensure that network setup completes.  We
-        #             will eventually also need to save the address here.
-        if not FLAGS.stub_network:
-            address = rpc.call(context,
-                               self.get_network_topic(context),
-                               {"method": "allocate_fixed_ip",
-                                "args": {"instance_id": instance_id,
-                                         "vpn": is_vpn}})
-
-            self.network_manager.setup_compute_network(context,
-                                                       instance_id)
-
-        # TODO(vish) check to make sure the availability zone matches
-        self._update_state(context, instance_id, power_state.BUILDING)
+                self.network_manager.setup_compute_network(context,
+                                                           instance_id)
 
+            # TODO(vish) check to make sure the availability zone matches
+            self._update_state(context, instance_id, power_state.BUILDING)
+        except Exception:
+            # NOTE: the instance never got as far as spawning, so give
+            #       back the resources the schedulers claimed for it
+            exc_info = sys.exc_info()
+            self.db.compute_claim_finish(context, instance_id, 'released')
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+        # NOTE: tell the schedulers whether the resources they
+        #       claimed for this instance are in use now
+        claim_status = 'confirmed'
         try:
             self.driver.spawn(instance_ref)
         except Exception as ex:  # pylint: disable=W0702
@@ -258,6 +273,8 @@ class ComputeManager(manager.SchedulerDependentManager):
                     "virtualization enabled in the BIOS? Details: "
                     "%(ex)s") % locals()
             LOG.exception(msg)
+            claim_status = 'released'
+        self.db.compute_claim_finish(context, instance_id, claim_status)
 
         if not FLAGS.stub_network and FLAGS.auto_assign_floating_ip:
             public_ip = self.network_api.allocate_floating_ip(context)
@@ -1082,22 +1099,24 @@ class ComputeManager(manager.SchedulerDependentManager):
 
     def periodic_tasks(self, context=None):
         """Tasks to be run at a periodic interval."""
-        error_list = super(ComputeManager, self).periodic_tasks(context)
-        if error_list is None:
-            error_list = []
-
+        error_list = []
+        # NOTE: refresh the capabilities before the superclass
+        #       sends them to the schedulers
         try:
-            if FLAGS.rescue_timeout > 0:
-                self.driver.poll_rescued_instances(FLAGS.rescue_timeout)
+            self._report_driver_status()
         except Exception as ex:
-            LOG.warning(_("Error during poll_rescued_instances: %s"),
+            LOG.warning(_("Error during report_driver_status(): %s"),
                         unicode(ex))
             error_list.append(ex)
 
+        error_list.extend(
+                super(ComputeManager, self).periodic_tasks(context) or [])
+
         try:
-            self._report_driver_status()
+            if FLAGS.rescue_timeout > 0:
+                self.driver.poll_rescued_instances(FLAGS.rescue_timeout)
         except Exception as ex:
-            LOG.warning(_("Error during report_driver_status(): %s"),
+            LOG.warning(_("Error during poll_rescued_instances: %s"),
                         unicode(ex))
             error_list.append(ex)
 
@@ -1117,8 +1136,26 @@ class ComputeManager(manager.SchedulerDependentManager):
             LOG.info(_("Updating host status"))
             # This will grab info about the host and queue it
             # to be sent to the Schedulers.
-            self.update_service_capabilities(
-                self.driver.get_host_stats(refresh=True))
+            self._host_stats = self.driver.get_host_stats(refresh=True) or {}
+        capabilities = dict(self._host_stats)
+        capabilities.update(self._get_usage())
+        self.update_service_capabilities(capabilities)
+
+    def _get_usage(self):
+        """Returns the vcpus, memory_mb and local_gb the instances on this
+        host use, as vcpus_used, memory_mb_used and local_gb_used, and the
+        time they were summed up as usage_updated_at."""
+        # NOTE: take the time first, an instance placed while the sums
+        #       are read is counted twice by the schedulers rather than
+        #       not at all
+        updated_at = utils.isotime()
+        ctxt = context.get_admin_context()
+        used = self.db.instance_get_sums_by_host(ctxt, self.host)
+        used = used.get(self.host, {})
+        usage = dict(('%s_used' % resource, used.get(resource, 0))
+                     for resource in ('vcpus', 'memory_mb', 'local_gb'))
+        usage['usage_updated_at'] = updated_at
+        return usage
 
     def _poll_instance_states(self, context):
         vm_instances = self.driver.list_instances_detail()
@@ -1127,7 +1164,8 @@ class ComputeManager(manager.SchedulerDependentManager):
         # Keep a list of VMs not in the DB, cross them off as we find them
         vms_not_found_in_db = list(vm_instances.keys())
 
-        db_instances = self.db.instance_get_all_by_host(context, self.host)
+        db_instances = self.db.instance_get_all_columns_by_host(context,
+                self.host, ('id', 'name', 'state', 'state_description'))
 
         for db_instance in db_instances:
             name = db_instance['name']
@@ -67,4 +67,5 @@ class API(base.Base):
                                       FLAGS.compute_topic,
                                       instance_host)
         return rpc.call(context, topic, {'method': 'get_console_topic',
-                                         'args': {'fake': 1}})
+                                         'args': {'fake': 1}},
+                        timeout=FLAGS.rpc_api_call_timeout)
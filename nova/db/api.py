@@ -322,6 +322,28 @@ def migration_get_by_instance_and_status(context, instance_id, status):
 ####################
 
 
+def compute_claim_create(context, values):
+    """Record resources claimed on a host for an instance."""
+    return IMPL.compute_claim_create(context, values)
+
+
+def compute_claim_finish(context, instance_id, status):
+    """Mark the open claims of an instance confirmed or released."""
+    return IMPL.compute_claim_finish(context, instance_id, status)
+
+
+def compute_claim_get_all(context, since=None):
+    """Get all claims made since the given time that weren't released."""
+    return IMPL.compute_claim_get_all(context, since)
+
+
+def compute_claim_destroy_older_than(context, before):
+    """Delete the claims made before the given time."""
+    return IMPL.compute_claim_destroy_older_than(context, before)
+
+####################
+
+
 def fixed_ip_associate(context, address, instance_id):
     """Associate fixed ip to instance.
 
@@ -331,6 +353,23 @@ def fixed_ip_associate(context, address, instance_id):
     return IMPL.fixed_ip_associate(context, address, instance_id)
 
 
+def fixed_ip_get_free_by_network(context, network_id, before=None):
+    """Get (id, address) of the fixed ips an instance may be given in a
+    network, ordered by id, only those with an id below before if given."""
+    return IMPL.fixed_ip_get_free_by_network(context, network_id, before)
+
+
+def fixed_ip_associate_if_free(context, fixed_ip_id, network_id,
+                               instance_id):
+    """Associate a fixed ip with an instance unless it was taken meanwhile.
+
+    Returns whether the ip was associated.
+
+    """
+    return IMPL.fixed_ip_associate_if_free(context, fixed_ip_id, network_id,
+                                           instance_id)
+
+
 def fixed_ip_associate_pool(context, network_id, instance_id):
     """Find free ip in network and associate it to instance.
 
@@ -417,19 +456,28 @@ def instance_get(context, instance_id):
     return IMPL.instance_get(context, instance_id)
 
 
-def instance_get_all(context):
-    """Get all instances."""
-    return IMPL.instance_get_all(context)
+def instance_get_all(context, marker=None, limit=None):
+    """Get all instances, ordered by id.
+
+    Only the instances after the one with id marker are returned, at most
+    limit of them.
+
+    """
+    return IMPL.instance_get_all(context, marker=marker, limit=limit)
 
 
-def instance_get_all_by_user(context, user_id):
-    """Get all instances."""
-    return IMPL.instance_get_all_by_user(context, user_id)
+def instance_get_all_by_user(context, user_id, marker=None, limit=None):
+    """Get all instances of a user, paginated like instance_get_all."""
+    return IMPL.instance_get_all_by_user(context, user_id, marker=marker,
+                                         limit=limit)
 
 
-def instance_get_all_by_project(context, project_id):
-    """Get all instance belonging to a project."""
-    return IMPL.instance_get_all_by_project(context, project_id)
+def instance_get_all_by_project(context, project_id, marker=None,
+                                limit=None):
+    """Get all instance belonging to a project, paginated like
+    instance_get_all."""
+    return IMPL.instance_get_all_by_project(context, project_id,
+                                            marker=marker, limit=limit)
 
 
 def instance_get_all_by_host(context, host):
@@ -442,6 +490,35 @@ def instance_get_all_by_reservation(context, reservation_id):
     return IMPL.instance_get_all_by_reservation(context, reservation_id)
 
 
+def instance_get_all_columns(context, columns, marker=None, limit=None):
+    """Get only the given columns of all instances, as dicts, paginated
+    like instance_get_all."""
+    return IMPL.instance_get_all_columns(context, columns, marker=marker,
+                                         limit=limit)
+
+
+def instance_get_all_columns_by_user(context, user_id, columns, marker=None,
+                                     limit=None):
+    """Get only the given columns of the instances of a user, as dicts,
+    paginated like instance_get_all."""
+    return IMPL.instance_get_all_columns_by_user(context, user_id, columns,
+                                                 marker=marker, limit=limit)
+
+
+def instance_get_all_columns_by_project(context, project_id, columns,
+                                        marker=None, limit=None):
+    """Get only the given columns of the instances of a project, as dicts,
+    paginated like instance_get_all."""
+    return IMPL.instance_get_all_columns_by_project(context, project_id,
+                                                    columns, marker=marker,
+                                                    limit=limit)
+
+
+def instance_get_all_columns_by_host(context, host, columns):
+    """Get only the given columns of the instances of a host, as dicts."""
+    return IMPL.instance_get_all_columns_by_host(context, host, columns)
+
+
 def instance_get_fixed_address(context, instance_id):
     """Get the fixed ip address of an instance."""
     return IMPL.instance_get_fixed_address(context, instance_id)
@@ -502,6 +579,12 @@ def instance_get_disk_sum_by_host_and_project(context, hostname, proj_id):
                                                           proj_id)
 
 
+def instance_get_sums_by_host(context, host=None):
+    """Get the vcpus, memory_mb and local_gb instances use on every host,
+    or only on host."""
+    return IMPL.instance_get_sums_by_host(context, host)
+
+
 def instance_action_create(context, values):
     """Create an instance action from the values dictionary."""
     return IMPL.instance_action_create(context, values)
@@ -829,6 +912,12 @@ def volume_get_all_by_host(context, host):
     return IMPL.volume_get_all_by_host(context, host)
 
 
+def volume_get_sums_by_host(context, hosts, status=None):
+    """Get the gigabytes of the volumes on each of hosts, or only of the
+    ones with the given status."""
+    return IMPL.volume_get_sums_by_host(context, hosts, status)
+
+
 def volume_get_all_by_instance(context, instance_id):
     """Get all volumes belonging to a instance."""
     return IMPL.volume_get_all_by_instance(context, instance_id)
@@ -28,6 +28,7 @@ from nova import flags
 from nova import utils
 from nova.db.sqlalchemy import models
 from nova.db.sqlalchemy.session import get_session
+from sqlalchemy import and_
 from sqlalchemy import or_
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import joinedload
@@ -641,6 +642,40 @@ def fixed_ip_associate_pool(context, network_id, instance_id):
     return fixed_ip_ref['address']
 
 
+def _fixed_ip_free_criteria(network_id):
+    return (or_(models.FixedIp.network_id == network_id,
+                models.FixedIp.network_id == None),
+            models.FixedIp.reserved == False,
+            models.FixedIp.deleted == False,
+            models.FixedIp.instance_id == None)
+
+
+@require_admin_context
+def fixed_ip_get_free_by_network(context, network_id, before=None):
+    session = get_session()
+    query = session.query(models.FixedIp.id, models.FixedIp.address).\
+                    filter(and_(*_fixed_ip_free_criteria(network_id)))
+    if before is not None:
+        query = query.filter(models.FixedIp.id < before)
+    return [tuple(row) for row in query.order_by(models.FixedIp.id)]
+
+
+@require_admin_context
+def fixed_ip_associate_if_free(context, fixed_ip_id, network_id, instance_id):
+    session = get_session()
+    # NOTE: a single conditional update, the ip is only taken if
+    #       it still has no instance, no lock is held
+    with session.begin():
+        count = session.query(models.FixedIp).\
+                        filter(models.FixedIp.id == fixed_ip_id).\
+                        filter(and_(*_fixed_ip_free_criteria(network_id))).\
+                        update({'instance_id': instance_id,
+                                'network_id': network_id,
+                                'updated_at': utils.utcnow()},
+                               synchronize_session=False)
+    return count == 1
+
+
 @require_context
 def fixed_ip_create(_context, values):
     fixed_ip_ref = models.FixedIp()
@@ -865,29 +900,40 @@ def instance_get(context, instance_id, session=None):
     return result
 
 
+def _instance_page(query, marker, limit):
+    """Orders query by id and keeps the instances that come after the
+    marker id, at most limit of them."""
+    query = query.order_by(models.Instance.id)
+    if marker is not None:
+        query = query.filter(models.Instance.id > marker)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
 @require_admin_context
-def instance_get_all(context):
+def instance_get_all(context, marker=None, limit=None):
     session = get_session()
-    return session.query(models.Instance).\
-                   options(joinedload_all('fixed_ip.floating_ips')).\
-                   options(joinedload('security_groups')).\
-                   options(joinedload_all('fixed_ip.network')).\
-                   options(joinedload('instance_type')).\
-                   filter_by(deleted=can_read_deleted(context)).\
-                   all()
+    query = session.query(models.Instance).\
+                    options(joinedload_all('fixed_ip.floating_ips')).\
+                    options(joinedload('security_groups')).\
+                    options(joinedload_all('fixed_ip.network')).\
+                    options(joinedload('instance_type')).\
+                    filter_by(deleted=can_read_deleted(context))
+    return _instance_page(query, marker, limit).all()
 
 
 @require_admin_context
-def instance_get_all_by_user(context, user_id):
+def instance_get_all_by_user(context, user_id, marker=None, limit=None):
     session = get_session()
-    return session.query(models.Instance).\
-                   options(joinedload_all('fixed_ip.floating_ips')).\
-                   options(joinedload('security_groups')).\
-                   options(joinedload_all('fixed_ip.network')).\
-                   options(joinedload('instance_type')).\
-                   filter_by(deleted=can_read_deleted(context)).\
-                   filter_by(user_id=user_id).\
-                   all()
+    query = session.query(models.Instance).\
+                    options(joinedload_all('fixed_ip.floating_ips')).\
+                    options(joinedload('security_groups')).\
+                    options(joinedload_all('fixed_ip.network')).\
+                    options(joinedload('instance_type')).\
+                    filter_by(deleted=can_read_deleted(context)).\
+                    filter_by(user_id=user_id)
+    return _instance_page(query, marker, limit).all()
 
 
 @require_admin_context
@@ -904,18 +950,19 @@ def instance_get_all_by_host(context, host):
 
 
 @require_context
-def instance_get_all_by_project(context, project_id):
+def instance_get_all_by_project(context, project_id, marker=None,
+                                limit=None):
     authorize_project_context(context, project_id)
 
     session = get_session()
-    return session.query(models.Instance).\
-                   options(joinedload_all('fixed_ip.floating_ips')).\
-                   options(joinedload('security_groups')).\
-                   options(joinedload_all('fixed_ip.network')).\
-                   options(joinedload('instance_type')).\
-                   filter_by(project_id=project_id).\
-                   filter_by(deleted=can_read_deleted(context)).\
-                   all()
+    query = session.query(models.Instance).\
+                    options(joinedload_all('fixed_ip.floating_ips')).\
+                    options(joinedload('security_groups')).\
+                    options(joinedload_all('fixed_ip.network')).\
+                    options(joinedload('instance_type')).\
+                    filter_by(project_id=project_id).\
+                    filter_by(deleted=can_read_deleted(context))
+    return _instance_page(query, marker, limit).all()
 
 
 @require_context
@@ -943,6 +990,55 @@ def instance_get_all_by_reservation(context, reservation_id):
                        all()
 
 
+def _instance_get_all_columns(context, columns, marker, limit, *criteria):
+    """Returns only the given columns of the instances matching criteria,
+    as dicts, without loading any of their relationships.  A 'name'
+    column is derived from id like Instance.name is."""
+    selected = [column for column in columns if column != 'name']
+    if 'name' in columns and 'id' not in selected:
+        selected.append('id')
+    session = get_session()
+    query = session.query(*[getattr(models.Instance, column)
+                            for column in selected]).\
+                    filter(models.Instance.deleted ==
+                           can_read_deleted(context))
+    for criterion in criteria:
+        query = query.filter(criterion)
+    instances = []
+    for row in _instance_page(query, marker, limit):
+        instance = dict(zip(selected, row))
+        if 'name' in columns:
+            instance['name'] = FLAGS.instance_name_template % instance['id']
+        instances.append(instance)
+    return instances
+
+
+@require_admin_context
+def instance_get_all_columns(context, columns, marker=None, limit=None):
+    return _instance_get_all_columns(context, columns, marker, limit)
+
+
+@require_admin_context
+def instance_get_all_columns_by_user(context, user_id, columns, marker=None,
+                                     limit=None):
+    return _instance_get_all_columns(context, columns, marker, limit,
+                                     models.Instance.user_id == user_id)
+
+
+@require_admin_context
+def instance_get_all_columns_by_host(context, host, columns):
+    return _instance_get_all_columns(context, columns, None, None,
+                                     models.Instance.host == host)
+
+
+@require_context
+def instance_get_all_columns_by_project(context, project_id, columns,
+                                        marker=None, limit=None):
+    authorize_project_context(context, project_id)
+    return _instance_get_all_columns(context, columns, marker, limit,
+                                     models.Instance.project_id == project_id)
+
+
 @require_admin_context
 def instance_get_project_vpn(context, project_id):
     session = get_session()
@@ -1063,6 +1159,26 @@ def instance_get_disk_sum_by_host_and_project(context, hostname, proj_id):
     return result
 
 
+@require_admin_context
+def instance_get_sums_by_host(context, host=None):
+    session = get_session()
+    query = session.query(models.Instance.host,
+                          func.sum(models.Instance.vcpus),
+                          func.sum(models.Instance.memory_mb),
+                          func.sum(models.Instance.local_gb))
+    if host is None:
+        query = query.filter(models.Instance.host != None)
+    else:
+        query = query.filter_by(host=host)
+    rows = query.filter_by(deleted=False).\
+                 group_by(models.Instance.host).\
+                 all()
+    return dict((host, {'vcpus': vcpus or 0,
+                        'memory_mb': memory_mb or 0,
+                        'local_gb': local_gb or 0})
+                for host, vcpus, memory_mb, local_gb in rows)
+
+
 @require_context
 def instance_action_create(context, values):
     """Create an instance action from the values dictionary."""
@@ -1684,6 +1800,21 @@ def volume_get_all_by_host(context, host):
                    all()
 
 
+@require_admin_context
+def volume_get_sums_by_host(context, hosts, status=None):
+    if not hosts:
+        return {}
+    session = get_session()
+    query = session.query(models.Volume.host,
+                          func.sum(models.Volume.size)).\
+                    filter(models.Volume.host.in_(hosts)).\
+                    filter_by(deleted=False)
+    if status is not None:
+        query = query.filter_by(status=status)
+    rows = query.group_by(models.Volume.host).all()
+    return dict((host, size or 0) for host, size in rows)
+
+
 @require_admin_context
 def volume_get_all_by_instance(context, instance_id):
     session = get_session()
@@ -2238,6 +2369,48 @@ def migration_get_by_instance_and_status(context, instance_id, status):
 ##################
 
 
+@require_admin_context
+def compute_claim_create(context, values):
+    claim = models.ComputeClaim()
+    claim.update(values)
+    claim.save()
+    return claim
+
+
+@require_admin_context
+def compute_claim_finish(context, instance_id, status):
+    session = get_session()
+    with session.begin():
+        session.query(models.ComputeClaim).\
+                filter_by(instance_id=instance_id).\
+                filter_by(status='claimed').\
+                update({'status': status,
+                        'updated_at': datetime.datetime.utcnow()})
+
+
+@require_admin_context
+def compute_claim_get_all(context, since=None):
+    session = get_session()
+    query = session.query(models.ComputeClaim).\
+                    filter(models.ComputeClaim.status != 'released').\
+                    filter_by(deleted=False)
+    if since:
+        query = query.filter(models.ComputeClaim.created_at >= since)
+    return query.all()
+
+
+@require_admin_context
+def compute_claim_destroy_older_than(context, before):
+    session = get_session()
+    with session.begin():
+        session.query(models.ComputeClaim).\
+                filter(models.ComputeClaim.created_at < before).\
+                delete(synchronize_session=False)
+
+
+##################
+
+
 def console_pool_create(context, values):
     pool = models.ConsolePool()
     pool.update(values)
@@ -0,0 +1,105 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import *
+from migrate import *
+
+from nova import log as logging
+
+
+meta = MetaData()
+
+# Just for the indexes to be created, these are not the actual
+# definitions of the tables.
+instances = Table('instances', meta,
+        Column('id', Integer(), primary_key=True, nullable=False),
+        Column('deleted', Boolean(create_constraint=True, name=None)),
+        Column('host', String(255)),
+        Column('project_id', String(255)),
+        Column('reservation_id', String(255)),
+        )
+
+fixed_ips = Table('fixed_ips', meta,
+        Column('id', Integer(), primary_key=True, nullable=False),
+        Column('deleted', Boolean(create_constraint=True, name=None)),
+        Column('address', String(255)),
+        Column('network_id', Integer()),
+        Column('instance_id', Integer()),
+        Column('reserved', Boolean(create_constraint=True, name=None)),
+        )
+
+services = Table('services', meta,
+        Column('id', Integer(), primary_key=True, nullable=False),
+        Column('deleted', Boolean(create_constraint=True, name=None)),
+        Column('host', String(255)),
+        Column('binary', String(255)),
+        )
+
+security_groups = Table('security_groups', meta,
+        Column('id', Integer(), primary_key=True, nullable=False),
+        Column('deleted', Boolean(create_constraint=True, name=None)),
+        Column('project_id', String(255)),
+        Column('name', String(255)),
+        )
+
+#
+# New Indexes
+#
+
+# NOTE: the leading columns are the ones the lookups in
+#       nova.db.sqlalchemy.api compare for equality, deleted
+#       comes after them.  fixed_ip_associate_pool takes an ip of
+#       the network or of no network, so network_id goes last.
+#       auth_tokens is looked up by token_hash, its primary key.
+indexes = [
+    Index('instances_host_deleted_idx',
+          instances.c.host, instances.c.deleted),
+    Index('instances_project_id_deleted_idx',
+          instances.c.project_id, instances.c.deleted),
+    Index('instances_reservation_id_deleted_idx',
+          instances.c.reservation_id, instances.c.deleted),
+    Index('fixed_ips_address_deleted_idx',
+          fixed_ips.c.address, fixed_ips.c.deleted),
+    Index('fixed_ips_instance_id_reserved_deleted_network_id_idx',
+          fixed_ips.c.instance_id, fixed_ips.c.reserved,
+          fixed_ips.c.deleted, fixed_ips.c.network_id),
+    Index('services_host_binary_deleted_idx',
+          services.c.host, services.c.binary, services.c.deleted),
+    Index('security_groups_project_id_name_deleted_idx',
+          security_groups.c.project_id, security_groups.c.name,
+          security_groups.c.deleted),
+    ]
+
+
+def upgrade(migrate_engine):
+    # Upgrade operations go here. Don't create your own engine;
+    # bind migrate_engine to your metadata
+    meta.bind = migrate_engine
+    for index in indexes:
+        try:
+            index.create(migrate_engine)
+        except Exception:
+            logging.info(repr(index))
+            logging.exception('Exception while creating index')
+            raise
+
+
+def downgrade(migrate_engine):
+    # Operations to reverse the above upgrade go here.
+    meta.bind = migrate_engine
+    for index in indexes:
+        index.drop(migrate_engine)
@@ -449,6 +449,20 @@ class Migration(BASE, NovaBase):
     status = Column(String(255))
 
 
+class ComputeClaim(BASE, NovaBase):
+    """Resources a scheduler set aside on a host for an instance until the
+    host has built it."""
+    __tablename__ = 'compute_claims'
+    id = Column(Integer, primary_key=True, nullable=False)
+    host = Column(String(255))
+    instance_id = Column(Integer, ForeignKey('instances.id'), nullable=False)
+    vcpus = Column(Integer)
+    memory_mb = Column(Integer)
+    local_gb = Column(Integer)
+    # NOTE: claimed, confirmed or released
+    status = Column(String(255))
+
+
 class Network(BASE, NovaBase):
     """Represents a network."""
     __tablename__ = 'networks'
@@ -656,7 +670,7 @@ def register_models():
               Network, SecurityGroup, SecurityGroupIngressRule,
               SecurityGroupInstanceAssociation, AuthToken, User,
               Project, Certificate, ConsolePool, Console, Zone,
-              InstanceMetadata, Migration)
+              InstanceMetadata, Migration, ComputeClaim)
     engine = create_engine(FLAGS.sql_connection, echo=False)
     for model in models:
         model.metadata.create_all(engine)
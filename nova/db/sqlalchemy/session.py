@@ -20,6 +20,8 @@ Session Handling for SQLAlchemy backend
 """
 
 from sqlalchemy import create_engine
+from sqlalchemy import exc
+from sqlalchemy import interfaces
 from sqlalchemy import pool
 from sqlalchemy.orm import sessionmaker
 
@@ -32,20 +34,69 @@ _ENGINE = None
 _MAKER = None
 
 
+class SqlitePragmas(interfaces.PoolListener):
+    """Sets the journal mode and synchronous pragmas of new connections."""
+
+    def connect(self, dbapi_con, con_record):
+        if FLAGS.sqlite_journal_mode:
+            dbapi_con.execute('PRAGMA journal_mode = %s' %
+                              FLAGS.sqlite_journal_mode)
+        journal_mode = dbapi_con.execute('PRAGMA journal_mode').fetchone()[0]
+        # NOTE: outside of WAL a relaxed synchronous can corrupt the
+        #       database on power loss, not just lose the last commits
+        if FLAGS.sqlite_synchronous and journal_mode.lower() == 'wal':
+            dbapi_con.execute('PRAGMA synchronous = %s' %
+                              FLAGS.sqlite_synchronous)
+
+
+class ConnectionCheck(interfaces.PoolListener):
+    """Makes the pool replace connections the database has dropped."""
+
+    def checkout(self, dbapi_con, con_record, con_proxy):
+        try:
+            dbapi_con.cursor().execute('SELECT 1')
+        except Exception, e:
+            # NOTE: the pool retries the checkout with a new
+            #       connection when it gets a DisconnectionError
+            raise exc.DisconnectionError(str(e))
+
+
+def get_engine_args(sql_connection):
+    """Returns the create_engine arguments for sql_connection."""
+    kwargs = {'pool_recycle': FLAGS.sql_idle_timeout,
+              'echo': False,
+              'listeners': []}
+
+    if sql_connection.startswith('sqlite'):
+        if FLAGS.sqlite_shared_connection:
+            # NOTE: a pool per thread would be a pool per greenthread once
+            #       eventlet is monkey patched, so a single connection is
+            #       shared by all of them and checked out by one at a time
+            kwargs['poolclass'] = pool.QueuePool
+            kwargs['pool_size'] = 1
+            kwargs['max_overflow'] = 0
+            kwargs['pool_timeout'] = FLAGS.sql_pool_timeout
+            kwargs['connect_args'] = {'check_same_thread': False}
+        else:
+            kwargs['poolclass'] = pool.NullPool
+        kwargs['listeners'].append(SqlitePragmas())
+    else:
+        kwargs['pool_size'] = FLAGS.sql_pool_size
+        kwargs['max_overflow'] = FLAGS.sql_max_overflow
+        kwargs['pool_timeout'] = FLAGS.sql_pool_timeout
+        if FLAGS.sql_connection_check:
+            kwargs['listeners'].append(ConnectionCheck())
+    return kwargs
+
+
 def get_session(autocommit=True, expire_on_commit=False):
     """Helper method to grab session"""
     global _ENGINE
     global _MAKER
     if not _MAKER:
         if not _ENGINE:
-            kwargs = {'pool_recycle': FLAGS.sql_idle_timeout,
-                      'echo': False}
-
-            if FLAGS.sql_connection.startswith('sqlite'):
-                kwargs['poolclass'] = pool.NullPool
-
             _ENGINE = create_engine(FLAGS.sql_connection,
-                                    **kwargs)
+                                    **get_engine_args(FLAGS.sql_connection))
         _MAKER = (sessionmaker(bind=_ENGINE,
                                 autocommit=autocommit,
                                 expire_on_commit=expire_on_commit))
@@ -16,12 +16,28 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-"""Based a bit on the carrot.backeds.queue backend... but a lot better."""
+"""An in-process broker for running nova without RabbitMQ.
 
-import Queue as queue
+Based a bit on the carrot.backends.queue backend... but a lot better.
+
+Exchanges route like their AMQP namesakes: direct exchanges match the
+routing key exactly, topic exchanges understand the ``*`` and ``#``
+wildcards and fanout exchanges copy every message to each bound queue.
+Queues hand out messages in O(1) and consumers block on an event until
+something arrives instead of polling.  Messages delivered without no_ack
+stay unacknowledged until they are acked, rejected or requeued; the ones
+still outstanding when a backend closes go back on their queue.  Queues
+declared auto_delete go away with their last consumer, as do auto_delete
+exchanges once nothing is bound to them.
+
+"""
+
+import collections
+import itertools
+import re
 
 from carrot.backends import base
-from eventlet import greenthread
+from eventlet import event
 
 from nova import log as logging
 
@@ -33,103 +49,333 @@ EXCHANGES = {}
 QUEUES = {}
 
 
+_delivery_tags = itertools.count(1)
+
+
 class Message(base.BaseMessage):
     pass
 
 
+def _topic_regex(binding_key):
+    """Turns an AMQP topic binding key into a compiled regex.
+
+    The regex is matched against the routing key with a dot in front of it
+    so that every word, including the first, is introduced by a dot and
+    '#' can swallow any number of them, none included.
+
+    """
+    parts = []
+    for word in binding_key.split('.'):
+        if word == '#':
+            parts.append(r'(?:\.[^.]+)*')
+        elif word == '*':
+            parts.append(r'\.[^.]+')
+        else:
+            parts.append(r'\.' + re.escape(word))
+    return re.compile('^%s$' % ''.join(parts))
+
+
+def _topic_key(routing_key):
+    if not routing_key:
+        return ''
+    return '.' + routing_key
+
+
 class Exchange(object):
-    def __init__(self, name, exchange_type):
+    def __init__(self, name, exchange_type, auto_delete=False):
         self.name = name
         self.exchange_type = exchange_type
-        self._queue = queue.Queue()
+        self.auto_delete = auto_delete
         self._routes = {}
+        self._patterns = {}
+        self._route_cache = {}
 
     def publish(self, message, routing_key=None):
-        nm = self.name
-        LOG.debug(_('(%(nm)s) publish (key: %(routing_key)s)'
-                ' %(message)s') % locals())
-        if routing_key in self._routes:
-            for f in self._routes[routing_key]:
-                LOG.debug(_('Publishing to route %s'), f)
-                f(message, routing_key=routing_key)
-
-    def bind(self, callback, routing_key):
-        self._routes.setdefault(routing_key, [])
-        self._routes[routing_key].append(callback)
+        for queue in self.route(routing_key):
+            queue.push(message, routing_key=routing_key)
+
+    def route(self, routing_key):
+        """Returns the queues a message with routing_key goes to."""
+        if self.exchange_type == 'fanout':
+            return self._fanout_queues()
+        if self.exchange_type != 'topic':
+            return self._routes.get(routing_key, ())
+        try:
+            return self._route_cache[routing_key]
+        except KeyError:
+            pass
+        queues = list(self._routes.get(routing_key, ()))
+        key = _topic_key(routing_key)
+        for regex, bound in self._patterns.itervalues():
+            if regex.match(key):
+                self._add_unique(queues, bound)
+        self._route_cache[routing_key] = queues
+        return queues
+
+    def _fanout_queues(self):
+        try:
+            return self._route_cache[None]
+        except KeyError:
+            queues = []
+            for bound in self._routes.itervalues():
+                self._add_unique(queues, bound)
+            for _regex, bound in self._patterns.itervalues():
+                self._add_unique(queues, bound)
+            self._route_cache[None] = queues
+            return queues
+
+    @staticmethod
+    def _add_unique(queues, bound):
+        for queue in bound:
+            if queue not in queues:
+                queues.append(queue)
+
+    def bind(self, queue, routing_key):
+        if (self.exchange_type == 'topic' and routing_key and
+            ('*' in routing_key or '#' in routing_key)):
+            regex, bound = self._patterns.setdefault(
+                    routing_key, (_topic_regex(routing_key), []))
+        else:
+            bound = self._routes.setdefault(routing_key, [])
+        if queue not in bound:
+            bound.append(queue)
+            queue.bindings.append((self, routing_key))
+        self._route_cache.clear()
+
+    def unbind(self, queue, routing_key):
+        if routing_key in self._patterns:
+            bound = self._patterns[routing_key][1]
+            if queue in bound:
+                bound.remove(queue)
+            if not bound:
+                del self._patterns[routing_key]
+        elif routing_key in self._routes:
+            bound = self._routes[routing_key]
+            if queue in bound:
+                bound.remove(queue)
+            if not bound:
+                del self._routes[routing_key]
+        self._route_cache.clear()
+        if self.auto_delete and not self._routes and not self._patterns:
+            LOG.debug(_('Deleting unused exchange %s'), self.name)
+            if EXCHANGES.get(self.name) is self:
+                del EXCHANGES[self.name]
 
 
 class Queue(object):
-    def __init__(self, name):
+    def __init__(self, name, auto_delete=False):
         self.name = name
-        self._queue = queue.Queue()
+        self.auto_delete = auto_delete
+        self.bindings = []
+        self.consumers = 0
+        self._queue = collections.deque()
+        self._listeners = []
 
     def __repr__(self):
         return '<Queue: %s>' % self.name
 
-    def push(self, message, routing_key=None):
-        self._queue.put(message)
+    def push(self, message, routing_key=None, redelivered=False):
+        self._queue.append((message, routing_key, redelivered))
+        self._notify()
+
+    def requeue(self, message, routing_key=None):
+        """Puts an unacknowledged message back at the head of the queue."""
+        self._queue.appendleft((message, routing_key, True))
+        self._notify()
 
     def size(self):
-        return self._queue.qsize()
+        return len(self._queue)
 
     def pop(self):
-        return self._queue.get()
+        """Returns (message, routing_key, redelivered) or None if empty."""
+        if not self._queue:
+            return None
+        return self._queue.popleft()
+
+    def purge(self):
+        count = len(self._queue)
+        self._queue.clear()
+        return count
+
+    def listen(self, backend):
+        self._listeners.append(backend)
+
+    def unlisten(self, backend):
+        if backend in self._listeners:
+            self._listeners.remove(backend)
+
+    def _notify(self):
+        for backend in self._listeners:
+            backend.wake()
+
+    def delete(self):
+        for exchange, routing_key in self.bindings:
+            exchange.unbind(self, routing_key)
+        self.bindings = []
+        if QUEUES.get(self.name) is self:
+            del QUEUES[self.name]
 
 
 class Backend(base.BaseBackend):
-    def queue_declare(self, queue, **kwargs):
-        global QUEUES
+    def __init__(self, connection, **kwargs):
+        super(Backend, self).__init__(connection, **kwargs)
+        self.consumers = {}
+        self.unacked = {}
+        self.prefetch_count = 0
+        self._waiter = None
+        self._cycle = 0
+
+    def queue_declare(self, queue, auto_delete=False, **kwargs):
         if queue not in QUEUES:
             LOG.debug(_('Declaring queue %s'), queue)
-            QUEUES[queue] = Queue(queue)
+            QUEUES[queue] = Queue(queue, auto_delete=auto_delete)
+        return (queue, QUEUES[queue].size(), QUEUES[queue].consumers)
+
+    def queue_delete(self, queue, **kwargs):
+        if queue in QUEUES:
+            QUEUES[queue].delete()
+
+    def queue_purge(self, queue, **kwargs):
+        if queue not in QUEUES:
+            return 0
+        return QUEUES[queue].purge()
 
-    def exchange_declare(self, exchange, type, *args, **kwargs):
-        global EXCHANGES
+    def exchange_declare(self, exchange, type, auto_delete=False,
+                         *args, **kwargs):
         if exchange not in EXCHANGES:
             LOG.debug(_('Declaring exchange %s'), exchange)
-            EXCHANGES[exchange] = Exchange(exchange, type)
+            EXCHANGES[exchange] = Exchange(exchange, type,
+                                           auto_delete=auto_delete)
 
     def queue_bind(self, queue, exchange, routing_key, **kwargs):
-        global EXCHANGES
-        global QUEUES
         LOG.debug(_('Binding %(queue)s to %(exchange)s with'
                 ' key %(routing_key)s') % locals())
-        EXCHANGES[exchange].bind(QUEUES[queue].push, routing_key)
-
-    def declare_consumer(self, queue, callback, *args, **kwargs):
-        self.current_queue = queue
-        self.current_callback = callback
+        EXCHANGES[exchange].bind(QUEUES[queue], routing_key)
+
+    def declare_consumer(self, queue, callback, consumer_tag=None,
+                         no_ack=False, *args, **kwargs):
+        if consumer_tag is None:
+            consumer_tag = queue
+        if consumer_tag in self.consumers:
+            return
+        if queue not in QUEUES:
+            self.queue_declare(queue)
+        QUEUES[queue].consumers += 1
+        QUEUES[queue].listen(self)
+        self.consumers[consumer_tag] = (QUEUES[queue], callback, no_ack)
+
+    def cancel(self, consumer_tag):
+        queue, _callback, _no_ack = self.consumers.pop(consumer_tag)
+        queue.unlisten(self)
+        queue.consumers -= 1
+        if queue.auto_delete and not queue.consumers:
+            LOG.debug(_('Deleting unused queue %s'), queue.name)
+            queue.delete()
+
+    def wake(self):
+        """Wakes up consume() if it is blocked waiting for messages."""
+        if self._waiter is not None and not self._waiter.ready():
+            self._waiter.send()
 
     def consume(self, limit=None):
-        while True:
-            item = self.get(self.current_queue)
-            if item:
-                self.current_callback(item)
-                raise StopIteration()
-            greenthread.sleep(0)
+        """Returns an iterator that delivers one message at a time.
+
+        Blocks until one of the declared consumers has a message and the
+        prefetch window (see qos) allows it to be delivered.
+
+        """
+        for total_message_count in itertools.count():
+            if limit and total_message_count >= limit:
+                raise StopIteration
+            while not self._deliver_one():
+                if not self.consumers:
+                    raise StopIteration
+                self._waiter = event.Event()
+                try:
+                    self._waiter.wait()
+                finally:
+                    self._waiter = None
+            yield True
+
+    def _deliver_one(self):
+        if self.prefetch_count and len(self.unacked) >= self.prefetch_count:
+            return False
+        consumers = self.consumers.values()
+        count = len(consumers)
+        for i in xrange(count):
+            queue, callback, no_ack = consumers[(self._cycle + i) % count]
+            item = queue.pop()
+            if item is not None:
+                self._cycle = (self._cycle + i + 1) % count
+                callback(self._to_message(queue, item, no_ack))
+                return True
+        return False
 
     def get(self, queue, no_ack=False):
-        global QUEUES
-        if not queue in QUEUES or not QUEUES[queue].size():
+        if queue not in QUEUES:
             return None
-        (message_data, content_type, content_encoding) = QUEUES[queue].pop()
-        message = Message(backend=self, body=message_data,
-                          content_type=content_type,
-                          content_encoding=content_encoding)
+        item = QUEUES[queue].pop()
+        if item is None:
+            return None
+        message = self._to_message(QUEUES[queue], item, no_ack)
         message.result = True
-        LOG.debug(_('Getting from %(queue)s: %(message)s') % locals())
         return message
 
+    def _to_message(self, queue, item, no_ack):
+        (message_data, content_type, content_encoding), routing_key, \
+                redelivered = item
+        tag = _delivery_tags.next()
+        if not no_ack:
+            self.unacked[tag] = (queue, item[0], routing_key)
+        return Message(backend=self, body=message_data,
+                       content_type=content_type,
+                       content_encoding=content_encoding,
+                       delivery_tag=tag,
+                       delivery_info={'routing_key': routing_key,
+                                      'queue': queue.name,
+                                      'redelivered': redelivered})
+
+    def ack(self, delivery_tag):
+        self._settle(delivery_tag)
+
+    def reject(self, delivery_tag):
+        self._settle(delivery_tag)
+
+    def requeue(self, delivery_tag):
+        settled = self._settle(delivery_tag)
+        if settled:
+            queue, message, routing_key = settled
+            queue.requeue(message, routing_key=routing_key)
+
+    def _settle(self, delivery_tag):
+        settled = self.unacked.pop(delivery_tag, None)
+        if settled and self.prefetch_count:
+            self.wake()
+        return settled
+
+    def qos(self, prefetch_size, prefetch_count, apply_global=False):
+        self.prefetch_count = prefetch_count
+
     def prepare_message(self, message_data, delivery_mode,
                         content_type, content_encoding, **kwargs):
         """Prepare message for sending."""
         return (message_data, content_type, content_encoding)
 
     def publish(self, message, exchange, routing_key, **kwargs):
-        global EXCHANGES
         if exchange in EXCHANGES:
             EXCHANGES[exchange].publish(message, routing_key=routing_key)
 
+    def close(self):
+        """Cancels every consumer and requeues unacknowledged messages."""
+        for consumer_tag in self.consumers.keys():
+            self.cancel(consumer_tag)
+        unacked = sorted(self.unacked.items(), reverse=True)
+        self.unacked = {}
+        for _tag, (queue, message, routing_key) in unacked:
+            if QUEUES.get(queue.name) is queue:
+                queue.requeue(message, routing_key=routing_key)
+        self.wake()
+
 
 def reset_all():
     global EXCHANGES
@@ -345,6 +345,22 @@ DEFINE_string('sql_connection',
 DEFINE_integer('sql_idle_timeout',
               3600,
               'timeout for idle sql database connections')
+DEFINE_integer('sql_pool_size', 5,
+               'connections kept open to the sql database')
+DEFINE_integer('sql_max_overflow', 10,
+               'connections opened above sql_pool_size when all are busy')
+DEFINE_integer('sql_pool_timeout', 30,
+               'seconds to wait for a pooled sql connection')
+DEFINE_bool('sql_connection_check', True,
+            'check that a pooled sql connection is alive before using it')
+DEFINE_bool('sqlite_shared_connection', True,
+            'keep one sqlite connection open and hand it to one session '
+            'at a time instead of opening the database for every session')
+DEFINE_string('sqlite_journal_mode', 'WAL',
+              'sqlite journal_mode pragma, empty keeps the database\'s')
+DEFINE_string('sqlite_synchronous', 'NORMAL',
+              'sqlite synchronous pragma, only set in WAL journal mode, '
+              'empty keeps the default')
 DEFINE_integer('sql_max_retries', 12, 'sql connection attempts')
 DEFINE_integer('sql_retry_interval', 10, 'sql connection retry interval')
 
@@ -49,7 +49,8 @@ class API(base.Base):
         return rpc.call(context,
                         FLAGS.network_topic,
                         {"method": "allocate_floating_ip",
-                         "args": {"project_id": context.project_id}})
+                         "args": {"project_id": context.project_id}},
+                        timeout=FLAGS.rpc_api_call_timeout)
 
     def release_floating_ip(self, context, address,
                             affect_auto_assigned=False):
@@ -0,0 +1,91 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2011 Openstack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Hands out fixed ips from per network lists of free addresses.
+"""
+
+import heapq
+
+from nova import db
+from nova import flags
+from nova import log as logging
+from nova import utils
+
+LOG = logging.getLogger('nova.network.ip_pool')
+FLAGS = flags.FLAGS
+flags.DEFINE_integer('fixed_ip_pool_reconcile_interval', 60,
+                     'Seconds between reloading the free fixed ips of a '
+                     'network from the database')
+
+
+class FixedIpPool(object):
+    """Keeps the fixed ips of each network that have no instance.
+
+    The free ips of a network are read from the database once and kept
+    in a heap, lowest id first, which is the order they have always been
+    handed out in.  An ip is taken off the heap and given to the instance
+    with a conditional update that only succeeds if the ip still has no
+    instance, so no row is locked and other network hosts can allocate
+    from the same network at the same time.  If another one took the ip
+    first, the next one is tried.
+
+    Before each allocation the ips freed below the lowest known one are
+    read back, so released ips are reused first like before.  The heap is
+    reloaded when it runs out and every fixed_ip_pool_reconcile_interval
+    seconds to pick up the other ips freed since.
+
+    """
+
+    def __init__(self, db_driver=db):
+        self.db = db_driver
+        self.free = {}
+        self.loaded_at = {}
+
+    def allocate(self, context, network_id, instance_id):
+        """Associates a free fixed ip of network_id with instance_id and
+        returns its address.  Raises NoMoreAddresses if there is none."""
+        free = self._get_free(context, network_id)
+        while True:
+            if not free:
+                free = self.reload(context, network_id)
+                if not free:
+                    raise db.NoMoreAddresses()
+            fixed_ip_id, address = heapq.heappop(free)
+            if self.db.fixed_ip_associate_if_free(context, fixed_ip_id,
+                                                  network_id, instance_id):
+                return address
+            LOG.debug(_("Fixed ip %s was taken by someone else"), address)
+
+    def reload(self, context, network_id):
+        """Rereads the free fixed ips of network_id."""
+        # NOTE: the ips come ordered by id, which makes them a heap
+        free = self.db.fixed_ip_get_free_by_network(context, network_id)
+        self.free[network_id] = free
+        self.loaded_at[network_id] = utils.utcnow()
+        return free
+
+    def _get_free(self, context, network_id):
+        free = self.free.get(network_id)
+        if (not free or
+            utils.is_older_than(self.loaded_at[network_id],
+                                FLAGS.fixed_ip_pool_reconcile_interval)):
+            return self.reload(context, network_id)
+        for fixed_ip in self.db.fixed_ip_get_free_by_network(
+                context, network_id, before=free[0][0]):
+            heapq.heappush(free, fixed_ip)
+        return free
@@ -58,6 +58,7 @@ from nova import log as logging
 from nova import manager
 from nova import utils
 from nova import rpc
+from nova.network import ip_pool
 
 
 LOG = logging.getLogger("nova.network.manager")
@@ -120,6 +121,7 @@ class NetworkManager(manager.SchedulerDependentManager):
         self.driver = utils.import_object(network_driver)
         super(NetworkManager, self).__init__(service_name='network',
                                                 *args, **kwargs)
+        self.fixed_ip_pool = ip_pool.FixedIpPool(self.db)
 
     def init_host(self):
         """Do any initialization that needs to be run if this is a
@@ -173,9 +175,9 @@ class NetworkManager(manager.SchedulerDependentManager):
         #             network_get_by_compute_host
         network_ref = self.db.network_get_by_bridge(context.elevated(),
                                                     FLAGS.flat_network_bridge)
-        address = self.db.fixed_ip_associate_pool(context.elevated(),
-                                                  network_ref['id'],
-                                                  instance_id)
+        address = self.fixed_ip_pool.allocate(context.elevated(),
+                                              network_ref['id'],
+                                              instance_id)
         self.db.fixed_ip_update(context, address, {'allocated': True})
         return address
 
@@ -513,9 +515,9 @@ class VlanManager(NetworkManager):
                                        address,
                                        instance_id)
         else:
-            address = self.db.fixed_ip_associate_pool(ctxt,
-                                                      network_ref['id'],
-                                                      instance_id)
+            address = self.fixed_ip_pool.allocate(ctxt,
+                                                  network_ref['id'],
+                                                  instance_id)
         self.db.fixed_ip_update(context, address, {'allocated': True})
         if not FLAGS.fake_network:
             self.driver.update_dhcp(context, network_ref['id'])
@@ -28,18 +28,28 @@ import json
 import sys
 import time
 import traceback
+import types
 import uuid
 
 from carrot import connection as carrot_connection
 from carrot import messaging
+from carrot import serialization
+from eventlet import event
 from eventlet import greenpool
 from eventlet import greenthread
+from eventlet import timeout as eventlet_timeout
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 from nova import context
 from nova import exception
 from nova import fakerabbit
 from nova import flags
 from nova import log as logging
+from nova import rpc_stats
 from nova import utils
 
 
@@ -48,6 +58,91 @@ LOG = logging.getLogger('nova.rpc')
 
 FLAGS = flags.FLAGS
 flags.DEFINE_integer('rpc_thread_pool_size', 1024, 'Size of RPC thread pool')
+flags.DEFINE_list('rpc_topic_pool_sizes', [],
+                  'Worker pool sizes per topic as topic=size, topics without '
+                  'an entry use rpc_thread_pool_size')
+flags.DEFINE_string('rpc_serializer', 'json',
+                    'Wire format for rpc messages, json or msgpack. Receivers '
+                    'decode by content type, so msgpack only needs the '
+                    'msgpack library on every node; without it json is used')
+flags.DEFINE_bool('rpc_local_dispatch', False,
+                  'Run calls and casts to topics served by this process '
+                  'directly instead of through the broker')
+flags.DEFINE_bool('rpc_use_reply_queue', False,
+                  'Route rpc.call replies through one long-lived queue per '
+                  'process instead of declaring a queue for every call')
+flags.DEFINE_integer('rpc_publisher_pool_size', 30,
+                     'Maximum number of idle publishers kept open for reuse')
+flags.DEFINE_integer('rpc_call_timeout', 0,
+                     'Seconds rpc.call waits for a reply, 0 waits forever')
+flags.DEFINE_integer('rpc_api_call_timeout', 60,
+                     'Seconds calls made while serving an API request wait '
+                     'for a reply, 0 waits forever')
+flags.DEFINE_integer('rpc_multicall_timeout', 30,
+                     'Seconds rpc.multicall waits for all replies')
+flags.DEFINE_integer('rpc_clock_skew', 60,
+                     'Seconds the clocks of two hosts may be apart; a '
+                     'message is only dropped this long after its caller '
+                     'stopped waiting')
+flags.DEFINE_integer('rpc_stream_chunk_size', 100,
+                     'Items sent per reply message by rpc.stream_call')
+flags.DEFINE_integer('rpc_stream_window', 4,
+                     'Chunks a stream_call reply may have waiting in the '
+                     'broker before the sender pauses')
+flags.DEFINE_float('rpc_stream_poll_interval', 0.05,
+                   'Seconds a paused stream_call sender waits between '
+                   'checks of its caller\'s queue')
+
+
+def _register_msgpack():
+    """Registers a msgpack codec that copes with nova's message values.
+
+    carrot's own msgpack support hands values straight to msgpack, which
+    chokes on datetimes and unpacks lists as tuples.
+
+    """
+    def dumps(data):
+        return msgpack.packb(utils.to_primitive(data))
+
+    loads = msgpack.unpackb
+    try:
+        msgpack.unpackb(msgpack.packb([]), use_list=True)
+        loads = lambda data: msgpack.unpackb(data, use_list=True)
+    except TypeError:
+        pass
+    serialization.registry.register('msgpack', dumps, loads,
+                                    content_type='application/x-msgpack',
+                                    content_encoding='binary')
+
+
+if msgpack:
+    _register_msgpack()
+
+
+def _serializer():
+    """Returns the serializer publishers should use for new messages."""
+    if FLAGS.rpc_serializer == 'msgpack' and not msgpack:
+        LOG.warn(_('msgpack is not installed, sending rpc messages as json'))
+        return 'json'
+    return FLAGS.rpc_serializer
+
+
+_WORKER_POOLS = {}
+
+
+def _worker_pool(topic):
+    """Returns the worker pool shared by every consumer of a topic.
+
+    The topic.host and fanout consumers of a service share the pool of the
+    base topic, so a host never runs more handlers for it than configured.
+
+    """
+    base = topic.split('.')[0]
+    if base not in _WORKER_POOLS:
+        sizes = dict(item.split('=') for item in FLAGS.rpc_topic_pool_sizes)
+        size = int(sizes.get(base, FLAGS.rpc_thread_pool_size))
+        _WORKER_POOLS[base] = greenpool.GreenPool(size)
+    return _WORKER_POOLS[base]
 
 
 class Connection(carrot_connection.BrokerConnection):
@@ -143,6 +238,17 @@ class Consumer(messaging.Consumer):
                 LOG.exception(_('Failed to fetch message from queue: %s' % e))
                 self.failed_connection = True
 
+    def queue_depth(self):
+        """Returns the number of messages waiting in the broker queue."""
+        declared = self.backend.queue_declare(queue=self.queue,
+                                              durable=self.durable,
+                                              exclusive=self.exclusive,
+                                              auto_delete=self.auto_delete)
+        try:
+            return declared[1]
+        except TypeError:
+            return None
+
     def attach_to_eventlet(self):
         """Only needed for unit tests!"""
         timer = utils.LoopingCall(self.fetch, enable_callbacks=True)
@@ -156,13 +262,35 @@ class AdapterConsumer(Consumer):
     def __init__(self, connection=None, topic='broadcast', proxy=None):
         LOG.debug(_('Initing the Adapter Consumer for %s') % topic)
         self.proxy = proxy
-        self.pool = greenpool.GreenPool(FLAGS.rpc_thread_pool_size)
+        self.topic = topic
+        self.pool = _worker_pool(topic)
         super(AdapterConsumer, self).__init__(connection=connection,
                                               topic=topic)
 
+    def fetch(self, no_ack=None, auto_ack=None, enable_callbacks=False):
+        """Leaves messages queued for other hosts while workers are busy.
+
+        Messages are polled one at a time with basic.get, which a basic.qos
+        prefetch doesn't apply to, so this is what keeps a host from taking
+        more work than it has workers for.
+
+        """
+        if enable_callbacks and not self.pool.free():
+            LOG.debug(_('All %(size)d workers for %(topic)s are busy'),
+                      {'size': self.pool.size, 'topic': self.topic})
+            return
+        super(AdapterConsumer, self).fetch(no_ack, auto_ack, enable_callbacks)
+
     def receive(self, *args, **kwargs):
         self.pool.spawn_n(self._receive, *args, **kwargs)
 
+    def stats(self):
+        """Returns worker pool usage and the depth of the broker queue."""
+        return {'topic': self.topic,
+                'workers': self.pool.size,
+                'running': self.pool.running(),
+                'queued': self.queue_depth()}
+
     @exception.wrap_exception
     def _receive(self, message_data, message):
         """Magically looks for a method on the proxy object and calls it.
@@ -175,39 +303,90 @@ class AdapterConsumer(Consumer):
 
         """
         LOG.debug(_('received %s') % message_data)
+        received = time.time()
         msg_id = message_data.pop('_msg_id', None)
+        reply_to = message_data.pop('_reply_to', None)
+        deadline = message_data.pop('_deadline', None)
+        sent = message_data.pop('_sent', None)
+        window = message_data.pop('_stream', None)
 
         ctxt = _unpack_context(message_data)
 
         method = message_data.get('method')
         args = message_data.get('args', {})
         message.ack()
+        # NOTE: the deadline was set by the caller's clock
+        if deadline and time.time() > deadline + FLAGS.rpc_clock_skew:
+            LOG.warn(_('Dropping %s message, its caller stopped waiting'),
+                     method)
+            return
         if not method:
             # NOTE(vish): we may not want to ack here, but that means that bad
             #             messages stay in the queue indefinitely, so for now
             #             we just log the message and send an error string
             #             back to the caller
             LOG.warn(_('no method for message: %s') % message_data)
-            msg_reply(msg_id, _('No method for message: %s') % message_data)
+            msg_reply(msg_id, _('No method for message: %s') % message_data,
+                      reply_to=reply_to)
             return
 
-        node_func = getattr(self.proxy, str(method))
-        node_args = dict((str(k), v) for k, v in args.iteritems())
-        # NOTE(vish): magic is fun!
+        timings = {}
+        if sent:
+            timings['queue'] = received - sent
+        failed = False
         try:
-            rval = node_func(context=ctxt, **node_args)
-            if msg_id:
-                msg_reply(msg_id, rval, None)
+            rval = _invoke(self.proxy, ctxt, method, args)
+            if msg_id and window:
+                replying = time.time()
+                timings['handler'] = replying - received
+                _stream_reply(msg_id, rval, window)
+                timings['reply'] = time.time() - replying
+            else:
+                # NOTE: a generator only runs the method as it is
+                #       iterated, casts included
+                rval = _materialize(rval)
+                timings['handler'] = time.time() - received
+                if msg_id:
+                    replying = time.time()
+                    msg_reply(msg_id, rval, None, reply_to=reply_to)
+                    timings['reply'] = time.time() - replying
         except Exception as e:
+            failed = True
             logging.exception('Exception during message handling')
             if msg_id:
-                msg_reply(msg_id, None, sys.exc_info())
+                msg_reply(msg_id, None, sys.exc_info(), reply_to=reply_to)
+        body = getattr(message, 'body', None)
+        rpc_stats.record('receive', self.topic, method, error=failed,
+                         size=body and len(body), **timings)
         return
 
 
+def _invoke(proxy, ctxt, method, args):
+    """Calls method on proxy with the message args as keyword arguments."""
+    node_func = getattr(proxy, str(method))
+    node_args = dict((str(k), v) for k, v in args.iteritems())
+    # NOTE(vish): magic is fun!
+    return node_func(context=ctxt, **node_args)
+
+
+def _materialize(result):
+    """Collects a generator result for callers that want it in one piece.
+
+    Methods may yield their results so that stream_call callers get them
+    chunk by chunk; call and cast still see a plain list.
+
+    """
+    if isinstance(result, types.GeneratorType):
+        return list(result)
+    return result
+
+
 class Publisher(messaging.Publisher):
     """Publisher base class."""
-    pass
+
+    def __init__(self, *args, **kwargs):
+        self.serializer = _serializer()
+        super(Publisher, self).__init__(*args, **kwargs)
 
 
 class TopicAdapterConsumer(AdapterConsumer):
@@ -222,6 +401,8 @@ class TopicAdapterConsumer(AdapterConsumer):
         self.durable = False
         super(TopicAdapterConsumer, self).__init__(connection=connection,
                                     topic=topic, proxy=proxy)
+        if FLAGS.rpc_local_dispatch:
+            LocalDispatcher.instance().register(topic, proxy)
 
 
 class FanoutAdapterConsumer(AdapterConsumer):
@@ -282,6 +463,27 @@ class DirectConsumer(Consumer):
         super(DirectConsumer, self).__init__(connection=connection)
 
 
+class StreamConsumer(Consumer):
+    """Consumes the chunks of a stream_call reply.
+
+    Unlike DirectConsumer the queue is not exclusive, so the sender can
+    declare it to see how many chunks are still waiting, and the broker
+    only hands out one chunk at a time.
+
+    """
+
+    exchange_type = 'direct'
+
+    def __init__(self, connection=None, msg_id=None):
+        self.queue = msg_id
+        self.routing_key = msg_id
+        self.exchange = msg_id
+        self.auto_delete = True
+        self.exclusive = False
+        super(StreamConsumer, self).__init__(connection=connection)
+        self.qos(prefetch_count=1)
+
+
 class DirectPublisher(Publisher):
     """Publishes messages directly on a channel specified by msg_id."""
 
@@ -294,28 +496,341 @@ class DirectPublisher(Publisher):
         super(DirectPublisher, self).__init__(connection=connection)
 
 
-def msg_reply(msg_id, reply=None, failure=None):
+class PublisherPool(object):
+    """Keeps idle publishers open so sends don't redeclare exchanges.
+
+    Publishers are checked out for a single send and handed back afterwards,
+    keyed by (exchange, exchange_type, routing_key).  Each one owns its own
+    connection so concurrent greenthreads never share a channel.  At most
+    rpc_publisher_pool_size idle publishers are kept; extras are closed.
+
+    """
+
+    _instance = None
+
+    def __init__(self, max_size=None):
+        if max_size is None:
+            max_size = FLAGS.rpc_publisher_pool_size
+        self.max_size = max_size
+        self.free = {}
+        self.size = 0
+
+    @classmethod
+    def instance(cls):
+        """Returns the publisher pool for this process."""
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @classmethod
+    def reset(cls):
+        """Closes every idle publisher and forgets the pool."""
+        if cls._instance is not None:
+            cls._instance.close()
+            cls._instance = None
+
+    def send(self, publisher_cls, msg, **kwargs):
+        """Sends msg through a pooled publisher_cls(**kwargs).
+
+        If the send fails for anything but a serialization error the
+        publisher is assumed to sit on a dead connection: it is thrown away
+        and the message is sent once more on a freshly connected one.  If
+        that fails too, the new publisher is thrown away as well and the
+        error raised.
+
+        """
+        publisher = self._get(publisher_cls, **kwargs)
+        try:
+            publisher.send(msg)
+        except TypeError:
+            self._put(publisher)
+            raise
+        except Exception:  # pylint: disable=W0703
+            LOG.exception(_('Failed to publish to %s, reconnecting'),
+                          publisher.exchange)
+            self._discard(publisher)
+            publisher = self._create(publisher_cls, **kwargs)
+            try:
+                publisher.send(msg)
+            except Exception:
+                self._discard(publisher)
+                raise
+        self._put(publisher)
+
+    def _create(self, publisher_cls, **kwargs):
+        conn = Connection.instance(new=True)
+        publisher = publisher_cls(connection=conn, **kwargs)
+        # NOTE: the class and its arguments pin down the exchange,
+        #       exchange type and routing key the publisher uses
+        publisher.pool_key = (publisher_cls,) + tuple(sorted(kwargs.items()))
+        return publisher
+
+    def _get(self, publisher_cls, **kwargs):
+        key = (publisher_cls,) + tuple(sorted(kwargs.items()))
+        idle = self.free.get(key)
+        if idle:
+            self.size -= 1
+            return idle.pop()
+        return self._create(publisher_cls, **kwargs)
+
+    def _put(self, publisher):
+        if self.size >= self.max_size:
+            self._discard(publisher)
+            return
+        self.free.setdefault(publisher.pool_key, []).append(publisher)
+        self.size += 1
+
+    def _discard(self, publisher):
+        try:
+            publisher.close()
+            publisher.connection.close()
+        except Exception:  # pylint: disable=W0703
+            pass
+
+    def close(self):
+        for idle in self.free.values():
+            for publisher in idle:
+                self._discard(publisher)
+        self.free = {}
+        self.size = 0
+
+
+class ReplyDispatcher(object):
+    """Demultiplexes rpc.call replies arriving on one queue per process.
+
+    Instead of declaring a fresh DirectConsumer for every call, callers
+    register their msg_id and block on an event.  A single greenthread
+    consumes the long-lived reply queue and hands each reply to the waiter
+    whose msg_id it carries.
+
+    """
+
+    _instance = None
+
+    def __init__(self):
+        self.reply_to = 'reply_%s' % uuid.uuid4().hex
+        self.waiters = {}
+        self.consumer = self._create_consumer()
+        self.thread = greenthread.spawn(self._consume)
+
+    @classmethod
+    def instance(cls):
+        """Returns the dispatcher for this process, starting it if needed."""
+        if cls._instance is None or cls._instance.thread.dead:
+            cls._instance = cls()
+        return cls._instance
+
+    @classmethod
+    def reset(cls):
+        """Stops the dispatcher for this process, if there is one."""
+        if cls._instance is not None:
+            cls._instance.close()
+            cls._instance = None
+
+    def _create_consumer(self):
+        conn = Connection.instance(new=True)
+        consumer = DirectConsumer(connection=conn, msg_id=self.reply_to)
+        consumer.register_callback(self._receive)
+        return consumer
+
+    def register(self, msg_id):
+        """Returns an event that will be sent the reply for msg_id."""
+        waiter = event.Event()
+        self.waiters[msg_id] = waiter
+        return waiter
+
+    def unregister(self, msg_id):
+        self.waiters.pop(msg_id, None)
+
+    def _receive(self, data, message):
+        """Acks the reply and wakes up the caller waiting for it."""
+        message.ack()
+        msg_id = data.pop('_msg_id', None)
+        waiter = self.waiters.pop(msg_id, None)
+        if waiter is None:
+            LOG.warn(_('No caller waiting for reply %s, dropping it'), msg_id)
+            return
+        waiter.send(data)
+
+    def _consume(self):
+        while True:
+            try:
+                self.consumer.wait()
+            except StopIteration:
+                # NOTE: the fake backend stops once the consumer has been
+                #       cancelled, e.g. while the dispatcher is closing
+                pass
+            except Exception:  # pylint: disable=W0703
+                LOG.exception(_('Failed to consume from reply queue %s'),
+                              self.reply_to)
+                greenthread.sleep(FLAGS.rabbit_retry_interval)
+                self.consumer = self._create_consumer()
+
+    def close(self):
+        self.thread.kill()
+        try:
+            self.consumer.close()
+        except Exception:  # pylint: disable=W0703
+            pass
+
+
+class LocalDispatcher(object):
+    """Runs calls and casts to topics served by this process directly.
+
+    With rpc_local_dispatch set, every TopicAdapterConsumer registers its
+    proxy here and call and cast skip the broker for those topics.  The
+    message and the result are copied through utils.to_primitive, just as
+    they would be flattened on the wire, the method runs on the topic's
+    worker pool and exceptions come back as RemoteError.  When every
+    worker is busy the message goes through the broker as usual.  Fanout
+    casts always do, so other hosts still see them.
+
+    """
+
+    _instance = None
+
+    def __init__(self):
+        self.proxies = {}
+
+    @classmethod
+    def instance(cls):
+        """Returns the local dispatcher for this process."""
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @classmethod
+    def reset(cls):
+        """Forgets every locally served topic."""
+        cls._instance = None
+
+    def register(self, topic, proxy):
+        self.proxies[topic] = proxy
+
+    def serves(self, topic):
+        """Returns True if topic can be handled in this process right now."""
+        return (FLAGS.rpc_local_dispatch and topic in self.proxies and
+                _worker_pool(topic).free() > 0)
+
+    def call(self, topic, msg, timeout):
+        thread = _worker_pool(topic).spawn(self._dispatch, topic,
+                                           utils.to_primitive(msg))
+        with eventlet_timeout.Timeout(timeout or None, _timeout_error(topic)):
+            return thread.wait()
+
+    def cast(self, topic, msg):
+        def _cast(msg):
+            try:
+                self._dispatch(topic, msg)
+            except RemoteError:
+                pass
+
+        _worker_pool(topic).spawn_n(_cast, utils.to_primitive(msg))
+
+    def _dispatch(self, topic, msg):
+        ctxt = _unpack_context(msg)
+        try:
+            return utils.to_primitive(_invoke(self.proxies[topic], ctxt,
+                                              msg.get('method'),
+                                              msg.get('args', {})))
+        except Exception:
+            logging.exception('Exception during message handling')
+            raise RemoteError(*_serialize_failure(sys.exc_info()))
+
+
+def _serialize_failure(failure):
+    """Turns a sys.exc_info() tuple into RemoteError arguments."""
+    return (failure[0].__name__, str(failure[1]),
+            traceback.format_exception(*failure))
+
+
+def msg_reply(msg_id, reply=None, failure=None, reply_to=None):
     """Sends a reply or an error on the channel signified by msg_id.
 
-    Failure should be a sys.exc_info() tuple.
+    Failure should be a sys.exc_info() tuple.  If reply_to is set the reply
+    goes to that shared reply queue and carries msg_id so the caller's
+    ReplyDispatcher can route it.
 
     """
     if failure:
-        message = str(failure[1])
-        tb = traceback.format_exception(*failure)
-        LOG.error(_("Returning exception %s to caller"), message)
-        LOG.error(tb)
-        failure = (failure[0].__name__, str(failure[1]), tb)
+        failure = _serialize_failure(failure)
+        LOG.error(_("Returning exception %s to caller"), failure[1])
+        LOG.error(failure[2])
+    msg = {'result': reply, 'failure': failure}
+    try:
+        _send_reply(msg_id, msg, reply_to)
+    except TypeError:
+        msg['result'] = dict((k, repr(v))
+                             for k, v in reply.__dict__.iteritems())
+        _send_reply(msg_id, msg, reply_to)
+
+
+def _send_reply(msg_id, msg, reply_to=None):
+    if reply_to:
+        msg['_msg_id'] = msg_id
+        PublisherPool.instance().send(DirectPublisher, msg, msg_id=reply_to)
+        return
+    # NOTE: a per-call reply exchange is only ever used once,
+    #       so there is nothing to gain from pooling it
     conn = Connection.instance()
     publisher = DirectPublisher(connection=conn, msg_id=msg_id)
     try:
-        publisher.send({'result': reply, 'failure': failure})
-    except TypeError:
-        publisher.send(
-                {'result': dict((k, repr(v))
-                                for k, v in reply.__dict__.iteritems()),
-                 'failure': failure})
-    publisher.close()
+        publisher.send(msg)
+    finally:
+        publisher.close()
+
+
+def _stream_reply(msg_id, result, window):
+    """Sends result to a stream_call caller a chunk at a time.
+
+    Generators, lists and tuples are sent rpc_stream_chunk_size items per
+    message, anything else as a single item; the last message has ending
+    set.  Once window chunks are out the sender checks how many are still
+    waiting in the caller's queue and pauses while that many are.  If the
+    caller has gone away the rest of the result is dropped.
+
+    """
+    if not isinstance(result, (list, tuple, types.GeneratorType)):
+        result = [result]
+    conn = Connection.instance()
+    publisher = DirectPublisher(connection=conn, msg_id=msg_id)
+    sent = 0
+    chunk = []
+    try:
+        for item in result:
+            chunk.append(item)
+            if len(chunk) < FLAGS.rpc_stream_chunk_size:
+                continue
+            if sent >= window and not _wait_for_window(publisher.backend,
+                                                       msg_id, window):
+                LOG.warn(_('Caller of stream %s went away'), msg_id)
+                return
+            publisher.send({'result': chunk, 'failure': None,
+                            'ending': False})
+            sent += 1
+            chunk = []
+        publisher.send({'result': chunk, 'failure': None, 'ending': True})
+    finally:
+        publisher.close()
+
+
+def _wait_for_window(backend, msg_id, window):
+    """Waits until fewer than window chunks are queued for the caller.
+
+    Returns False if nobody consumes the queue any more.
+
+    """
+    while True:
+        _queue, depth, consumers = backend.queue_declare(queue=msg_id,
+                                                         durable=False,
+                                                         exclusive=False,
+                                                         auto_delete=True)
+        if not consumers:
+            backend.queue_delete(queue=msg_id)
+            return False
+        if depth < window:
+            return True
+        greenthread.sleep(FLAGS.rpc_stream_poll_interval)
 
 
 class RemoteError(exception.Error):
@@ -337,6 +852,18 @@ class RemoteError(exception.Error):
                                                          traceback))
 
 
+class Timeout(exception.Error):
+    """Signifies that no reply arrived before the caller's deadline."""
+    pass
+
+
+# NOTE: context values equal to these are left out of messages,
+#       user and project are always sent since receivers running
+#       older code can't build a context without them
+_CONTEXT_DEFAULTS = {'read_deleted': False,
+                     'remote_address': None}
+
+
 def _unpack_context(msg):
     """Unpack context from msg."""
     context_dict = {}
@@ -347,6 +874,8 @@ def _unpack_context(msg):
         if key.startswith('_context_'):
             value = msg.pop(key)
             context_dict[key[9:]] = value
+    for key, value in _CONTEXT_DEFAULTS.iteritems():
+        context_dict.setdefault(key, value)
     LOG.debug(_('unpacked context: %s'), context_dict)
     return context.RequestContext.from_dict(context_dict)
 
@@ -357,73 +886,275 @@ def _pack_context(msg, context):
     Values for message keys need to be less than 255 chars, so we pull
     context out into a bunch of separate keys. If we want to support
     more arguments in rabbit messages, we may want to do the same
-    for args at some point.
+    for args at some point.  Values that match _CONTEXT_DEFAULTS are left
+    out and restored by _unpack_context.
 
     """
     context = dict([('_context_%s' % key, value)
-                   for (key, value) in context.to_dict().iteritems()])
+                   for (key, value) in context.to_dict().iteritems()
+                   if key not in _CONTEXT_DEFAULTS or
+                      value != _CONTEXT_DEFAULTS[key]])
     msg.update(context)
 
 
-def call(context, topic, msg):
-    """Sends a message on a topic and wait for a response."""
+def _pack_sent_time(msg):
+    """Stamps msg with its send time so receivers can tell queueing time."""
+    if rpc_stats.enabled():
+        msg['_sent'] = time.time()
+
+
+def _pack_deadline(msg, timeout):
+    """Stamps msg with the time its caller will stop waiting, if any."""
+    if not timeout:
+        return None
+    deadline = time.time() + timeout
+    msg['_deadline'] = deadline
+    return deadline
+
+
+def call(context, topic, msg, timeout=None):
+    """Sends a message on a topic and wait for a response.
+
+    Raises Timeout if no reply arrives within timeout seconds
+    (rpc_call_timeout by default, 0 waits forever).  The deadline travels
+    with the message so the receiver can skip work nobody waits for.
+
+    """
+    if timeout is None:
+        timeout = FLAGS.rpc_call_timeout
     LOG.debug(_('Making asynchronous call on %s ...'), topic)
+    started = time.time()
     msg_id = uuid.uuid4().hex
     msg.update({'_msg_id': msg_id})
     LOG.debug(_('MSG_ID is %s') % (msg_id))
     _pack_context(msg, context)
+    _pack_deadline(msg, timeout)
+    _pack_sent_time(msg)
+
+    failed = True
+    try:
+        if LocalDispatcher.instance().serves(topic):
+            result = LocalDispatcher.instance().call(topic, msg, timeout)
+        elif FLAGS.rpc_use_reply_queue:
+            result = _call_with_reply_queue(topic, msg, msg_id, timeout)
+        else:
+            result = _call_with_direct_consumer(topic, msg, msg_id, timeout)
+        failed = isinstance(result, Exception)
+    finally:
+        rpc_stats.record('call', topic, msg.get('method'), error=failed,
+                         total=time.time() - started)
+    # NOTE(termie): this is a little bit of a change from the original
+    #               non-eventlet code where returning a Failure
+    #               instance from a deferred call is very similar to
+    #               raising an exception
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def _reply_result(data):
+    """Turns a reply message into a result or a RemoteError."""
+    if data['failure']:
+        return RemoteError(*data['failure'])
+    return data['result']
+
+
+def _timeout_error(topic):
+    return Timeout(_('Timed out waiting for a reply on %s') % topic)
+
+
+def _call_with_direct_consumer(topic, msg, msg_id, timeout):
+    """Waits for the reply on a queue declared just for this call."""
 
     class WaitMessage(object):
         def __call__(self, data, message):
             """Acks message and sets result."""
             message.ack()
-            if data['failure']:
-                self.result = RemoteError(*data['failure'])
-            else:
-                self.result = data['result']
+            self.result = _reply_result(data)
 
     wait_msg = WaitMessage()
     conn = Connection.instance()
     consumer = DirectConsumer(connection=conn, msg_id=msg_id)
     consumer.register_callback(wait_msg)
 
-    conn = Connection.instance()
-    publisher = TopicPublisher(connection=conn, topic=topic)
-    publisher.send(msg)
-    publisher.close()
+    PublisherPool.instance().send(TopicPublisher, msg, topic=topic)
 
     try:
-        consumer.wait(limit=1)
+        with eventlet_timeout.Timeout(timeout or None, _timeout_error(topic)):
+            consumer.wait(limit=1)
     except StopIteration:
         pass
-    consumer.close()
-    # NOTE(termie): this is a little bit of a change from the original
-    #               non-eventlet code where returning a Failure
-    #               instance from a deferred call is very similar to
-    #               raising an exception
-    if isinstance(wait_msg.result, Exception):
-        raise wait_msg.result
+    finally:
+        consumer.close()
     return wait_msg.result
 
 
+def _call_with_reply_queue(topic, msg, msg_id, timeout):
+    """Waits for the reply on this process's shared reply queue."""
+    dispatcher = ReplyDispatcher.instance()
+    msg['_reply_to'] = dispatcher.reply_to
+    waiter = dispatcher.register(msg_id)
+    try:
+        PublisherPool.instance().send(TopicPublisher, msg, topic=topic)
+        with eventlet_timeout.Timeout(timeout or None, _timeout_error(topic)):
+            return _reply_result(waiter.wait())
+    finally:
+        dispatcher.unregister(msg_id)
+
+
+def multicall(context, topics, msg, timeout=None):
+    """Sends a message to several topics and gathers the replies.
+
+    Every message is published up front and all replies come back on this
+    process's shared reply queue, so asking N hosts costs one round-trip
+    rather than N.  Replies that haven't arrived within timeout seconds
+    (rpc_multicall_timeout by default, 0 waits forever) of the first send
+    are given up on.
+
+    Returns a (results, failures) tuple of dicts keyed by topic, where each
+    failure is either the RemoteError raised by that host or a Timeout.
+
+    """
+    if timeout is None:
+        timeout = FLAGS.rpc_multicall_timeout
+    LOG.debug(_('Making multicall on %s ...'), topics)
+    dispatcher = ReplyDispatcher.instance()
+    waiters = {}
+    try:
+        deadline = _pack_deadline(msg, timeout)
+        for topic in topics:
+            msg_id = uuid.uuid4().hex
+            topic_msg = dict(msg, _msg_id=msg_id,
+                             _reply_to=dispatcher.reply_to)
+            _pack_context(topic_msg, context)
+            _pack_sent_time(topic_msg)
+            waiters[topic] = (msg_id, dispatcher.register(msg_id))
+            PublisherPool.instance().send(TopicPublisher, topic_msg,
+                                          topic=topic)
+
+        results = {}
+        failures = {}
+        for topic, (msg_id, waiter) in waiters.iteritems():
+            result = None
+            remaining = None
+            if deadline:
+                remaining = max(deadline - time.time(), 0)
+            with eventlet_timeout.Timeout(remaining, False):
+                result = _reply_result(waiter.wait())
+            if not waiter.ready():
+                failures[topic] = Timeout(_('No reply from %s') % topic)
+            elif isinstance(result, Exception):
+                failures[topic] = result
+            else:
+                results[topic] = result
+        return results, failures
+    finally:
+        for msg_id, _waiter in waiters.itervalues():
+            dispatcher.unregister(msg_id)
+
+
+def stream_call(context, topic, msg, timeout=None):
+    """Sends a message on a topic and iterates over the result as it arrives.
+
+    The receiving method may return a generator, which is sent back in
+    chunks of rpc_stream_chunk_size items as it runs, or a list, which is
+    sent the same way; any other value comes back as a single item.  The
+    sender keeps at most rpc_stream_window chunks queued for us, so neither
+    side holds the whole result.  Raises RemoteError if the method fails,
+    possibly after some items were returned, and Timeout if no chunk
+    arrives within timeout seconds (rpc_call_timeout by default, 0 waits
+    forever) of the previous one.  A receiver that doesn't stream replies
+    once with the whole result, which is returned the same way.
+
+    The request is sent right away; iterating the result waits for it.
+
+    """
+    if timeout is None:
+        timeout = FLAGS.rpc_call_timeout
+    LOG.debug(_('Making streaming call on %s ...'), topic)
+    msg_id = uuid.uuid4().hex
+    msg.update({'_msg_id': msg_id, '_stream': FLAGS.rpc_stream_window})
+    _pack_context(msg, context)
+    _pack_deadline(msg, timeout)
+    _pack_sent_time(msg)
+
+    conn = Connection.instance()
+    consumer = StreamConsumer(connection=conn, msg_id=msg_id)
+    chunks = []
+
+    def _receive(data, message):
+        message.ack()
+        chunks.append(data)
+
+    consumer.register_callback(_receive)
+    # NOTE: start consuming before sending so the sender never
+    #       sees a queue without a consumer and gives up on us
+    deliveries = consumer.iterconsume()
+    try:
+        PublisherPool.instance().send(TopicPublisher, msg, topic=topic)
+    except Exception:
+        consumer.close()
+        raise
+    return _iter_stream(topic, msg.get('method'), consumer, deliveries,
+                        chunks, timeout)
+
+
+def _iter_stream(topic, method, consumer, deliveries, chunks, timeout):
+    started = time.time()
+    timings = {}
+    failed = True
+    try:
+        while True:
+            with eventlet_timeout.Timeout(timeout or None,
+                                          _timeout_error(topic)):
+                while not chunks:
+                    deliveries.next()
+            data = chunks.pop(0)
+            timings.setdefault('first', time.time() - started)
+            if data['failure']:
+                raise RemoteError(*data['failure'])
+            items = data['result']
+            # NOTE: receivers that don't stream reply once with the
+            #       whole result and no ending
+            if 'ending' not in data and not isinstance(items, (list, tuple)):
+                items = [items]
+            for item in items:
+                yield item
+            if data.get('ending', True):
+                failed = False
+                return
+    except GeneratorExit:
+        failed = False
+        raise
+    finally:
+        consumer.close()
+        rpc_stats.record('call', topic, method, error=failed,
+                         total=time.time() - started, **timings)
+
+
 def cast(context, topic, msg):
     """Sends a message on a topic without waiting for a response."""
     LOG.debug(_('Making asynchronous cast on %s...'), topic)
+    started = time.time()
     _pack_context(msg, context)
-    conn = Connection.instance()
-    publisher = TopicPublisher(connection=conn, topic=topic)
-    publisher.send(msg)
-    publisher.close()
+    _pack_sent_time(msg)
+    if LocalDispatcher.instance().serves(topic):
+        LocalDispatcher.instance().cast(topic, msg)
+    else:
+        PublisherPool.instance().send(TopicPublisher, msg, topic=topic)
+    rpc_stats.record('cast', topic, msg.get('method'),
+                     publish=time.time() - started)
 
 
 def fanout_cast(context, topic, msg):
     """Sends a message on a fanout exchange without waiting for a response."""
     LOG.debug(_('Making asynchronous fanout cast...'))
+    started = time.time()
     _pack_context(msg, context)
-    conn = Connection.instance()
-    publisher = FanoutPublisher(topic, connection=conn)
-    publisher.send(msg)
-    publisher.close()
+    _pack_sent_time(msg)
+    PublisherPool.instance().send(FanoutPublisher, msg, topic=topic)
+    rpc_stats.record('cast', topic, msg.get('method'),
+                     publish=time.time() - started)
 
 
 def generic_response(message_data, message):
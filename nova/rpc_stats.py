@@ -0,0 +1,193 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Per topic and method counters and latency histograms for nova.rpc.
+
+nova.rpc reports every call, cast and received message here together with
+how long each stage took and how big the message was.  The samples are
+handed to every sink listed in the rpc_stats_sinks flag:
+
+MemorySink keeps counters and histograms that services hand out through
+get_rpc_stats (see `nova-manage service rpc_stats`), LogSink logs a summary
+every rpc_stats_log_interval seconds and StatsdSink sends the samples to a
+statsd daemon over UDP.
+
+"""
+
+import socket
+import time
+
+from nova import flags
+from nova import log as logging
+from nova import utils
+
+
+LOG = logging.getLogger('nova.rpc_stats')
+
+
+FLAGS = flags.FLAGS
+flags.DEFINE_list('rpc_stats_sinks', ['nova.rpc_stats.MemorySink'],
+                  'Classes that receive rpc timings, empty to disable')
+flags.DEFINE_integer('rpc_stats_log_interval', 60,
+                     'Seconds between rpc summaries logged by LogSink')
+flags.DEFINE_string('rpc_statsd_host', 'localhost',
+                    'Host of the statsd daemon StatsdSink sends to')
+flags.DEFINE_integer('rpc_statsd_port', 8125,
+                     'Port of the statsd daemon StatsdSink sends to')
+
+
+# NOTE: upper bounds in milliseconds, the last bucket is open ended
+BUCKETS = [1, 5, 10, 50, 100, 500, 1000, 5000, 10000]
+
+
+_SINKS = None
+
+
+def _sinks():
+    global _SINKS
+    if _SINKS is None:
+        _SINKS = [utils.import_object(name) for name in FLAGS.rpc_stats_sinks]
+    return _SINKS
+
+
+def enabled():
+    """Returns True if any sink wants rpc samples."""
+    return bool(_sinks())
+
+
+def record(kind, topic, method, error=False, size=None, **timings):
+    """Hands one sample to every sink.
+
+    :param kind: 'call', 'cast' or 'receive'
+    :param error: whether the call or handler failed
+    :param size: message size in bytes, if known
+    :param timings: stage name to duration in seconds
+
+    """
+    for sink in _sinks():
+        try:
+            sink.record(kind, topic, method, error, size, timings)
+        except Exception:  # pylint: disable=W0703
+            LOG.exception(_('rpc stats sink %s failed'), sink)
+
+
+def snapshot():
+    """Returns the counters of the first MemorySink, if there is one."""
+    for sink in _sinks():
+        if isinstance(sink, MemorySink):
+            return sink.snapshot()
+    return {}
+
+
+def reset():
+    """Drops every sink so they are rebuilt from the flags on next use."""
+    global _SINKS
+    _SINKS = None
+
+
+class MemorySink(object):
+    """Keeps counters and latency histograms in memory."""
+
+    def __init__(self):
+        self.stats = {}
+
+    def record(self, kind, topic, method, error, size, timings):
+        methods = self.stats.setdefault(topic, {})
+        kinds = methods.setdefault(str(method), {})
+        stat = kinds.setdefault(kind, {'count': 0,
+                                       'errors': 0,
+                                       'bytes': 0,
+                                       'timings': {}})
+        stat['count'] += 1
+        if error:
+            stat['errors'] += 1
+        if size:
+            stat['bytes'] += size
+        for name, seconds in timings.iteritems():
+            millis = seconds * 1000
+            timing = stat['timings'].setdefault(name, {
+                    'count': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'buckets': [0] * (len(BUCKETS) + 1)})
+            timing['count'] += 1
+            timing['total_ms'] += millis
+            timing['max_ms'] = max(timing['max_ms'], millis)
+            timing['buckets'][self._bucket(millis)] += 1
+
+    @staticmethod
+    def _bucket(millis):
+        for i, bound in enumerate(BUCKETS):
+            if millis <= bound:
+                return i
+        return len(BUCKETS)
+
+    def snapshot(self):
+        """Returns topic -> method -> kind -> counters and timings."""
+        return self.stats
+
+
+class LogSink(MemorySink):
+    """Logs a summary of the counters every rpc_stats_log_interval."""
+
+    def __init__(self):
+        super(LogSink, self).__init__()
+        self.last_logged = time.time()
+
+    def record(self, *args):
+        super(LogSink, self).record(*args)
+        if time.time() - self.last_logged >= FLAGS.rpc_stats_log_interval:
+            self.log_summary()
+
+    def log_summary(self):
+        for topic, methods in sorted(self.stats.iteritems()):
+            for method, kinds in sorted(methods.iteritems()):
+                for kind, stat in sorted(kinds.iteritems()):
+                    timings = ' '.join(
+                            '%s=%.1f/%.1fms' % (name,
+                                                t['total_ms'] / t['count'],
+                                                t['max_ms'])
+                            for name, t in sorted(stat['timings'].items()))
+                    LOG.info(_('rpc %(kind)s %(topic)s.%(method)s: '
+                               'count=%(count)d errors=%(errors)d '
+                               'bytes=%(bytes)d avg/max %(timings)s'),
+                             dict(stat, kind=kind, topic=topic,
+                                  method=method, timings=timings))
+        self.stats = {}
+        self.last_logged = time.time()
+
+
+class StatsdSink(object):
+    """Sends every sample to a statsd daemon over UDP."""
+
+    def __init__(self):
+        self.address = (FLAGS.rpc_statsd_host, FLAGS.rpc_statsd_port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def record(self, kind, topic, method, error, size, timings):
+        prefix = 'nova.rpc.%s.%s.%s' % (topic.replace('.', '_'), method, kind)
+        lines = ['%s.count:1|c' % prefix]
+        if error:
+            lines.append('%s.errors:1|c' % prefix)
+        if size:
+            lines.append('%s.bytes:%d|c' % (prefix, size))
+        for name, seconds in timings.iteritems():
+            lines.append('%s.%s:%d|ms' % (prefix, name, seconds * 1000))
+        try:
+            self.sock.sendto('\n'.join(lines), self.address)
+        except socket.error:
+            pass
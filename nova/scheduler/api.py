@@ -24,8 +24,7 @@ from nova import exception
 from nova import flags
 from nova import log as logging
 from nova import rpc
-
-from eventlet import greenpool
+from nova.scheduler import zone_client
 
 FLAGS = flags.FLAGS
 flags.DEFINE_bool('enable_zone_routing',
@@ -47,17 +46,34 @@ def _call_scheduler(method, context, params=None):
         params = {}
     queue = FLAGS.scheduler_topic
     kwargs = {'method': method, 'args': params}
-    return rpc.call(context, queue, kwargs)
+    return rpc.call(context, queue, kwargs,
+                    timeout=FLAGS.rpc_api_call_timeout)
+
+
+def _stream_scheduler(method, context, params=None):
+    """Like _call_scheduler, but iterates over the result as it arrives.
+
+    :retval: Iterator over the items returned by the scheduler worker
+    """
+    if not params:
+        params = {}
+    queue = FLAGS.scheduler_topic
+    kwargs = {'method': method, 'args': params}
+    return rpc.stream_call(context, queue, kwargs,
+                           timeout=FLAGS.rpc_api_call_timeout)
 
 
 def get_zone_list(context):
-    """Return a list of zones assoicated with this zone."""
-    items = _call_scheduler('get_zone_list', context)
-    for item in items:
+    """Iterate over the zones assoicated with this zone, as they arrive
+    from the scheduler or from the database if the scheduler has none."""
+    found = False
+    for item in _stream_scheduler('get_zone_list', context):
         item['api_url'] = item['api_url'].replace('\\/', '/')
-    if not items:
-        items = db.zone_get_all(context)
-    return items
+        found = True
+        yield item
+    if not found:
+        for item in db.zone_get_all(context):
+            yield item
 
 
 def zone_get(context, zone_id):
@@ -110,10 +126,9 @@ def child_zone_helper(zone_list, func):
     The return is [novaclient return objects] from each child zone.
     For example, if you are calling server.pause(), the list will
     be whatever the response from server.pause() is. One entry
-    per child zone called."""
-    green_pool = greenpool.GreenPool()
-    return [result for result in green_pool.imap(
-                    _wrap_method(_process, func), zone_list)]
+    per child zone called, None for the zones that couldn't be reached
+    or are skipped because they keep failing."""
+    return zone_client.fan_out(zone_list, _wrap_method(_process, func))
 
 
 def _issue_novaclient_command(nova, zone, collection, method_name, item_id):
@@ -132,6 +147,7 @@ def _issue_novaclient_command(nova, zone, collection, method_name, item_id):
                                                 locals()))
         return None
 
+    zone_client.instance_zones().remember(collection, item_id, zone.api_url)
     if method_name.lower() not in ['get', 'find']:
         result = getattr(result, method_name)()
     return result
@@ -180,11 +196,14 @@ class reroute_compute(object):
                 if not zones:
                     raise
 
-                # Ask the children to provide an answer ...
-                LOG.debug(_("Asking child zones ..."))
-                result = self._call_child_zones(zones,
-                            wrap_novaclient_function(_issue_novaclient_command,
-                                   collection, self.method_name, item_id))
+                function = wrap_novaclient_function(_issue_novaclient_command,
+                                   collection, self.method_name, item_id)
+                result = self._call_cached_zone(zones, function, collection,
+                                                item_id)
+                if result is None:
+                    # Ask the children to provide an answer ...
+                    LOG.debug(_("Asking child zones ..."))
+                    result = self._call_child_zones(zones, function)
                 # Scrub the results and raise another exception
                 # so the API layers can bail out gracefully ...
                 raise RedirectResult(self.unmarshall_result(result))
@@ -195,6 +214,27 @@ class reroute_compute(object):
         Broken out for testing."""
         return child_zone_helper(zones, function)
 
+    def _call_cached_zone(self, zones, function, collection, item_id):
+        """Ask only the zone item_id was last found in, if any. Returns
+        None when that zone is unknown or doesn't have it any more."""
+        cache = zone_client.instance_zones()
+        api_url = cache.get(collection, item_id)
+        if api_url is None:
+            return None
+        zones = [zone for zone in zones if zone.api_url == api_url]
+        if not zones:
+            return None
+        LOG.debug(_("Asking child zone %(api_url)s for %(item_id)s") %
+                                                locals())
+        # NOTE: action results don't tell us whether the item was
+        #       found, but _issue_novaclient_command remembers the
+        #       zone again when it is
+        cache.forget(collection, item_id)
+        result = self._call_child_zones(zones, function)
+        if cache.get(collection, item_id) is None:
+            return None
+        return result
+
     def get_collection_context_and_id(self, args, kwargs):
         """Returns a tuple of (novaclient collection name, security
            context and resource id. Derived class should override this."""
@@ -0,0 +1,311 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2011 Openstack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Replays scheduling requests against a synthetic fleet, in-process.
+
+A fleet of compute and volume hosts is created in the database and the
+compute hosts report capabilities shaped like the ones compute sends to
+ZoneManager.update_service_capabilities.  A trace of run_instance and
+create_volume requests, generated or recorded earlier, is then fed to a
+scheduler driver one request at a time, exactly the way SchedulerManager
+calls it, minus the casts.  Every bench_report_every decisions the hosts
+report their capabilities again with the resources placed on them taken
+off, like compute does periodically.
+
+The report has decisions per second, p50/p99 decision latency, database
+statements per decision and how well the instances were packed.  See
+bin/nova-scheduler-bench.
+"""
+
+import datetime
+import json
+import random
+import time
+
+from nova import db
+from nova import flags
+from nova import log as logging
+from nova import utils
+from nova.db.sqlalchemy import session
+from nova.scheduler import chance
+from nova.scheduler import driver
+from nova.scheduler import host_filter
+from nova.scheduler import zone_manager
+
+LOG = logging.getLogger('nova.scheduler.benchmark')
+
+FLAGS = flags.FLAGS
+flags.DECLARE('scheduler_driver', 'nova.scheduler.manager')
+flags.DEFINE_integer('bench_hosts', 100, 'Compute hosts in the fleet')
+flags.DEFINE_integer('bench_volume_hosts', 10, 'Volume hosts in the fleet')
+flags.DEFINE_integer('bench_requests', 1000,
+                     'Requests to generate when no trace is given')
+flags.DEFINE_float('bench_volume_ratio', 0.0,
+                   'Share of generated requests that are create_volume')
+flags.DEFINE_integer('bench_seed', 42, 'Seed for the fleet and the trace')
+flags.DEFINE_integer('bench_report_every', 10,
+                     'Decisions between two capability reports of a host')
+flags.DEFINE_string('bench_trace', '',
+                    'Replay the requests in this file, one json per line')
+flags.DEFINE_string('bench_record', '',
+                    'Write the replayed requests to this file')
+
+
+# NOTE: (vcpus, memory_mb, local_gb) of the hosts and flavors
+HOST_SHAPES = [(8, 16384, 250), (16, 32768, 500), (32, 65536, 1000)]
+FLAVORS = [(1, 512, 0), (1, 2048, 20), (2, 4096, 40), (4, 8192, 80),
+           (8, 16384, 160)]
+VOLUME_SIZES = [1, 10, 50, 100]
+
+
+class HostFilterScheduler(chance.ChanceScheduler):
+    """Places an instance on the first host default_host_filter_driver
+    lets through, so host filters can be benchmarked like drivers.  Other
+    requests are placed at random."""
+
+    def schedule_run_instance(self, context, instance_id, *_args, **_kwargs):
+        instance_ref = db.instance_get(context, instance_id)
+        host_filter_driver = host_filter.choose_driver()
+        _name, query = host_filter_driver.instance_type_to_filter(
+                dict(memory_mb=instance_ref['memory_mb'],
+                     local_gb=instance_ref['local_gb']))
+        hosts = host_filter_driver.filter_hosts(self.zone_manager, query)
+        if not hosts:
+            raise driver.NoValidHost(_("No host passes the filter"))
+        host = hosts[0][0]
+        db.instance_update(context, instance_id,
+                           {'host': host,
+                            'scheduled_at': datetime.datetime.utcnow()})
+        return host
+
+
+class StatementCounter(object):
+    """Counts the statements sent to the database."""
+
+    def __init__(self):
+        self.count = 0
+        dialect = session.get_session().bind.dialect
+        self._dialect = dialect
+        self._execute = dialect.do_execute
+        self._executemany = dialect.do_executemany
+        dialect.do_execute = self._counted(self._execute)
+        dialect.do_executemany = self._counted(self._executemany)
+
+    def _counted(self, f):
+        def inner(*args, **kwargs):
+            self.count += 1
+            return f(*args, **kwargs)
+        return inner
+
+    def stop(self):
+        self._dialect.do_execute = self._execute
+        self._dialect.do_executemany = self._executemany
+
+
+class Host(object):
+    """A simulated compute host and what was placed on it."""
+
+    def __init__(self, name, vcpus, memory_mb, local_gb):
+        self.name = name
+        self.vcpus = vcpus
+        self.memory_mb = memory_mb
+        self.local_gb = local_gb
+        self.used = dict(vcpus=0, memory_mb=0, local_gb=0)
+
+    def place(self, request):
+        for resource in self.used:
+            self.used[resource] += request.get(resource, 0)
+
+    def capabilities(self):
+        memory_free = self.memory_mb - self.used['memory_mb']
+        disk_available = self.local_gb - self.used['local_gb']
+        return {'host_name-label': self.name,
+                'host_hostname': self.name,
+                'host_memory_total': self.memory_mb,
+                'host_memory_overhead': 0,
+                'host_memory_free': memory_free,
+                'host_memory_free-computed': memory_free,
+                'host_other-config': {},
+                'host_cpu_info': {},
+                'disk_total': self.local_gb,
+                'disk_used': self.used['local_gb'],
+                'disk_available': disk_available,
+                'vcpus': self.vcpus,
+                'vcpus_used': self.used['vcpus'],
+                'memory_mb_used': self.used['memory_mb'],
+                'local_gb_used': self.used['local_gb']}
+
+
+def generate_trace(count, volume_ratio=0.0, seed=None):
+    """Returns count random requests."""
+    rand = random.Random(seed)
+    trace = []
+    for _i in xrange(count):
+        if rand.random() < volume_ratio:
+            trace.append(dict(method='create_volume',
+                              size=rand.choice(VOLUME_SIZES)))
+        else:
+            vcpus, memory_mb, local_gb = rand.choice(FLAVORS)
+            trace.append(dict(method='run_instance', vcpus=vcpus,
+                              memory_mb=memory_mb, local_gb=local_gb))
+    return trace
+
+
+def load_trace(path):
+    """Reads requests written by save_trace."""
+    with open(path) as trace_file:
+        return [json.loads(line) for line in trace_file if line.strip()]
+
+
+def save_trace(path, trace):
+    with open(path, 'w') as trace_file:
+        for request in trace:
+            trace_file.write('%s\n' % json.dumps(request))
+
+
+def build_fleet(context, compute_hosts, volume_hosts, seed=None):
+    """Creates the services of the fleet, returns the compute Hosts."""
+    rand = random.Random(seed)
+    hosts = []
+    for i in xrange(compute_hosts):
+        host = Host('bench-compute-%04d' % i, *rand.choice(HOST_SHAPES))
+        db.service_create(context, {'host': host.name,
+                                    'binary': 'nova-compute',
+                                    'topic': 'compute',
+                                    'report_count': 0})
+        hosts.append(host)
+    for i in xrange(volume_hosts):
+        db.service_create(context, {'host': 'bench-volume-%04d' % i,
+                                    'binary': 'nova-volume',
+                                    'topic': 'volume',
+                                    'report_count': 0})
+    return hosts
+
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Benchmark(object):
+    """Replays a trace through one scheduler driver."""
+
+    def __init__(self, context, scheduler_driver, hosts):
+        self.context = context
+        self.driver = utils.import_object(scheduler_driver)
+        self.zone_manager = zone_manager.ZoneManager()
+        self.driver.set_zone_manager(self.zone_manager)
+        self.hosts = dict((host.name, host) for host in hosts)
+        self.latencies = []
+        self.statements = 0
+        self.failures = 0
+        self.decisions = 0
+
+    def report_capabilities(self):
+        for host in self.hosts.itervalues():
+            capabilities = host.capabilities()
+            self.zone_manager.update_service_capabilities('compute',
+                    host.name, capabilities)
+            self.driver.update_service_capabilities('compute', host.name,
+                                                    capabilities)
+
+    def _create(self, request):
+        if request['method'] == 'create_volume':
+            volume_ref = db.volume_create(self.context,
+                                          {'size': request['size']})
+            return 'volume', dict(volume_id=volume_ref['id'])
+        instance_ref = db.instance_create(self.context,
+                {'vcpus': request['vcpus'],
+                 'memory_mb': request['memory_mb'],
+                 'local_gb': request['local_gb']})
+        return 'compute', dict(instance_id=instance_ref['id'])
+
+    def _schedule(self, method, topic, kwargs):
+        """Calls the driver the way SchedulerManager._schedule does."""
+        try:
+            schedule = getattr(self.driver, 'schedule_%s' % method)
+        except AttributeError:
+            return self.driver.schedule(self.context, topic, **kwargs)
+        return schedule(self.context, **kwargs)
+
+    def run(self, trace):
+        self.report_capabilities()
+        counter = StatementCounter()
+        try:
+            for request in trace:
+                topic, kwargs = self._create(request)
+                before = counter.count
+                start = time.time()
+                try:
+                    host = self._schedule(request['method'], topic, kwargs)
+                except (driver.NoValidHost, driver.WillNotSchedule):
+                    host = None
+                self.latencies.append(time.time() - start)
+                self.statements += counter.count - before
+                self.decisions += 1
+                if host is None:
+                    self.failures += 1
+                elif topic == 'compute' and host in self.hosts:
+                    self.hosts[host].place(request)
+                if not self.decisions % FLAGS.bench_report_every:
+                    self.report_capabilities()
+        finally:
+            counter.stop()
+        return self.report()
+
+    def report(self):
+        """Returns the figures of the run as a dict."""
+        ordered = sorted(self.latencies)
+        elapsed = sum(ordered)
+        used = [host for host in self.hosts.itervalues()
+                if host.used['vcpus']]
+        overcommitted = [host for host in used
+                         if host.used['memory_mb'] > host.memory_mb or
+                            host.used['local_gb'] > host.local_gb]
+        memory_used = sum(host.used['memory_mb'] for host in used)
+        memory_total = sum(host.memory_mb for host in used)
+        decisions = self.decisions or 1
+        return {'decisions': self.decisions,
+                'failures': self.failures,
+                'decisions_per_sec': elapsed and self.decisions / elapsed,
+                'latency_p50_ms': _percentile(ordered, 0.50) * 1000,
+                'latency_p99_ms': _percentile(ordered, 0.99) * 1000,
+                'statements_per_decision': float(self.statements) /
+                                           decisions,
+                'hosts_used': len(used),
+                'hosts_overcommitted': len(overcommitted),
+                'memory_utilization': (memory_total and
+                                       float(memory_used) / memory_total)}
+
+
+def run(context, scheduler_driver=None):
+    """Builds the fleet, replays the trace and returns the report."""
+    if FLAGS.bench_trace:
+        trace = load_trace(FLAGS.bench_trace)
+    else:
+        trace = generate_trace(FLAGS.bench_requests,
+                               volume_ratio=FLAGS.bench_volume_ratio,
+                               seed=FLAGS.bench_seed)
+    if FLAGS.bench_record:
+        save_trace(FLAGS.bench_record, trace)
+    hosts = build_fleet(context, FLAGS.bench_hosts, FLAGS.bench_volume_hosts,
+                        seed=FLAGS.bench_seed)
+    benchmark = Benchmark(context, scheduler_driver or FLAGS.scheduler_driver,
+                          hosts)
+    return benchmark.run(trace)
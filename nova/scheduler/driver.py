@@ -56,6 +56,14 @@ class Scheduler(object):
         """Called by the Scheduler Service to supply a ZoneManager."""
         self.zone_manager = zone_manager
 
+    def update_service_capabilities(self, service_name, host, capabilities):
+        """Called with every capability update the scheduler receives.
+
+        The ZoneManager already keeps these, drivers only need to override
+        this to track something of their own.
+        """
+        pass
+
     @staticmethod
     def service_is_up(service):
         """Check whether a service is up based on last heartbeat."""
@@ -76,6 +84,32 @@ class Scheduler(object):
         """Must override at least this method for scheduler to work."""
         raise NotImplementedError(_("Must implement a fallback schedule"))
 
+    def schedule_run_instances(self, context, topic, instance_ids, *args,
+                               **kwargs):
+        """Picks a host for every instance of a reservation.
+
+        Returns the hosts in the order of instance_ids, with None for the
+        instances no host was found for.  Drivers that can place a whole
+        reservation at once override this; by default every instance is
+        scheduled on its own.
+
+        """
+        hosts = []
+        for instance_id in instance_ids:
+            try:
+                if hasattr(self, 'schedule_run_instance'):
+                    host = self.schedule_run_instance(context, instance_id,
+                                                      *args, **kwargs)
+                else:
+                    host = self.schedule(context, topic, *args,
+                                         instance_id=instance_id, **kwargs)
+            except (NoValidHost, WillNotSchedule) as e:
+                logging.warn(_("Unable to schedule instance %(instance_id)s: "
+                           "%(e)s") % locals())
+                host = None
+            hosts.append(host)
+        return hosts
+
     def schedule_live_migration(self, context, instance_id, dest):
         """Live migration scheduling method.
 
@@ -49,6 +49,8 @@ FLAGS = flags.FLAGS
 flags.DEFINE_string('default_host_filter_driver',
                     'nova.scheduler.host_filter.AllHostsFilter',
                     'Which driver to use for filtering hosts.')
+flags.DEFINE_integer('json_filter_cache_size', 128,
+                     'How many compiled JsonFilter queries to keep')
 
 
 class HostFilter(object):
@@ -91,17 +93,13 @@ class FlavorFilter(HostFilter):
         return (self._full_name(), instance_type)
 
     def filter_hosts(self, zone_manager, query):
-        """Return a list of hosts that can create instance_type."""
+        """Return a list of hosts that can create instance_type, the
+        ones with the least memory to spare first."""
         instance_type = query
-        selected_hosts = []
-        for host, services in zone_manager.service_states.iteritems():
-            capabilities = services.get('compute', {})
-            host_ram_mb = capabilities['host_memory_free']
-            disk_bytes = capabilities['disk_available']
-            if host_ram_mb >= instance_type['memory_mb'] and \
-                disk_bytes >= instance_type['local_gb']:
-                    selected_hosts.append((host, capabilities))
-        return selected_hosts
+        hosts = zone_manager.hosts_with_capacity(instance_type['memory_mb'],
+                                                 instance_type['local_gb'])
+        return [(host, zone_manager.service_states[host]['compute'])
+                for host in hosts]
 
 #host entries (currently) are like:
 #    {'host_name-description': 'Default install of XenServer',
@@ -258,12 +256,53 @@ class JsonFilter(HostFilter):
         result = method(self, cooked_args)
         return result
 
+    def _compile(self, query):
+        """Turns a parsed query into a function of a host's services that
+        gives the same result as _process_filter, so that the query is
+        walked once rather than once per host."""
+        if len(query) == 0:
+            return lambda services: True
+        method = self.commands[query[0]]  # Let exception fly.
+        getters = []
+        for arg in query[1:]:
+            if isinstance(arg, list):
+                getters.append(self._compile(arg))
+            elif isinstance(arg, basestring):
+                if not arg:
+                    continue
+                if arg[0] == '$':
+                    getters.append(_lookup(arg[1:].split('.')))
+                else:
+                    getters.append(_constant(arg))
+            elif arg != None:
+                getters.append(_constant(arg))
+
+        def evaluate(services):
+            cooked_args = []
+            for getter in getters:
+                arg = getter(services)
+                if arg != None:
+                    cooked_args.append(arg)
+            return method(self, cooked_args)
+        return evaluate
+
+    def compile(self, query):
+        """Returns the compiled form of a JSON query, reusing the one
+        built for the same query text if it is still cached."""
+        cache = _compiled_queries()
+        key = (self.__class__, query)
+        compiled = cache.get(key)
+        if compiled is None:
+            compiled = self._compile(json.loads(query))
+            cache[key] = compiled
+        return compiled
+
     def filter_hosts(self, zone_manager, query):
         """Return a list of hosts that can fulfill filter."""
-        expanded = json.loads(query)
+        compiled = self.compile(query)
         hosts = []
         for host, services in zone_manager.service_states.iteritems():
-            r = self._process_filter(zone_manager, expanded, host, services)
+            r = compiled(services)
             if isinstance(r, list):
                 r = True in r
             if r:
@@ -271,6 +310,31 @@ class JsonFilter(HostFilter):
         return hosts
 
 
+def _constant(value):
+    return lambda services: value
+
+
+def _lookup(path):
+    """Compiled form of JsonFilter._parse_string for a $ path."""
+    def lookup(services):
+        for item in path:
+            services = services.get(item, None)
+            if not services:
+                return None
+        return services
+    return lookup
+
+
+_compiled = None
+
+
+def _compiled_queries():
+    global _compiled
+    if _compiled is None or _compiled.size != FLAGS.json_filter_cache_size:
+        _compiled = utils.LRUCache(FLAGS.json_filter_cache_size)
+    return _compiled
+
+
 DRIVERS = [AllHostsFilter, FlavorFilter, JsonFilter]
 
 
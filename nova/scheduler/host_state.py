@@ -0,0 +1,271 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2011 Openstack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+In-memory view of the resources instances use on each compute host and of
+the space left on each volume host.
+"""
+
+import datetime
+
+from nova import db
+from nova import flags
+from nova import log as logging
+from nova import utils
+
+LOG = logging.getLogger('nova.scheduler.host_state')
+FLAGS = flags.FLAGS
+flags.DEFINE_integer('host_state_reconcile_interval', 60,
+                     'Seconds between reloading per host instance usage '
+                     'from the database, 0 reloads before every placement')
+flags.DEFINE_bool('scheduler_claims', True,
+                  'Record each placement as a claim in the database so '
+                  'that other schedulers see it before the next reload')
+flags.DEFINE_integer('compute_claim_ttl', 3600,
+                     'Seconds after which claims are deleted')
+
+
+RESOURCES = ('vcpus', 'memory_mb', 'local_gb')
+
+
+class HostStateCache(object):
+    """Keeps the vcpus, memory_mb and local_gb used on every host.
+
+    The usage is loaded from the instances table once and then kept up to
+    date from the placements made since, so picking a host doesn't have to
+    sum over every instance.  With scheduler_claims, every placement is
+    recorded as a claim in the database and the claims made since the
+    last reload are read back before each placement; claims are few and
+    this way every scheduler sees the placements of the others right
+    away.  Otherwise only the placements made by this scheduler are
+    counted.  Compute hosts report the vcpus_used, memory_mb_used and
+    local_gb_used of their instances with their capabilities, stamped with
+    the time they were summed up.  A report newer than the figures loaded
+    for its host replaces them, and the placements claimed since the
+    report was summed up are counted on top of it.  Every
+    host_state_reconcile_interval seconds the whole view is reloaded from
+    the database to pick up instances that were deleted.
+
+    """
+
+    def __init__(self):
+        self.usage = {}
+        self.loaded = {}
+        self.loaded_at = {}  # { <host> : time its loaded usage was summed }
+        self.claims = {}  # { <host> : [(<created_at>, <usage>), ...] }
+        self.last_reconciled = None
+
+    def get_all(self, context):
+        """Returns host -> resource -> amount used, reloading if stale."""
+        if (not self.last_reconciled or
+            utils.is_older_than(self.last_reconciled,
+                                FLAGS.host_state_reconcile_interval)):
+            self.reconcile(context)
+        elif FLAGS.scheduler_claims:
+            self.refresh_claims(context)
+        return self.usage
+
+    def get(self, context, host):
+        """Returns resource -> amount used on host."""
+        return self.get_all(context).get(host, _empty_usage())
+
+    def reconcile(self, context):
+        """Reloads the usage of every host from the database."""
+        LOG.debug(_('Reloading host usage from the database'))
+        # NOTE: take the time first, a claim made while the sums
+        #       are read is counted twice rather than not at all
+        self.last_reconciled = utils.utcnow()
+        self.loaded = db.instance_get_sums_by_host(context)
+        self.loaded_at = {}
+        for host, claims in self.claims.items():
+            self.claims[host] = [claim for claim in claims
+                                 if claim[0] >= self.last_reconciled]
+        if FLAGS.scheduler_claims:
+            db.compute_claim_destroy_older_than(context,
+                    self.last_reconciled -
+                    datetime.timedelta(seconds=FLAGS.compute_claim_ttl))
+        self._rebuild()
+
+    def refresh_claims(self, context):
+        """Rereads the claims made since the last reload."""
+        self.claims = {}
+        for claim in db.compute_claim_get_all(context,
+                                              since=self.last_reconciled):
+            used = dict((resource, claim[resource] or 0)
+                        for resource in RESOURCES)
+            self.claims.setdefault(claim['host'], []).append(
+                    (claim['created_at'], used))
+        self._rebuild()
+
+    def _rebuild(self):
+        self.usage = {}
+        for host in set(self.loaded) | set(self.claims):
+            self._rebuild_host(host)
+
+    def _rebuild_host(self, host):
+        usage = _empty_usage()
+        if host in self.loaded:
+            _add(usage, self.loaded[host])
+        since = self.loaded_at.get(host, self.last_reconciled)
+        for created_at, used in self.claims.get(host, []):
+            if since is None or created_at >= since:
+                _add(usage, used)
+        self.usage[host] = usage
+
+    def claim(self, context, host, instance_ref):
+        """Accounts for an instance placed on host, recording a claim that
+        compute confirms or releases once it has built the instance."""
+        now = utils.utcnow()
+        if FLAGS.scheduler_claims:
+            values = dict((resource, instance_ref[resource] or 0)
+                          for resource in RESOURCES)
+            values.update(host=host, instance_id=instance_ref['id'],
+                          status='claimed', created_at=now)
+            db.compute_claim_create(context, values)
+        self.consume(host, instance_ref, now)
+
+    def consume(self, host, instance_ref, created_at=None):
+        """Accounts for an instance placed on host until the next read."""
+        used = dict((resource, instance_ref[resource] or 0)
+                    for resource in RESOURCES)
+        self.claims.setdefault(host, []).append(
+                (created_at or utils.utcnow(), used))
+        _add(self.usage.setdefault(host, _empty_usage()), used)
+
+    def update_from_capabilities(self, host, capabilities):
+        """Takes the usage a compute host reported for itself.
+
+        The report is dropped if it was summed up before the figures held
+        for its host, since placements made in between would go missing.
+        Otherwise the placements claimed since it was summed up are added
+        on top; a placement summed up and claimed in the same second is
+        counted twice, which is safer than overcommitting the host.
+
+        """
+        try:
+            reported = dict((resource, capabilities['%s_used' % resource])
+                            for resource in RESOURCES)
+            updated_at = utils.parse_isotime(
+                    capabilities['usage_updated_at'])
+        except (KeyError, TypeError, ValueError):
+            return
+        since = self.loaded_at.get(host, self.last_reconciled)
+        if since is None or updated_at < since:
+            LOG.debug(_('Dropping usage of %(host)s from %(updated_at)s, '
+                        'it is older than %(since)s') % locals())
+            return
+        self.loaded[host] = reported
+        self.loaded_at[host] = updated_at
+        self._rebuild_host(host)
+
+
+class VolumeStateCache(object):
+    """Keeps the free space of every volume host.
+
+    Volume hosts with a volume group report volume_group_free_gb with
+    their capabilities, less the volumes they have yet to build, stamped
+    with the time they were read.  The hosts that never reported, like
+    the ones with drivers that have no volume group, have the gigabytes
+    of their volumes loaded from the database, at most every
+    host_state_reconcile_interval seconds, and taken off max_gigabytes.
+    Volumes placed on a host are taken off its free space until figures
+    read after the placement come in, so a burst of creates doesn't pile
+    up on the host that looked emptiest.  The claims only live in this
+    scheduler.
+
+    """
+
+    def __init__(self):
+        self.free = {}
+        self.updated_at = {}  # { <host> : time its report was read }
+        self.allocated = {}  # { <host> : gigabytes } of silent hosts
+        self.last_loaded = None
+        self.claims = {}  # { <host> : [(<created_at>, <size>), ...] }
+
+    def get_all(self, context, hosts, max_gigabytes):
+        """Returns host -> gigabytes free for each of hosts, taking hosts
+        that never reported to hold max_gigabytes."""
+        silent = [host for host in hosts if host not in self.free]
+        missing = [host for host in silent if host not in self.allocated]
+        interval = FLAGS.host_state_reconcile_interval
+        if missing or (silent and
+                       utils.is_older_than(self.last_loaded, interval)):
+            self.load(context, silent)
+        free = {}
+        for host in hosts:
+            if host in self.free:
+                space = self.free[host]
+            else:
+                space = max_gigabytes - self.allocated[host]
+            free[host] = space - sum(size for created_at, size
+                                     in self._claims_since(host))
+        return free
+
+    def load(self, context, hosts):
+        """Reloads the gigabytes placed on hosts from the database."""
+        LOG.debug(_('Reloading volume gigabytes from the database'))
+        # NOTE: take the time first, a claim made while the sums
+        #       are read is counted twice rather than not at all
+        self.last_loaded = utils.utcnow()
+        sums = db.volume_get_sums_by_host(context, hosts)
+        self.allocated = dict((host, sums.get(host, 0)) for host in hosts)
+        for host in self.claims.keys():
+            self._forget_claims(host)
+
+    def consume(self, host, size):
+        """Accounts for a volume of size gigabytes placed on host until
+        figures of the host read after now come in."""
+        self.claims.setdefault(host, []).append((utils.utcnow(), size or 0))
+
+    def update_from_capabilities(self, host, capabilities):
+        """Takes the free space a volume host reported for itself, unless
+        it is older than the report already held for the host."""
+        try:
+            free = float(capabilities['volume_group_free_gb'])
+            updated_at = utils.parse_isotime(
+                    capabilities['volume_group_updated_at'])
+        except (KeyError, TypeError, ValueError):
+            return
+        if updated_at < self.updated_at.get(host, updated_at):
+            return
+        self.free[host] = free
+        self.updated_at[host] = updated_at
+        self._forget_claims(host)
+
+    def _claims_since(self, host):
+        """Returns the claims on host its figures don't include."""
+        since = self.updated_at.get(host)
+        if since is None and host in self.allocated:
+            since = self.last_loaded
+        return [claim for claim in self.claims.get(host, [])
+                if since is None or claim[0] >= since]
+
+    def _forget_claims(self, host):
+        claims = self._claims_since(host)
+        if claims:
+            self.claims[host] = claims
+        else:
+            self.claims.pop(host, None)
+
+
+def _add(usage, used):
+    for resource in RESOURCES:
+        usage[resource] += used[resource] or 0
+
+
+def _empty_usage():
+    return dict((resource, 0) for resource in RESOURCES)
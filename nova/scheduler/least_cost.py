@@ -0,0 +1,237 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2011 Openstack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Least Cost Scheduler keeps the capabilities compute hosts report in NumPy
+columns, one array per capability with a row per host.  Picking hosts for
+an instance then takes a handful of array operations over every host at
+once instead of a Python loop over ZoneManager.service_states:
+
+Filter functions return a boolean mask of the hosts that can take the
+instance, cost functions return a cost per host.  Each cost function is
+multiplied by its weight, the <function name>_weight flag, and the hosts
+that pass every filter are ranked by the sum.
+
+Both kinds of functions are called as fn(columns, instance_type), where
+columns maps a capability name from COLUMNS to its array.  Capabilities
+a host didn't report are NaN, which fails every comparison.
+"""
+
+import datetime
+import time
+
+import numpy
+
+from nova import db
+from nova import flags
+from nova import log as logging
+from nova import utils
+from nova.scheduler import chance
+from nova.scheduler import driver
+
+LOG = logging.getLogger('nova.scheduler.least_cost')
+
+FLAGS = flags.FLAGS
+flags.DECLARE('service_capabilities_ttl', 'nova.scheduler.zone_manager')
+flags.DEFINE_list('least_cost_scheduler_filter_functions',
+                  ['nova.scheduler.least_cost.flavor_filter_fn'],
+                  'Functions that mask out hosts unable to take an instance')
+flags.DEFINE_list('least_cost_scheduler_cost_functions',
+                  ['nova.scheduler.least_cost.noop_cost_fn'],
+                  'Functions that give every host a cost, lowest wins')
+flags.DEFINE_integer('noop_cost_fn_weight', 1,
+                     'How much weight to give the noop cost function')
+flags.DEFINE_integer('compute_fill_first_cost_fn_weight', 1,
+                     'How much weight to give the fill-first cost function')
+
+
+COLUMNS = ('host_memory_total', 'host_memory_free',
+           'disk_total', 'disk_available')
+
+
+def flavor_filter_fn(columns, instance_type):
+    """Hosts with enough free memory and disk, as in FlavorFilter."""
+    return ((columns['host_memory_free'] >= instance_type['memory_mb']) &
+            (columns['disk_available'] >= instance_type['local_gb']))
+
+
+def noop_cost_fn(columns, instance_type):
+    """Return the same cost for every host."""
+    return numpy.ones(len(columns['host_memory_free']))
+
+
+def compute_fill_first_cost_fn(columns, instance_type):
+    """Prefer the hosts with the least free memory."""
+    return columns['host_memory_free']
+
+
+class HostColumns(object):
+    """Reported capabilities of every host, one array per capability."""
+
+    def __init__(self, names=COLUMNS, capacity=64):
+        self.names = names
+        self.hosts = []
+        self.rows = {}
+        self.columns = dict((name, numpy.empty(capacity))
+                            for name in names)
+        self.reported_at = numpy.empty(capacity)
+
+    def __len__(self):
+        return len(self.hosts)
+
+    def update(self, host, capabilities):
+        """Stores the latest capabilities reported by host."""
+        row = self.rows.get(host)
+        if row is None:
+            row = len(self.hosts)
+            if row == len(self.reported_at):
+                self._grow()
+            self.hosts.append(host)
+            self.rows[host] = row
+        for name in self.names:
+            try:
+                self.columns[name][row] = capabilities[name]
+            except (KeyError, TypeError, ValueError):
+                self.columns[name][row] = numpy.nan
+        self.reported_at[row] = time.time()
+
+    def consume(self, host, name, amount):
+        """Takes amount off a capability until the host reports again."""
+        row = self.rows.get(host)
+        if row is not None:
+            self.columns[name][row] -= amount
+
+    def _grow(self):
+        capacity = len(self.reported_at) * 2
+        for name in self.names:
+            self.columns[name] = numpy.resize(self.columns[name], capacity)
+        self.reported_at = numpy.resize(self.reported_at, capacity)
+
+    def view(self):
+        """Returns the columns trimmed to the hosts seen so far."""
+        count = len(self.hosts)
+        return dict((name, column[:count])
+                    for name, column in self.columns.iteritems())
+
+
+_functions_cache = {}
+
+
+def _functions(names):
+    """Returns the functions named by names, importing them only once."""
+    key = tuple(names)
+    if key not in _functions_cache:
+        _functions_cache[key] = [utils.import_class(name) for name in names]
+    return _functions_cache[key]
+
+
+def _weight(fn):
+    flag_name = '%s_weight' % fn.__name__
+    try:
+        return getattr(FLAGS, flag_name)
+    except AttributeError:
+        LOG.warn(_('No weight flag %s, using 1'), flag_name)
+        return 1
+
+
+class LeastCostScheduler(chance.ChanceScheduler):
+    """Places instances on the hosts with the lowest weighted cost.
+
+    Topics other than compute fall back to ChanceScheduler.
+    """
+
+    def __init__(self):
+        super(LeastCostScheduler, self).__init__()
+        self.host_columns = HostColumns()
+
+    def set_zone_manager(self, zone_manager):
+        super(LeastCostScheduler, self).set_zone_manager(zone_manager)
+        for host, services in zone_manager.service_states.iteritems():
+            if 'compute' in services:
+                self.host_columns.update(host, services['compute'])
+
+    def update_service_capabilities(self, service_name, host, capabilities):
+        if service_name == 'compute':
+            self.host_columns.update(host, capabilities)
+
+    def weighted_costs(self, columns, instance_type):
+        """Returns the weighted sum of every cost function per host."""
+        total = numpy.zeros(len(self.host_columns))
+        for fn in _functions(FLAGS.least_cost_scheduler_cost_functions):
+            total += _weight(fn) * fn(columns, instance_type)
+        return total
+
+    def select_hosts(self, instance_type, num=1):
+        """Returns up to num hosts able to take instance_type, cheapest
+        first.  Hosts that haven't reported within service_capabilities_ttl
+        are left out, like the zone manager drops their capabilities."""
+        count = len(self.host_columns)
+        if not count:
+            return []
+        columns = self.host_columns.view()
+        mask = numpy.ones(count, dtype=bool)
+        if FLAGS.service_capabilities_ttl:
+            oldest = time.time() - FLAGS.service_capabilities_ttl
+            mask &= self.host_columns.reported_at[:count] >= oldest
+        for fn in _functions(FLAGS.least_cost_scheduler_filter_functions):
+            mask &= fn(columns, instance_type)
+        candidates = numpy.flatnonzero(mask)
+        if not len(candidates):
+            return []
+        costs = self.weighted_costs(columns, instance_type)[candidates]
+        if num < len(candidates):
+            cheapest = numpy.argpartition(costs, num - 1)[:num]
+            candidates = candidates[cheapest]
+            costs = costs[cheapest]
+        order = numpy.argsort(costs, kind='mergesort')
+        return [self.host_columns.hosts[row] for row in candidates[order]]
+
+    def schedule_run_instance(self, context, instance_id, *_args, **_kwargs):
+        """Picks the cheapest host able to take the instance."""
+        instance_ref = db.instance_get(context, instance_id)
+        hosts = self.select_hosts(instance_ref)
+        if not hosts:
+            raise driver.NoValidHost(_("No host has room for instance "
+                                       "%s") % instance_id)
+        host = hosts[0]
+        self._place(context, instance_ref, host)
+        return host
+
+    def schedule_run_instances(self, context, topic, instance_ids, *args,
+                               **kwargs):
+        """Picks the cheapest host for each instance in turn, counting the
+        instances already placed against their hosts."""
+        hosts = []
+        for instance_id in instance_ids:
+            instance_ref = db.instance_get(context, instance_id)
+            selected = self.select_hosts(instance_ref)
+            host = selected and selected[0] or None
+            if host:
+                self._place(context, instance_ref, host)
+            hosts.append(host)
+        return hosts
+
+    def _place(self, context, instance_ref, host):
+        now = datetime.datetime.utcnow()
+        db.instance_update(context, instance_ref['id'],
+                           {'host': host, 'scheduled_at': now})
+        # NOTE: until the host reports again, count the instance
+        #       against it in the units flavor_filter_fn compares
+        self.host_columns.consume(host, 'host_memory_free',
+                                  instance_ref['memory_mb'])
+        self.host_columns.consume(host, 'disk_available',
+                                  instance_ref['local_gb'])
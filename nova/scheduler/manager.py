@@ -29,6 +29,7 @@ from nova import log as logging
 from nova import manager
 from nova import rpc
 from nova import utils
+from nova.scheduler import driver
 from nova.scheduler import zone_manager
 
 LOG = logging.getLogger('nova.scheduler.manager')
@@ -69,6 +70,8 @@ class SchedulerManager(manager.Manager):
         """Process a capability update from a service node."""
         self.zone_manager.update_service_capabilities(service_name,
                             host, capabilities)
+        self.driver.update_service_capabilities(service_name, host,
+                                                capabilities)
 
     def _schedule(self, method, context, topic, *args, **kwargs):
         """Tries to call schedule_* method on the driver to retrieve host.
@@ -89,6 +92,31 @@ class SchedulerManager(manager.Manager):
                   "args": kwargs})
         LOG.debug(_("Casting to %(topic)s %(host)s for %(method)s") % locals())
 
+    def run_instances(self, context, topic, instance_ids, *args, **kwargs):
+        """Places all instances of a reservation with one driver call.
+
+        Casts run_instance to the chosen host of every instance, then
+        raises NoValidHost if some of them could not be placed.
+        """
+        elevated = context.elevated()
+        hosts = self.driver.schedule_run_instances(elevated, topic,
+                                                   instance_ids, *args,
+                                                   **kwargs)
+        unplaced = []
+        for instance_id, host in zip(instance_ids, hosts):
+            if host is None:
+                unplaced.append(instance_id)
+                continue
+            rpc.cast(context,
+                     db.queue_get_for(context, topic, host),
+                     {"method": "run_instance",
+                      "args": dict(kwargs, instance_id=instance_id)})
+            LOG.debug(_("Casting to %(topic)s %(host)s for run_instance of "
+                        "%(instance_id)s") % locals())
+        if unplaced:
+            raise driver.NoValidHost(_("Scheduler was unable to locate a "
+                                       "host for instances %s") % unplaced)
+
     # NOTE (masumotok) : This method should be moved to nova.api.ec2.admin.
     #                    Based on bexar design summit discussion,
     #                    just put this here for bexar release.
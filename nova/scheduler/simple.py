@@ -22,11 +22,13 @@ Simple Scheduler
 """
 
 import datetime
+import heapq
 
 from nova import db
 from nova import flags
 from nova.scheduler import driver
 from nova.scheduler import chance
+from nova.scheduler import host_state
 
 FLAGS = flags.FLAGS
 flags.DEFINE_integer("max_cores", 16,
@@ -35,11 +37,28 @@ flags.DEFINE_integer("max_gigabytes", 10000,
                      "maximum number of volume gigabytes to allow per host")
 flags.DEFINE_integer("max_networks", 1000,
                      "maximum number of networks to allow per host")
+flags.DEFINE_string("scheduler_batch_policy", "spread",
+                    "how the instances of one reservation are placed: "
+                    "'spread' over the least loaded hosts or 'pack' onto "
+                    "the busiest hosts that still have room")
 
 
 class SimpleScheduler(chance.ChanceScheduler):
     """Implements Naive Scheduler that tries to find least loaded host."""
 
+    def __init__(self):
+        super(SimpleScheduler, self).__init__()
+        self.host_state = host_state.HostStateCache()
+        self.volume_state = host_state.VolumeStateCache()
+
+    def update_service_capabilities(self, service_name, host, capabilities):
+        """Takes the usage compute and volume hosts report into the host
+        state."""
+        if service_name == 'compute':
+            self.host_state.update_from_capabilities(host, capabilities)
+        elif service_name == 'volume':
+            self.volume_state.update_from_capabilities(host, capabilities)
+
     def schedule_run_instance(self, context, instance_id, *_args, **_kwargs):
         """Picks a host that is up and has the fewest running instances."""
         instance_ref = db.instance_get(context, instance_id)
@@ -57,8 +76,13 @@ class SimpleScheduler(chance.ChanceScheduler):
             now = datetime.datetime.utcnow()
             db.instance_update(context, instance_id, {'host': host,
                                                       'scheduled_at': now})
+            self.host_state.claim(context, host, instance_ref)
             return host
-        results = db.service_get_all_compute_sorted(context)
+        usage = self.host_state.get_all(context)
+        services = db.service_get_all_by_topic(context, 'compute')
+        results = [(service, usage.get(service['host'], {}).get('vcpus', 0))
+                   for service in services]
+        results.sort(key=lambda result: result[1])
         for result in results:
             (service, instance_cores) = result
             if instance_cores + instance_ref['vcpus'] > FLAGS.max_cores:
@@ -71,13 +95,86 @@ class SimpleScheduler(chance.ChanceScheduler):
                                    instance_id,
                                    {'host': service['host'],
                                     'scheduled_at': now})
+                self.host_state.claim(context, service['host'],
+                                      instance_ref)
                 return service['host']
         raise driver.NoValidHost(_("Scheduler was unable to locate a host"
                                    " for this request. Is the appropriate"
                                    " service running?"))
 
+    def schedule_run_instances(self, context, topic, instance_ids, *args,
+                               **kwargs):
+        """Places every instance of a reservation in one pass.
+
+        Instances of a reservation share an instance type, so the hosts
+        are ordered once by load and handed out according to
+        scheduler_batch_policy.  Returns the hosts in the order of
+        instance_ids, None for instances that didn't fit anywhere.
+
+        """
+        instance_refs = [db.instance_get(context, instance_id)
+                         for instance_id in instance_ids]
+        if any(instance_ref['availability_zone'] and
+               ':' in instance_ref['availability_zone']
+               for instance_ref in instance_refs):
+            return super(SimpleScheduler, self).schedule_run_instances(
+                    context, topic, instance_ids, *args, **kwargs)
+
+        usage = self.host_state.get_all(context)
+        hosts = [(usage.get(service['host'], {}).get('vcpus', 0),
+                  service['host'])
+                 for service in db.service_get_all_by_topic(context,
+                                                            'compute')
+                 if self.service_is_up(service)]
+        if FLAGS.scheduler_batch_policy == 'pack':
+            placements = self._pack(hosts, instance_refs)
+        else:
+            placements = self._spread(hosts, instance_refs)
+
+        now = datetime.datetime.utcnow()
+        for instance_ref, host in zip(instance_refs, placements):
+            if host is None:
+                continue
+            db.instance_update(context, instance_ref['id'],
+                               {'host': host, 'scheduled_at': now})
+            self.host_state.claim(context, host, instance_ref)
+        return placements
+
+    @staticmethod
+    def _spread(hosts, instance_refs):
+        """Gives each instance the host with the fewest cores in use."""
+        heapq.heapify(hosts)
+        placements = []
+        for instance_ref in instance_refs:
+            if not hosts or hosts[0][0] + instance_ref['vcpus'] > \
+                                          FLAGS.max_cores:
+                placements.append(None)
+                continue
+            cores, host = hosts[0]
+            heapq.heapreplace(hosts, (cores + instance_ref['vcpus'], host))
+            placements.append(host)
+        return placements
+
+    @staticmethod
+    def _pack(hosts, instance_refs):
+        """Fills the busiest host that has room before using the next."""
+        hosts.sort(reverse=True)
+        placements = []
+        index = 0
+        for instance_ref in instance_refs:
+            while (index < len(hosts) and
+                   hosts[index][0] + instance_ref['vcpus'] > FLAGS.max_cores):
+                index += 1
+            if index == len(hosts):
+                placements.append(None)
+                continue
+            cores, host = hosts[index]
+            hosts[index] = (cores + instance_ref['vcpus'], host)
+            placements.append(host)
+        return placements
+
     def schedule_create_volume(self, context, volume_id, *_args, **_kwargs):
-        """Picks a host that is up and has the fewest volumes."""
+        """Picks a host that is up and has the most free space."""
         volume_ref = db.volume_get(context, volume_id)
         if (volume_ref['availability_zone']
             and ':' in volume_ref['availability_zone']
@@ -93,25 +190,29 @@ class SimpleScheduler(chance.ChanceScheduler):
             now = datetime.datetime.utcnow()
             db.volume_update(context, volume_id, {'host': host,
                                                   'scheduled_at': now})
+            self.volume_state.consume(host, volume_ref['size'])
             return host
-        results = db.service_get_all_volume_sorted(context)
-        for result in results:
-            (service, volume_gigabytes) = result
-            if volume_gigabytes + volume_ref['size'] > FLAGS.max_gigabytes:
-                raise driver.NoValidHost(_("All hosts have too many "
-                                           "gigabytes"))
-            if self.service_is_up(service):
-                # NOTE(vish): this probably belongs in the manager, if we
-                #             can generalize this somehow
-                now = datetime.datetime.utcnow()
-                db.volume_update(context,
-                                 volume_id,
-                                 {'host': service['host'],
-                                  'scheduled_at': now})
-                return service['host']
-        raise driver.NoValidHost(_("Scheduler was unable to locate a host"
-                                   " for this request. Is the appropriate"
-                                   " service running?"))
+        hosts = [service['host']
+                 for service in db.service_get_all_by_topic(context, 'volume')
+                 if self.service_is_up(service)]
+        if not hosts:
+            raise driver.NoValidHost(_("Scheduler was unable to locate a host"
+                                       " for this request. Is the appropriate"
+                                       " service running?"))
+        free = self.volume_state.get_all(context, hosts, FLAGS.max_gigabytes)
+        space, host = max((space, host) for host, space in free.iteritems())
+        if space < volume_ref['size']:
+            raise driver.NoValidHost(_("All hosts have too little free "
+                                       "space"))
+        # NOTE(vish): this probably belongs in the manager, if we
+        #             can generalize this somehow
+        now = datetime.datetime.utcnow()
+        db.volume_update(context, volume_id, {'host': host,
+                                              'scheduled_at': now})
+        # NOTE: claim after the host is set, a report read after the
+        #       claim then counts the volume
+        self.volume_state.consume(host, volume_ref['size'])
+        return host
 
     def schedule_set_network_host(self, context, *_args, **_kwargs):
         """Picks a host that is up and has the fewest networks."""
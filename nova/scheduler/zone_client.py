@@ -0,0 +1,192 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2011 Openstack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Calls out to child zones.
+
+Every call to a child zone gets zone_call_timeout seconds to answer.  A
+zone that fails zone_circuit_failures calls in a row has its circuit
+opened: it isn't called again for zone_circuit_reset_interval seconds,
+after which a single call is let through to see if it has recovered.
+Only calls that can't reach the zone count as failures; errors the zone
+answers with, like a 404 or a 409, are raised to the caller.
+
+The zone an instance was last found in is remembered for
+zone_instance_cache_ttl seconds so that requests for instances living in
+a child zone can go straight there instead of asking every zone.
+"""
+
+import httplib
+import socket
+
+from eventlet import greenpool
+from eventlet import timeout
+
+from nova import exception
+from nova import flags
+from nova import log as logging
+from nova import utils
+
+LOG = logging.getLogger('nova.scheduler.zone_client')
+
+FLAGS = flags.FLAGS
+flags.DEFINE_integer('zone_call_timeout', 30,
+                     'Seconds a child zone has to answer a call, '
+                     '0 waits forever')
+flags.DEFINE_integer('zone_circuit_failures', 3,
+                     'Consecutive failed calls before a child zone is '
+                     'no longer called')
+flags.DEFINE_integer('zone_circuit_reset_interval', 60,
+                     'Seconds before a child zone that kept failing is '
+                     'tried again')
+flags.DEFINE_integer('zone_instance_cache_ttl', 300,
+                     'Seconds to remember which child zone an instance '
+                     'was found in, 0 disables')
+flags.DEFINE_integer('zone_instance_cache_size', 10000,
+                     'How many instance locations to remember')
+
+
+class ZoneTimeout(exception.Error):
+    pass
+
+
+_UNREACHABLE_ERRORS = (ZoneTimeout, socket.error, httplib.HTTPException)
+# NOTE: novaclient hands timeouts and dead gateways back as responses
+_UNREACHABLE_CODES = (408, 502, 503, 504)
+
+
+def _is_unreachable(error):
+    """Return True if error means the zone couldn't be reached, rather
+    than the zone turning the request down."""
+    if isinstance(error, _UNREACHABLE_ERRORS):
+        return True
+    return getattr(error, 'code', None) in _UNREACHABLE_CODES
+
+
+class CircuitBreaker(object):
+    """Tracks consecutive failures of the calls to one child zone."""
+
+    def __init__(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def allow(self):
+        """Return True if the zone may be called now."""
+        if self.opened_at is None:
+            return True
+        if not utils.is_older_than(self.opened_at,
+                                   FLAGS.zone_circuit_reset_interval):
+            return False
+        # NOTE: let one call through and hold the others back
+        #       until it tells us whether the zone is back
+        self.opened_at = utils.utcnow()
+        return True
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def failure(self):
+        self.failures += 1
+        if self.failures >= FLAGS.zone_circuit_failures:
+            self.opened_at = utils.utcnow()
+
+
+class InstanceZoneCache(object):
+    """Remembers which child zone an item was found in."""
+
+    def __init__(self):
+        self.entries = utils.LRUCache(FLAGS.zone_instance_cache_size)
+
+    def get(self, collection, item_id):
+        """Return the api_url of the zone holding item_id or None."""
+        entry = self.entries.get((collection, str(item_id)))
+        if entry is None:
+            return None
+        found_at, api_url = entry
+        if utils.is_older_than(found_at, FLAGS.zone_instance_cache_ttl):
+            return None
+        return api_url
+
+    def remember(self, collection, item_id, api_url):
+        if FLAGS.zone_instance_cache_ttl:
+            self.entries[(collection, str(item_id))] = (utils.utcnow(),
+                                                       api_url)
+
+    def forget(self, collection, item_id):
+        self.entries[(collection, str(item_id))] = None
+
+
+_breakers = {}
+_instance_zones = None
+
+
+def breaker(zone):
+    """Return the CircuitBreaker of zone."""
+    return _breakers.setdefault(zone.api_url, CircuitBreaker())
+
+
+def instance_zones():
+    """Return the shared InstanceZoneCache."""
+    global _instance_zones
+    if _instance_zones is None:
+        _instance_zones = InstanceZoneCache()
+    return _instance_zones
+
+
+def reset():
+    """Forget every breaker and cached instance location."""
+    global _instance_zones
+    _breakers.clear()
+    _instance_zones = None
+
+
+def call_with_timeout(func, zone, *args):
+    """Call func(zone, *args), raising ZoneTimeout after
+    zone_call_timeout seconds."""
+    error = ZoneTimeout(_("Zone %s did not answer in time") % zone.api_url)
+    with timeout.Timeout(FLAGS.zone_call_timeout or None, error):
+        return func(zone, *args)
+
+
+def call_zone(func, zone):
+    """Call func(zone) unless the circuit of zone is open.  Returns
+    None if the zone isn't called or can't be reached, other errors are
+    raised."""
+    zone_breaker = breaker(zone)
+    if not zone_breaker.allow():
+        LOG.debug(_("Skipping zone %s, it keeps failing") % zone.api_url)
+        return None
+    try:
+        result = call_with_timeout(func, zone)
+    except Exception, e:
+        if not _is_unreachable(e):
+            zone_breaker.success()
+            raise
+        zone_breaker.failure()
+        LOG.exception(_("Error calling zone %s") % zone.api_url)
+        return None
+    zone_breaker.success()
+    return result
+
+
+def fan_out(zones, func):
+    """Call func(zone) on every zone at once.  Returns the results in the
+    order of zones, with None for the zones that weren't called or
+    couldn't be reached."""
+    pool = greenpool.GreenPool()
+    return list(pool.imap(lambda zone: call_zone(func, zone), zones))
@@ -17,6 +17,8 @@
 ZoneManager oversees all communications with child Zones.
 """
 
+import bisect
+import collections
 import novaclient
 import thread
 import traceback
@@ -27,12 +29,17 @@ from eventlet import greenpool
 from nova import db
 from nova import flags
 from nova import log as logging
+from nova import utils
+from nova.scheduler import zone_client
 
 FLAGS = flags.FLAGS
 flags.DEFINE_integer('zone_db_check_interval', 60,
                     'Seconds between getting fresh zone info from db.')
 flags.DEFINE_integer('zone_failures_to_offline', 3,
              'Number of consecutive errors before marking zone offline')
+flags.DEFINE_integer('service_capabilities_ttl', 300,
+             'Seconds after which capabilities a service has not refreshed '
+             'are dropped, 0 keeps them forever')
 
 
 class ZoneState(object):
@@ -96,43 +103,96 @@ def _poll_zone(zone):
     """Eventlet worker to poll a zone."""
     logging.debug(_("Polling zone: %s") % zone.api_url)
     try:
-        zone.update_metadata(_call_novaclient(zone))
+        zone.update_metadata(zone_client.call_with_timeout(_call_novaclient,
+                                                           zone))
     except Exception, e:
         zone.log_error(traceback.format_exc())
 
 
+class CapacityIndex(object):
+    """Hosts kept sorted by how much of one capability they have free."""
+    def __init__(self):
+        self.entries = []  # [ (<value>, <host>), ... ] sorted
+        self.values = {}  # { <host> : <value> }
+
+    def update(self, host, value):
+        """Set the free amount of host, or drop it from the index if
+           value is None."""
+        self.remove(host)
+        if value is not None:
+            bisect.insort(self.entries, (value, host))
+            self.values[host] = value
+
+    def remove(self, host):
+        if host in self.values:
+            entry = (self.values.pop(host), host)
+            del self.entries[bisect.bisect_left(self.entries, entry)]
+
+    def at_least(self, value):
+        """Return the (value, host) entries with at least value free,
+           smallest first."""
+        return self.entries[bisect.bisect_left(self.entries, (value,)):]
+
+
+def _free_amount(capabilities, key):
+    try:
+        return float(capabilities[key])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class CapabilityRollup(object):
+    """Sorted values of every <service>_<cap> across hosts, so the min
+       and max of each are at either end of its list."""
+    def __init__(self):
+        self.values = {}  # { <service>_<cap> : [ <value>, ... ] sorted }
+
+    def add(self, key, value):
+        bisect.insort(self.values.setdefault(key, []), value)
+
+    def remove(self, key, value):
+        values = self.values[key]
+        del values[bisect.bisect_left(values, value)]
+        if not values:
+            del self.values[key]
+
+    def replace(self, service_name, old, new):
+        """Swap the capabilities one host reported for service_name."""
+        for cap, value in old.iteritems():
+            if cap not in new or new[cap] != value:
+                self.remove("%s_%s" % (service_name, cap), value)
+        for cap, value in new.iteritems():
+            if cap not in old or old[cap] != value:
+                self.add("%s_%s" % (service_name, cap), value)
+
+    def combined(self):
+        return dict((key, (values[0], values[-1]))
+                    for key, values in self.values.iteritems())
+
+
 class ZoneManager(object):
     """Keeps the zone states updated."""
     def __init__(self):
         self.last_zone_db_check = datetime.min
         self.zone_states = {}  # { <zone_id> : ZoneState }
         self.service_states = {}  # { <host> : { <service> : { cap k : v }}}
+        self.free_memory = CapacityIndex()  # compute host_memory_free
+        self.free_disk = CapacityIndex()  # compute disk_available
+        self.rollup = CapabilityRollup()
+        self.reported_at = {}  # { (<host>, <service>) : <datetime> }
+        self.reports = collections.deque()  # [ (<datetime>, host, svc) ]
         self.green_pool = greenpool.GreenPool()
 
     def get_zone_list(self):
-        """Return the list of zones we know about."""
-        return [zone.to_dict() for zone in self.zone_states.values()]
+        """Iterate over the zones we know about."""
+        return (zone.to_dict() for zone in self.zone_states.values())
 
     def get_zone_capabilities(self, context):
         """Roll up all the individual host info to generic 'service'
            capabilities. Each capability is aggregated into
            <cap>_min and <cap>_max values."""
-        hosts_dict = self.service_states
-
-        # TODO(sandy) - be smarter about fabricating this structure.
-        # But it's likely to change once we understand what the Best-Match
-        # code will need better.
-        combined = {}  # { <service>_<cap> : (min, max), ... }
-        for host, host_dict in hosts_dict.iteritems():
-            for service_name, service_dict in host_dict.iteritems():
-                for cap, value in service_dict.iteritems():
-                    key = "%s_%s" % (service_name, cap)
-                    min_value, max_value = combined.get(key, (value, value))
-                    min_value = min(min_value, value)
-                    max_value = max(max_value, value)
-                    combined[key] = (min_value, max_value)
-
-        return combined
+        self.expire_service_capabilities()
+        return self.rollup.combined()
 
     def _refresh_from_db(self, context):
         """Make our zone state map match the db."""
@@ -163,6 +223,7 @@ class ZoneManager(object):
             logging.debug(_("Updating zone cache from db."))
             self.last_zone_db_check = datetime.now()
             self._refresh_from_db(context)
+        self.expire_service_capabilities()
         self._poll_zones(context)
 
     def update_service_capabilities(self, service_name, host, capabilities):
@@ -170,5 +231,63 @@ class ZoneManager(object):
         logging.debug(_("Received %(service_name)s service update from "
                             "%(host)s: %(capabilities)s") % locals())
         service_caps = self.service_states.get(host, {})
+        self.rollup.replace(service_name, service_caps.get(service_name, {}),
+                            capabilities)
         service_caps[service_name] = capabilities
         self.service_states[host] = service_caps
+        if service_name == 'compute':
+            self.free_memory.update(host, _free_amount(capabilities,
+                                                       'host_memory_free'))
+            self.free_disk.update(host, _free_amount(capabilities,
+                                                     'disk_available'))
+        now = utils.utcnow()
+        self.reported_at[(host, service_name)] = now
+        # the queue is only drained while reports can expire
+        if FLAGS.service_capabilities_ttl:
+            self.reports.append((now, host, service_name))
+
+    def expire_service_capabilities(self):
+        """Forget the services that stopped reporting their capabilities
+           more than service_capabilities_ttl seconds ago."""
+        ttl = FLAGS.service_capabilities_ttl
+        # NOTE: reports are queued in the order they arrive, so
+        #       only the stale head of the queue is looked at;
+        #       entries superseded by a later report are skipped
+        while (ttl and self.reports and
+               utils.is_older_than(self.reports[0][0], ttl)):
+            reported_at, host, service_name = self.reports.popleft()
+            if self.reported_at.get((host, service_name)) != reported_at:
+                continue
+            logging.info(_("Dropping stale %(service_name)s capabilities "
+                           "of %(host)s") % locals())
+            self.remove_service_capabilities(service_name, host)
+
+    def remove_service_capabilities(self, service_name, host):
+        """Forget the capabilities host reported for service_name."""
+        self.reported_at.pop((host, service_name), None)
+        service_caps = self.service_states.get(host, {})
+        self.rollup.replace(service_name,
+                            service_caps.pop(service_name, {}), {})
+        if not service_caps:
+            self.service_states.pop(host, None)
+        if service_name == 'compute':
+            self.free_memory.remove(host)
+            self.free_disk.remove(host)
+
+    def hosts_with_capacity(self, memory_mb, local_gb):
+        """Return the compute hosts with at least memory_mb memory and
+           local_gb disk free, tightest fit on memory first."""
+        enough_memory = self.free_memory.at_least(memory_mb)
+        enough_disk = self.free_disk.at_least(local_gb)
+        # NOTE: walk the shorter of the two runs and check the
+        #       other one through its threshold
+        if len(enough_disk) < len(enough_memory):
+            memory = self.free_memory.values
+            fits = [(memory[host], host) for _disk, host in enough_disk
+                    if host in memory and memory[host] >= memory_mb]
+            fits.sort()
+        else:
+            disk = self.free_disk.values
+            fits = [(value, host) for value, host in enough_memory
+                    if host in disk and disk[host] >= local_gb]
+        return [host for _value, host in fits]
@@ -34,6 +34,7 @@ from nova import exception
 from nova import flags
 from nova import log as logging
 from nova import rpc
+from nova import rpc_stats
 from nova import utils
 from nova import version
 from nova import wsgi
@@ -188,6 +189,10 @@ class Service(object):
             except Exception:
                 pass
 
+    def get_rpc_stats(self, context):
+        """Returns the rpc counters and latencies of this process."""
+        return rpc_stats.snapshot()
+
     def periodic_tasks(self):
         """Tasks to be run at a periodic interval."""
         self.manager.periodic_tasks(context.get_admin_context())
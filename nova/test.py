@@ -40,8 +40,10 @@ from nova import db
 from nova import fakerabbit
 from nova import flags
 from nova import rpc
+from nova import rpc_stats
 from nova import service
 from nova import wsgi
+from nova.scheduler import zone_client
 
 
 FLAGS = flags.FLAGS
@@ -98,6 +100,11 @@ class TestCase(unittest.TestCase):
             # Clean out fake_rabbit's queue if we used it
             if FLAGS.fake_rabbit:
                 fakerabbit.reset_all()
+            rpc.ReplyDispatcher.reset()
+            rpc.PublisherPool.reset()
+            rpc.LocalDispatcher.reset()
+            rpc_stats.reset()
+            zone_client.reset()
 
             # Reset any overriden flags
             self.reset_flags()
@@ -169,3 +169,12 @@ class LimiterTest(test.TestCase):
         """
         req = Request.blank('/?offset=-30')
         self.assertRaises(webob.exc.HTTPBadRequest, limited, self.tiny, req)
+
+    def test_limiter_iterator(self):
+        """
+        Test an iterator is only read up to the end of the slice.
+        """
+        items = iter(self.large)
+        req = Request.blank('/?offset=10&limit=5')
+        self.assertEqual(limited(items, req), self.large[10:15])
+        self.assertEqual(items.next(), 15)
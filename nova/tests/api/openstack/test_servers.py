@@ -63,8 +63,21 @@ def return_server_with_power_state(power_state):
     return _return_server
 
 
-def return_servers(context, user_id=1):
-    return [stub_instance(i, user_id) for i in xrange(5)]
+def paginate(instances, marker=None, limit=None):
+    instances = [instance for instance in instances
+                 if marker is None or instance['id'] > marker]
+    return instances[:limit]
+
+
+def return_servers(context, user_id=1, marker=None, limit=None):
+    return paginate([stub_instance(i, user_id) for i in xrange(5)],
+                    marker, limit)
+
+
+def return_server_columns(context, user_id, columns, marker=None,
+                          limit=None):
+    return [dict((column, instance[column]) for column in columns)
+            for instance in return_servers(context, user_id, marker, limit)]
 
 
 def return_security_group(context, instance_id, security_group_id):
@@ -154,6 +167,8 @@ class ServersTest(test.TestCase):
         self.stubs.Set(nova.db.api, 'instance_get', return_server)
         self.stubs.Set(nova.db.api, 'instance_get_all_by_user',
                        return_servers)
+        self.stubs.Set(nova.db.api, 'instance_get_all_columns_by_user',
+                       return_server_columns)
         self.stubs.Set(nova.db.api, 'instance_add_security_group',
                        return_security_group)
         self.stubs.Set(nova.db.api, 'instance_update', instance_update)
@@ -354,6 +369,17 @@ class ServersTest(test.TestCase):
             self.assertEqual(s.get('imageId', None), None)
             i += 1
 
+    def test_get_server_list_loads_only_ids_and_names(self):
+        def instance_get_all_by_user(context, user_id, **kwargs):
+            self.fail(_("The index loaded whole instances"))
+        self.stubs.Set(nova.db.api, 'instance_get_all_by_user',
+                       instance_get_all_by_user)
+
+        req = webob.Request.blank('/v1.0/servers')
+        res = req.get_response(fakes.wsgi_app())
+        res_dict = json.loads(res.body)
+        self.assertEqual([s['id'] for s in res_dict['servers']], range(5))
+
     def test_get_server_list_v11(self):
         req = webob.Request.blank('/v1.1/servers')
         res = req.get_response(fakes.wsgi_app())
@@ -435,6 +461,27 @@ class ServersTest(test.TestCase):
         servers = json.loads(res.body)['servers']
         self.assertEqual([s['id'] for s in servers], [2, 3])
 
+    def test_get_servers_pages_in_the_db(self):
+        pages = []
+
+        def instance_get_all_columns_by_user(context, user_id, columns,
+                                             marker=None, limit=None):
+            pages.append((marker, limit))
+            return return_server_columns(context, user_id, columns,
+                                         marker, limit)
+        self.stubs.Set(nova.db.api, 'instance_get_all_columns_by_user',
+                       instance_get_all_columns_by_user)
+
+        req = webob.Request.blank('/v1.1/servers?limit=2&marker=1')
+        res = req.get_response(fakes.wsgi_app())
+        servers = json.loads(res.body)['servers']
+        self.assertEqual([s['id'] for s in servers], [2, 3])
+        req = webob.Request.blank('/v1.0/servers?limit=2&offset=1')
+        res = req.get_response(fakes.wsgi_app())
+        servers = json.loads(res.body)['servers']
+        self.assertEqual([s['id'] for s in servers], [1, 2])
+        self.assertEqual(pages, [(1, 2), (None, 3)])
+
     def test_get_servers_with_bad_marker(self):
         req = webob.Request.blank('/v1.1/servers?limit=2&marker=asdf')
         res = req.get_response(fakes.wsgi_app())
@@ -879,7 +926,7 @@ class ServersTest(test.TestCase):
         instances - 2 on one host and 3 on another.
         '''
 
-        def return_servers_with_host(context, user_id=1):
+        def return_servers_with_host(context, user_id=1, **kwargs):
             return [stub_instance(i, 1, None, None, i % 2) for i in xrange(5)]
 
         self.stubs.Set(nova.db.api, 'instance_get_all_by_user',
@@ -108,7 +108,7 @@ class ZonesTest(test.TestCase):
         super(ZonesTest, self).tearDown()
 
     def test_get_zone_list_scheduler(self):
-        self.stubs.Set(api, '_call_scheduler', zone_get_all_scheduler)
+        self.stubs.Set(api, '_stream_scheduler', zone_get_all_scheduler)
         req = webob.Request.blank('/v1.0/zones')
         res = req.get_response(fakes.wsgi_app())
         res_dict = json.loads(res.body)
@@ -117,7 +117,8 @@ class ZonesTest(test.TestCase):
         self.assertEqual(len(res_dict['zones']), 2)
 
     def test_get_zone_list_db(self):
-        self.stubs.Set(api, '_call_scheduler', zone_get_all_scheduler_empty)
+        self.stubs.Set(api, '_stream_scheduler',
+                       zone_get_all_scheduler_empty)
         self.stubs.Set(nova.db, 'zone_get_all', zone_get_all_db)
         req = webob.Request.blank('/v1.0/zones')
         req.headers["Content-Type"] = "application/json"
@@ -41,4 +41,8 @@ FLAGS.blades_per_shelf = 4
 FLAGS.iscsi_num_targets = 8
 FLAGS.verbose = True
 FLAGS.sqlite_db = "tests.sqlite"
+# NOTE: tests copy a clean database over the file, connections
+#       can't be kept open across them
+FLAGS.sqlite_shared_connection = False
+FLAGS.sqlite_journal_mode = ''
 FLAGS.use_ipv6 = True
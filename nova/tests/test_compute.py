@@ -37,7 +37,9 @@ from nova.compute import instance_types
 from nova.compute import manager as compute_manager
 from nova.compute import power_state
 from nova.db.sqlalchemy import models
+from nova.image import fake
 from nova.image import local
+from nova.scheduler import api as scheduler_api
 
 LOG = logging.getLogger('nova.tests.compute')
 FLAGS = flags.FLAGS
@@ -144,6 +146,40 @@ class ComputeTestCase(test.TestCase):
             finally:
                 db.instance_destroy(self.context, ref[0]['id'])
 
+    def _cast_reservation(self, count):
+        casts = []
+
+        def fake_cast(context, topic, msg):
+            if topic == FLAGS.scheduler_topic:
+                casts.append(msg)
+
+        self.stubs.Set(rpc, 'cast', fake_cast)
+        compute_api = compute.API(image_service=fake.FakeImageService())
+        refs = compute_api.create(self.context,
+                instance_types.get_default_instance_type(), '123456',
+                min_count=1, max_count=count)
+        for ref in refs:
+            db.instance_destroy(self.context, ref['id'])
+        return refs, casts
+
+    def test_create_multiple_instances_casts_each(self):
+        """Make sure schedulers get one run_instance per instance by
+        default"""
+        refs, casts = self._cast_reservation(3)
+        self.assertEqual(['run_instance'] * 3,
+                         [cast['method'] for cast in casts])
+        self.assertEqual([ref['id'] for ref in refs],
+                         [cast['args']['instance_id'] for cast in casts])
+
+    def test_create_multiple_instances_casts_once(self):
+        """Make sure a reservation goes to the scheduler in one message"""
+        self.flags(scheduler_batch_run_instances=True)
+        refs, casts = self._cast_reservation(3)
+        self.assertEqual(1, len(casts))
+        self.assertEqual('run_instances', casts[0]['method'])
+        self.assertEqual([ref['id'] for ref in refs],
+                         casts[0]['args']['instance_ids'])
+
     def test_create_instance_associates_security_groups(self):
         """Make sure create associates security groups"""
         group = self._create_group()
@@ -211,6 +247,100 @@ class ComputeTestCase(test.TestCase):
         LOG.info(_("After terminating instances: %s"), instances)
         self.assertEqual(len(instances), 0)
 
+    def test_get_all_columns(self):
+        """Make sure only the requested columns of instances are loaded"""
+        instance_id = self._create_instance({'display_name': 'vm1'})
+        instances = self.compute_api.get_all(self.context,
+                                             columns=('name', 'display_name'))
+        self.assertEqual(instances,
+                         [{'id': instance_id,
+                           'name': FLAGS.instance_name_template % instance_id,
+                           'display_name': 'vm1'}])
+
+        instances = db.instance_get_all_columns_by_host(
+                context.get_admin_context(), 'otherhost', ('id', ))
+        self.assertEqual(instances, [])
+        db.instance_destroy(self.context, instance_id)
+
+    def test_get_all_paginated(self):
+        """Make sure instances are paged through by id"""
+        instance_ids = [self._create_instance() for _i in xrange(5)]
+        for name in ('group1', 'group2'):
+            group = db.security_group_create(self.context,
+                                             {'name': name,
+                                              'user_id': self.user.id,
+                                              'project_id': self.project.id})
+            db.instance_add_security_group(self.context, instance_ids[0],
+                                           group['id'])
+        instances = self.compute_api.get_all(self.context, limit=2)
+        self.assertEqual([i['id'] for i in instances], instance_ids[:2])
+        instances = self.compute_api.get_all(self.context,
+                                             marker=instance_ids[1], limit=2)
+        self.assertEqual([i['id'] for i in instances], instance_ids[2:4])
+        instances = self.compute_api.get_all(self.context, columns=('id', ),
+                                             marker=instance_ids[3])
+        self.assertEqual(instances, [{'id': instance_ids[4]}])
+        for instance_id in instance_ids:
+            db.instance_destroy(self.context, instance_id)
+
+    def test_poll_instance_states(self):
+        """Make sure the db state follows the state of the vm"""
+        instance_id = self._create_instance()
+        self.compute.run_instance(self.context, instance_id)
+        admin_context = context.get_admin_context()
+        db.instance_set_state(admin_context, instance_id, power_state.SHUTOFF)
+        self.compute._poll_instance_states(admin_context)
+        instance_ref = db.instance_get(self.context, instance_id)
+        self.assertEqual(instance_ref['state'], power_state.RUNNING)
+        self.compute.terminate_instance(self.context, instance_id)
+
+    def test_run_confirms_claim(self):
+        """Make sure a built instance keeps its claim"""
+        instance_id = self._create_instance()
+        admin_context = context.get_admin_context()
+        db.compute_claim_create(admin_context, {'host': 'host1',
+                                                'instance_id': instance_id,
+                                                'vcpus': 1,
+                                                'status': 'claimed'})
+        self.compute.run_instance(self.context, instance_id)
+        claims = db.compute_claim_get_all(admin_context)
+        self.assertEqual(['host1'], [claim['host'] for claim in claims])
+        self.compute.terminate_instance(self.context, instance_id)
+
+    def test_failed_spawn_releases_claim(self):
+        """Make sure an instance that fails to spawn gives its claim back"""
+        instance_id = self._create_instance()
+        admin_context = context.get_admin_context()
+        db.compute_claim_create(admin_context, {'host': 'host1',
+                                                'instance_id': instance_id,
+                                                'vcpus': 1,
+                                                'status': 'claimed'})
+
+        def fake_spawn(instance_ref):
+            raise exception.Error('kaboom')
+
+        self.stubs.Set(self.compute.driver, 'spawn', fake_spawn)
+        self.compute.run_instance(self.context, instance_id)
+        self.assertEqual([], db.compute_claim_get_all(admin_context))
+        self.compute.terminate_instance(self.context, instance_id)
+
+    def test_failed_setup_releases_claim(self):
+        """Make sure a claim is given back when run fails before spawn"""
+        instance_id = self._create_instance()
+        admin_context = context.get_admin_context()
+        db.compute_claim_create(admin_context, {'host': 'host1',
+                                                'instance_id': instance_id,
+                                                'vcpus': 1,
+                                                'status': 'claimed'})
+
+        def fake_update_state(context, instance_id, state=None):
+            raise exception.Error('kaboom')
+
+        self.stubs.Set(self.compute, '_update_state', fake_update_state)
+        self.assertRaises(exception.Error, self.compute.run_instance,
+                          self.context, instance_id)
+        self.assertEqual([], db.compute_claim_get_all(admin_context))
+
     def test_run_terminate_timestamps(self):
         """Make sure timestamps are set for launched and destroyed"""
         instance_id = self._create_instance()
@@ -652,6 +782,44 @@ class ComputeTestCase(test.TestCase):
         db.volume_destroy(c, v_ref['id'])
         db.floating_ip_destroy(c, flo_addr)
 
+    def test_report_driver_status_sends_usage(self):
+        """Make sure compute reports what its instances use"""
+        instance_ids = [self._create_instance({'host': self.compute.host,
+                                               'vcpus': 2, 'memory_mb': 512,
+                                               'local_gb': 10}),
+                        self._create_instance({'host': 'otherhost',
+                                               'vcpus': 4, 'memory_mb': 2048,
+                                               'local_gb': 20})]
+        now = datetime.datetime(2011, 7, 1, 12, 0, 0)
+        utils.set_time_override(now)
+        try:
+            self.compute._report_driver_status()
+        finally:
+            utils.clear_time_override()
+        capabilities = self.compute.last_capabilities
+        self.assertEqual(2, capabilities['vcpus_used'])
+        self.assertEqual(512, capabilities['memory_mb_used'])
+        self.assertEqual(10, capabilities['local_gb_used'])
+        self.assertEqual(utils.isotime(now), capabilities['usage_updated_at'])
+        for instance_id in instance_ids:
+            db.instance_destroy(self.context, instance_id)
+
+    def test_periodic_tasks_send_fresh_usage(self):
+        """Make sure the usage is summed up before it is sent"""
+        sent = []
+
+        def fake_update_service_capabilities(context, service_name, host,
+                                             capabilities):
+            sent.append(capabilities)
+
+        self.stubs.Set(scheduler_api, 'update_service_capabilities',
+                       fake_update_service_capabilities)
+        instance_id = self._create_instance({'host': self.compute.host,
+                                             'vcpus': 2})
+        self.compute.periodic_tasks(context.get_admin_context())
+        self.assertEqual(2, sent[0]['vcpus_used'])
+        db.instance_destroy(self.context, instance_id)
+
     def test_run_kill_vm(self):
         """Detect when a vm is terminated behind the scenes"""
         self.stubs = stubout.StubOutForTesting()
@@ -0,0 +1,114 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Tests that the hot lookups of the db api use the indexes of migration 017.
+"""
+
+from nova import context
+from nova import db
+from nova import exception
+from nova import test
+from nova.db.sqlalchemy import session
+
+
+class QueryPlanTestCase(test.TestCase):
+    """Runs db api calls and asks sqlite how it ran their selects."""
+
+    def setUp(self):
+        super(QueryPlanTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.dialect = session.get_session().bind.dialect
+        self.statements = []
+        real_execute = self.dialect.do_execute
+
+        def recording_execute(cursor, statement, parameters, *args):
+            if statement.lstrip().upper().startswith('SELECT'):
+                self.statements.append((statement, parameters))
+            return real_execute(cursor, statement, parameters, *args)
+        self.stubs.Set(self.dialect, 'do_execute', recording_execute)
+
+    def _query_plans(self, f, *args):
+        self.statements = []
+        try:
+            f(self.context, *args)
+        except exception.NotFound:
+            pass
+        statements = self.statements
+        self.stubs.UnsetAll()
+        connection = session.get_session().bind.raw_connection()
+        try:
+            cursor = connection.cursor()
+            plans = []
+            for statement, parameters in statements:
+                cursor.execute('EXPLAIN QUERY PLAN %s' % statement,
+                               parameters)
+                plans.append(' '.join(str(row[-1])
+                                      for row in cursor.fetchall()))
+            return plans
+        finally:
+            connection.close()
+
+    def assertUsesIndex(self, index, f, *args):
+        plans = self._query_plans(f, *args)
+        self.assertTrue(plans)
+        self.assertTrue(index in plans[0], plans[0])
+
+    def test_instance_get_all_by_host(self):
+        self.assertUsesIndex('instances_host_deleted_idx',
+                             db.instance_get_all_by_host, 'host1')
+
+    def test_instance_get_all_by_project(self):
+        self.assertUsesIndex('instances_project_id_deleted_idx',
+                             db.instance_get_all_by_project, 'project1')
+
+    def test_instance_get_all_by_project_page(self):
+        plans = self._query_plans(db.instance_get_all_by_project,
+                                  'project1', 10, 20)
+        self.assertTrue('instances_project_id_deleted_idx (project_id=? AND '
+                        'deleted=? AND rowid>?)' in plans[0], plans[0])
+
+    def test_instance_get_all_by_reservation(self):
+        self.assertUsesIndex('instances_reservation_id_deleted_idx',
+                             db.instance_get_all_by_reservation, 'r-1')
+
+    def test_fixed_ip_get_by_address(self):
+        self.assertUsesIndex('fixed_ips_address_deleted_idx',
+                             db.fixed_ip_get_by_address, '10.0.0.1')
+
+    def test_fixed_ip_associate_pool(self):
+        self.assertUsesIndex(
+                'fixed_ips_instance_id_reserved_deleted_network_id_idx',
+                db.fixed_ip_associate_pool, 1, 1)
+
+    def test_fixed_ip_get_free_by_network(self):
+        self.assertUsesIndex(
+                'fixed_ips_instance_id_reserved_deleted_network_id_idx',
+                db.fixed_ip_get_free_by_network, 1, 10)
+
+    def test_service_get_by_args(self):
+        self.assertUsesIndex('services_host_binary_deleted_idx',
+                             db.service_get_by_args, 'host1', 'nova-compute')
+
+    def test_security_group_get_by_name(self):
+        self.assertUsesIndex('security_groups_project_id_name_deleted_idx',
+                             db.security_group_get_by_name, 'project1',
+                             'default')
+
+    def test_auth_token_get(self):
+        self.assertUsesIndex('sqlite_autoindex_auth_tokens_1',
+                             db.auth_token_get, 'token')
@@ -0,0 +1,130 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import sqlite3
+import tempfile
+
+import eventlet
+from eventlet.green import threading
+from sqlalchemy import create_engine
+from sqlalchemy import exc
+from sqlalchemy import interfaces
+from sqlalchemy import pool
+from sqlalchemy import queue
+
+from nova import test
+from nova.db.sqlalchemy import session
+
+
+class ConnectCounter(interfaces.PoolListener):
+    def __init__(self, connects):
+        self.connects = connects
+
+    def connect(self, dbapi_con, con_record):
+        self.connects.append(dbapi_con)
+
+
+class EngineArgsTestCase(test.TestCase):
+    """Test the pooling set up for each kind of database."""
+
+    def setUp(self):
+        super(EngineArgsTestCase, self).setUp()
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+        super(EngineArgsTestCase, self).tearDown()
+
+    def test_pool_flags(self):
+        self.flags(sql_pool_size=20, sql_max_overflow=5, sql_pool_timeout=3)
+        kwargs = session.get_engine_args('mysql://nova:pass@db/nova')
+        self.assertEqual(kwargs['pool_size'], 20)
+        self.assertEqual(kwargs['max_overflow'], 5)
+        self.assertEqual(kwargs['pool_timeout'], 3)
+        self.assertTrue(isinstance(kwargs['listeners'][0],
+                                   session.ConnectionCheck))
+
+    def test_no_connection_check(self):
+        self.flags(sql_connection_check=False)
+        kwargs = session.get_engine_args('mysql://nova:pass@db/nova')
+        self.assertEqual(kwargs['listeners'], [])
+
+    def test_sqlite_shared_connection(self):
+        self.flags(sqlite_shared_connection=True, sqlite_journal_mode='WAL',
+                   sqlite_synchronous='NORMAL')
+        url = 'sqlite:///%s' % os.path.join(self.tempdir, 'nova.sqlite')
+        kwargs = session.get_engine_args(url)
+        self.assertEqual(kwargs['poolclass'], pool.QueuePool)
+        engine = create_engine(url, **kwargs)
+        connection = engine.connect()
+        self.assertEqual(connection.execute('PRAGMA journal_mode').scalar(),
+                         'wal')
+        self.assertEqual(connection.execute('PRAGMA synchronous').scalar(), 1)
+        dbapi_con = connection.connection.connection
+        connection.close()
+        self.assertTrue(engine.connect().connection.connection is dbapi_con)
+        engine.dispose()
+
+    def test_sqlite_synchronous_only_with_wal(self):
+        self.flags(sqlite_journal_mode='', sqlite_synchronous='NORMAL')
+        url = 'sqlite:///%s' % os.path.join(self.tempdir, 'nova.sqlite')
+        engine = create_engine(url, **session.get_engine_args(url))
+        self.assertEqual(engine.execute('PRAGMA synchronous').scalar(), 2)
+        engine.dispose()
+
+    def test_sqlite_shared_connection_under_eventlet(self):
+        # NOTE: what eventlet.monkey_patch() does to the pool in services
+        self.stubs.Set(pool, 'threading', threading)
+        self.stubs.Set(queue, 'threading', threading)
+        self.flags(sqlite_shared_connection=True)
+        url = 'sqlite:///%s' % os.path.join(self.tempdir, 'nova.sqlite')
+        kwargs = session.get_engine_args(url)
+        connects = []
+        kwargs['listeners'].append(ConnectCounter(connects))
+        engine = create_engine(url, **kwargs)
+        engine.execute('CREATE TABLE t (x INTEGER)')
+
+        def insert(x):
+            connection = engine.connect()
+            transaction = connection.begin()
+            connection.execute('INSERT INTO t VALUES (%d)' % x)
+            eventlet.sleep(0)
+            transaction.commit()
+            connection.close()
+
+        green_pool = eventlet.GreenPool()
+        for x in xrange(20):
+            green_pool.spawn(insert, x)
+        green_pool.waitall()
+        self.assertEqual(engine.execute('SELECT COUNT(*) FROM t').scalar(),
+                         20)
+        self.assertEqual(len(connects), 1)
+        engine.dispose()
+
+    def test_sqlite_connection_per_session(self):
+        kwargs = session.get_engine_args('sqlite://')
+        self.assertEqual(kwargs['poolclass'], pool.NullPool)
+
+    def test_connection_check_replaces_dropped_connection(self):
+        dbapi_con = sqlite3.connect(':memory:')
+        session.ConnectionCheck().checkout(dbapi_con, None, None)
+        dbapi_con.close()
+        self.assertRaises(exc.DisconnectionError,
+                          session.ConnectionCheck().checkout,
+                          dbapi_con, None, None)
@@ -0,0 +1,144 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the in-process broker.
+"""
+
+from carrot import messaging
+from eventlet import greenthread
+
+from nova import fakerabbit
+from nova import rpc
+from nova import test
+
+
+class FakeRabbitTestCase(test.TestCase):
+    """Test cases for fakerabbit routing and delivery"""
+
+    def setUp(self):
+        super(FakeRabbitTestCase, self).setUp()
+        self.flags(fake_rabbit=True)
+        self.conn = rpc.Connection.instance(True)
+
+    def _consumer(self, queue, exchange, exchange_type, routing_key,
+                  **kwargs):
+        return messaging.Consumer(connection=self.conn, queue=queue,
+                                  exchange=exchange,
+                                  exchange_type=exchange_type,
+                                  routing_key=routing_key, **kwargs)
+
+    def _send(self, exchange, exchange_type, routing_key, data):
+        publisher = messaging.Publisher(connection=self.conn,
+                                        exchange=exchange,
+                                        exchange_type=exchange_type,
+                                        routing_key=routing_key)
+        publisher.send(data)
+        publisher.close()
+
+    def _drain(self, consumer):
+        bodies = []
+        while True:
+            message = consumer.fetch()
+            if message is None:
+                return bodies
+            message.ack()
+            bodies.append(message.payload)
+
+    def test_direct_routing(self):
+        hit = self._consumer('hit', 'direct', 'direct', 'a')
+        miss = self._consumer('miss', 'direct', 'direct', 'b')
+        self._send('direct', 'direct', 'a', 1)
+        self.assertEqual([1], self._drain(hit))
+        self.assertEqual([], self._drain(miss))
+
+    def test_topic_wildcards(self):
+        exact = self._consumer('exact', 'nova', 'topic', 'compute.host1')
+        star = self._consumer('star', 'nova', 'topic', 'compute.*')
+        hash_ = self._consumer('hash', 'nova', 'topic', 'compute.#')
+        for key in ('compute', 'compute.host1', 'compute.host2',
+                    'compute.host1.extra', 'network.host1'):
+            self._send('nova', 'topic', key, key)
+        self.assertEqual(['compute.host1'], self._drain(exact))
+        self.assertEqual(['compute.host1', 'compute.host2'],
+                         self._drain(star))
+        self.assertEqual(['compute', 'compute.host1', 'compute.host2',
+                          'compute.host1.extra'],
+                         self._drain(hash_))
+
+    def test_fanout_copies_to_every_queue(self):
+        first = self._consumer('first', 'fan', 'fanout', 'x')
+        second = self._consumer('second', 'fan', 'fanout', 'y')
+        self._send('fan', 'fanout', 'ignored', 'hello')
+        self.assertEqual(['hello'], self._drain(first))
+        self.assertEqual(['hello'], self._drain(second))
+
+    def test_requeue_and_close_redeliver(self):
+        consumer = self._consumer('work', 'nova', 'topic', 'work')
+        self._send('nova', 'topic', 'work', 1)
+        self._send('nova', 'topic', 'work', 2)
+        message = consumer.fetch()
+        message.requeue()
+        message = consumer.fetch()
+        self.assertEqual(1, message.payload)
+        self.assertTrue(message.delivery_info['redelivered'])
+        consumer.fetch()
+        self.assertEqual(0, fakerabbit.QUEUES['work'].size())
+        consumer.close()
+        self.assertEqual(2, fakerabbit.QUEUES['work'].size())
+
+    def test_rejected_message_is_dropped(self):
+        consumer = self._consumer('work', 'nova', 'topic', 'work')
+        self._send('nova', 'topic', 'work', 1)
+        consumer.fetch().reject()
+        consumer.close()
+        self.assertEqual(0, fakerabbit.QUEUES['work'].size())
+
+    def test_consume_blocks_until_published(self):
+        consumer = self._consumer('work', 'nova', 'topic', 'work')
+        received = []
+        consumer.register_callback(lambda data, message: received.append(data))
+        thread = greenthread.spawn(consumer.wait, limit=1)
+        greenthread.sleep(0)
+        self.assertEqual([], received)
+        self._send('nova', 'topic', 'work', 'late')
+        self.assertRaises(StopIteration, thread.wait)
+        self.assertEqual(['late'], received)
+
+    def test_prefetch_limits_unacked_deliveries(self):
+        consumer = self._consumer('work', 'nova', 'topic', 'work')
+        consumer.qos(prefetch_count=1)
+        for i in xrange(3):
+            self._send('nova', 'topic', 'work', i)
+        messages = []
+        consumer.register_callback(lambda data, message: messages.append(
+                message))
+        thread = greenthread.spawn(consumer.wait)
+        greenthread.sleep(0)
+        self.assertEqual(1, len(messages))
+        messages[0].ack()
+        greenthread.sleep(0)
+        self.assertEqual(2, len(messages))
+        thread.kill()
+
+    def test_auto_delete_queue_goes_with_last_consumer(self):
+        consumer = rpc.DirectConsumer(connection=self.conn, msg_id='reply')
+        consumer.register_callback(lambda data, message: message.ack())
+        self._send('reply', 'direct', 'reply', 'done')
+        self.assertRaises(StopIteration, consumer.wait, limit=1)
+        consumer.close()
+        self.assertFalse('reply' in fakerabbit.QUEUES)
+        self.assertFalse('reply' in fakerabbit.EXCHANGES)
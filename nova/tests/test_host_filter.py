@@ -22,14 +22,11 @@ from nova import exception
 from nova import flags
 from nova import test
 from nova.scheduler import host_filter
+from nova.scheduler import zone_manager
 
 FLAGS = flags.FLAGS
 
 
-class FakeZoneManager:
-    pass
-
-
 class HostFilterTestCase(test.TestCase):
     """Test case for host filter drivers."""
 
@@ -69,11 +66,10 @@ class HostFilterTestCase(test.TestCase):
                 rxtx_quota=30000,
                 rxtx_cap=200)
 
-        self.zone_manager = FakeZoneManager()
-        states = {}
+        self.zone_manager = zone_manager.ZoneManager()
         for x in xrange(10):
-            states['host%02d' % (x + 1)] = {'compute': self._host_caps(x)}
-        self.zone_manager.service_states = states
+            self.zone_manager.update_service_capabilities(
+                    'compute', 'host%02d' % (x + 1), self._host_caps(x))
 
     def tearDown(self):
         FLAGS.default_host_filter_driver = self.old_flag
@@ -115,6 +111,24 @@ class HostFilterTestCase(test.TestCase):
         self.assertEquals('host05', just_hosts[0])
         self.assertEquals('host10', just_hosts[5])
 
+    def test_flavor_driver_orders_by_best_fit(self):
+        driver = host_filter.FlavorFilter()
+        # NOTE: host09 runs low on disk, so it drops out while
+        #       host07 becomes the tightest fit on memory
+        caps = self._host_caps(8)
+        caps['disk_available'] = 400
+        self.zone_manager.update_service_capabilities('compute', 'host09',
+                                                      caps)
+        caps = self._host_caps(6)
+        caps['host_memory_free'] = 55
+        self.zone_manager.update_service_capabilities('compute', 'host07',
+                                                      caps)
+        name, cooked = driver.instance_type_to_filter(self.instance_type)
+        hosts = [host for host, caps in driver.filter_hosts(
+                self.zone_manager, cooked)]
+        self.assertEquals(['host05', 'host07', 'host06', 'host08',
+                           'host10'], hosts)
+
     def test_json_driver(self):
         driver = host_filter.JsonFilter()
         # filter all hosts that can support 50 ram and 500 disk
@@ -206,3 +220,27 @@ class HostFilterTestCase(test.TestCase):
         self.assertFalse(driver.filter_hosts(self.zone_manager, json.dumps(
                 ['=', {}, ['>', '$missing....foo']]
             )))
+
+    def test_json_driver_compiles_query_once(self):
+        driver = host_filter.JsonFilter()
+        name, cooked = driver.instance_type_to_filter(self.instance_type)
+        compiled = driver.compile(cooked)
+        self.assertTrue(compiled is host_filter.JsonFilter().compile(cooked))
+        for host, services in self.zone_manager.service_states.iteritems():
+            self.assertEqual(driver._process_filter(self.zone_manager,
+                                                    json.loads(cooked),
+                                                    host, services),
+                             compiled(services))
+
+    def test_json_driver_cache_is_bounded(self):
+        old_size = FLAGS.json_filter_cache_size
+        FLAGS.json_filter_cache_size = 2
+        try:
+            driver = host_filter.JsonFilter()
+            first = json.dumps(['>', '$compute.host_memory_free', 10])
+            compiled = driver.compile(first)
+            driver.compile(json.dumps(['>', '$compute.host_memory_free', 20]))
+            driver.compile(json.dumps(['>', '$compute.host_memory_free', 30]))
+            self.assertFalse(compiled is driver.compile(first))
+        finally:
+            FLAGS.json_filter_cache_size = old_size
@@ -0,0 +1,127 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For Least Cost Scheduler.
+"""
+
+import time
+
+from nova import context
+from nova import db
+from nova import flags
+from nova import test
+from nova.scheduler import driver
+from nova.scheduler import least_cost
+
+FLAGS = flags.FLAGS
+
+
+class FakeZoneManager:
+    pass
+
+
+class LeastCostSchedulerTestCase(test.TestCase):
+    """Test case for the least cost scheduler."""
+
+    def _host_caps(self, multiplier):
+        # hostN = memory:free 10 + 10N, disk:available 100 + 100N
+        return {'host_memory_total': 100,
+                'host_memory_free': 10 + multiplier * 10,
+                'disk_available': 100 + multiplier * 100,
+                'disk_total': 1000}
+
+    def setUp(self):
+        super(LeastCostSchedulerTestCase, self).setUp()
+        self.flags(least_cost_scheduler_cost_functions=[
+                'nova.scheduler.least_cost.compute_fill_first_cost_fn'])
+        self.instance_type = dict(memory_mb=50, local_gb=500)
+        self.zone_manager = FakeZoneManager()
+        self.zone_manager.service_states = dict(
+                ('host%02d' % (x + 1), {'compute': self._host_caps(x)})
+                for x in xrange(10))
+        self.scheduler = least_cost.LeastCostScheduler()
+        self.scheduler.set_zone_manager(self.zone_manager)
+        self.context = context.get_admin_context()
+
+    def _create_instance(self, memory_mb=50, local_gb=500):
+        return db.instance_create(self.context, {'memory_mb': memory_mb,
+                                                 'local_gb': local_gb})['id']
+
+    def test_select_hosts_fill_first(self):
+        hosts = self.scheduler.select_hosts(self.instance_type, num=3)
+        self.assertEqual(['host05', 'host06', 'host07'], hosts)
+
+    def test_select_hosts_returns_every_candidate(self):
+        hosts = self.scheduler.select_hosts(self.instance_type, num=100)
+        self.assertEqual(['host%02d' % x for x in xrange(5, 11)], hosts)
+
+    def test_weights_are_applied(self):
+        self.flags(compute_fill_first_cost_fn_weight=-1)
+        hosts = self.scheduler.select_hosts(self.instance_type, num=2)
+        self.assertEqual(['host10', 'host09'], hosts)
+
+    def test_missing_capabilities_are_filtered(self):
+        self.scheduler.update_service_capabilities('compute', 'host05',
+                                                   {'host_memory_free': 90})
+        hosts = self.scheduler.select_hosts(self.instance_type)
+        self.assertEqual(['host06'], hosts)
+
+    def test_stale_hosts_are_filtered(self):
+        row = self.scheduler.host_columns.rows['host05']
+        self.scheduler.host_columns.reported_at[row] = (time.time() -
+                FLAGS.service_capabilities_ttl - 1)
+        hosts = self.scheduler.select_hosts(self.instance_type)
+        self.assertEqual(['host06'], hosts)
+
+    def test_hosts_reporting_late_are_kept(self):
+        row = self.scheduler.host_columns.rows['host05']
+        self.scheduler.host_columns.reported_at[row] = time.time() - 90
+        hosts = self.scheduler.select_hosts(self.instance_type)
+        self.assertEqual(['host05'], hosts)
+
+    def test_functions_are_imported_once(self):
+        self.scheduler.select_hosts(self.instance_type)
+        self.mox.StubOutWithMock(least_cost.utils, 'import_class')
+        self.mox.ReplayAll()
+        hosts = self.scheduler.select_hosts(self.instance_type)
+        self.assertEqual(['host05'], hosts)
+
+    def test_columns_grow(self):
+        columns = least_cost.HostColumns(capacity=1)
+        for x in xrange(5):
+            columns.update('host%d' % x, self._host_caps(x))
+        self.assertEqual(5, len(columns))
+        self.assertEqual([10, 20, 30, 40, 50],
+                         list(columns.view()['host_memory_free']))
+
+    def test_placements_are_consumed(self):
+        instance_ids = [self._create_instance() for x in xrange(3)]
+        hosts = self.scheduler.schedule_run_instances(self.context,
+                                                      'compute',
+                                                      instance_ids)
+        # NOTE: host05 only fits one, host06 fits two by memory but
+        #       only one by disk
+        self.assertEqual(['host05', 'host06', 'host07'], hosts)
+        for instance_id, host in zip(instance_ids, hosts):
+            instance_ref = db.instance_get(self.context, instance_id)
+            self.assertEqual(host, instance_ref['host'])
+
+    def test_no_valid_host(self):
+        instance_id = self._create_instance(memory_mb=1000)
+        self.assertRaises(driver.NoValidHost,
+                          self.scheduler.schedule_run_instance,
+                          self.context, instance_id)
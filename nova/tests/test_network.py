@@ -21,7 +21,10 @@ Unit Tests for network code
 import IPy
 import os
 
+from nova import context
+from nova import db
 from nova import test
+from nova.network import ip_pool
 from nova.network import linux_net
 
 
@@ -164,3 +167,48 @@ class IptablesManagerTestCase(test.TestCase):
             self.assertTrue('-A %s -j run_tests.py-%s' \
                             % (chain, chain) in new_lines,
                             "Built-in chain %s not wrapped" % (chain,))
+
+
+class FixedIpPoolTestCase(test.TestCase):
+    def setUp(self):
+        super(FixedIpPoolTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.network_id = db.network_get_all(self.context)[0]['id']
+        self.free = db.fixed_ip_get_free_by_network(self.context,
+                                                    self.network_id)
+
+    def _allocate(self, pool):
+        instance_id = db.instance_create(self.context, {})['id']
+        address = pool.allocate(self.context, self.network_id, instance_id)
+        instance = db.fixed_ip_get_instance(self.context, address)
+        self.assertEqual(instance['id'], instance_id)
+        return address
+
+    def test_allocates_lowest_free_ip_first(self):
+        pool = ip_pool.FixedIpPool()
+        addresses = [self._allocate(pool) for _i in xrange(3)]
+        self.assertEqual(addresses,
+                         [address for _id, address in self.free[:3]])
+
+    def test_skips_ips_allocated_elsewhere(self):
+        pool = ip_pool.FixedIpPool()
+        other_pool = ip_pool.FixedIpPool()
+        first = self._allocate(pool)
+        taken = self._allocate(other_pool)
+        self.assertEqual(taken, self.free[1][1])
+        self.assertEqual(self._allocate(pool), self.free[2][1])
+        self.assertNotEqual(first, taken)
+
+    def test_reuses_ips_freed_elsewhere(self):
+        pool = ip_pool.FixedIpPool()
+        first = self._allocate(pool)
+        self._allocate(pool)
+        db.fixed_ip_disassociate(self.context, first)
+        self.assertEqual(self._allocate(pool), first)
+
+    def test_no_more_addresses(self):
+        pool = ip_pool.FixedIpPool()
+        for _i in xrange(len(self.free)):
+            self._allocate(pool)
+        self.assertRaises(db.NoMoreAddresses, pool.allocate, self.context,
+                          self.network_id, 1)
@@ -19,7 +19,14 @@
 Unit Tests for remote procedure calls using queue
 """
 
+import time
+
+from eventlet import event
+from eventlet import greenpool
+
 from nova import context
+from nova import db
+from nova import fakerabbit
 from nova import flags
 from nova import log as logging
 from nova import rpc
@@ -57,6 +64,27 @@ class RpcTestCase(test.TestCase):
                                    "args": {"value": value}})
         self.assertEqual(self.context.to_dict(), result)
 
+    def test_context_defaults_not_packed(self):
+        """Make sure default context values are left out of messages"""
+        msg = {}
+        rpc._pack_context(msg, self.context)
+        self.assertEqual(['_context_is_admin', '_context_project',
+                          '_context_request_id', '_context_timestamp',
+                          '_context_user'],
+                         sorted(msg.keys()))
+        self.assertEqual(self.context.to_dict(),
+                         rpc._unpack_context(msg).to_dict())
+
+    def test_context_readable_by_old_receivers(self):
+        """Make sure packed contexts build without the restored defaults"""
+        msg = {}
+        rpc._pack_context(msg, self.context)
+        values = dict((str(key[9:]), value)
+                      for key, value in msg.iteritems())
+        restored = context.RequestContext.from_dict(values)
+        self.assertEqual(self.context.user_id, restored.user_id)
+        self.assertEqual(self.context.project_id, restored.project_id)
+
     def test_call_exception(self):
         """Test that exception gets passed back properly
 
@@ -108,6 +136,382 @@ class RpcTestCase(test.TestCase):
                                               "value": value}})
         self.assertEqual(value, result)
 
+    def test_call_timeout(self):
+        """Make sure a call nobody answers raises Timeout"""
+        self.assertRaises(rpc.Timeout,
+                          rpc.call,
+                          self.context,
+                          'nobody',
+                          {"method": "echo",
+                           "args": {"value": 42}},
+                          timeout=1)
+
+    def test_expired_call_is_dropped(self):
+        """Make sure a receiver skips calls whose caller gave up"""
+        replies = []
+        self.stubs.Set(rpc, 'msg_reply',
+                       lambda *args, **kwargs: replies.append(args))
+
+        class FakeMessage(object):
+            def ack(self):
+                pass
+
+        msg = {"method": "echo",
+               "args": {"value": 42},
+               "_msg_id": "expired",
+               "_deadline": time.time() - FLAGS.rpc_clock_skew - 1}
+        rpc._pack_context(msg, self.context)
+        self.consumer._receive(msg, FakeMessage())
+        self.assertEqual([], replies)
+
+        msg = {"method": "echo",
+               "args": {"value": 42},
+               "_msg_id": "skewed",
+               "_deadline": time.time() - 1}
+        rpc._pack_context(msg, self.context)
+        self.consumer._receive(msg, FakeMessage())
+        self.assertEqual('skewed', replies[0][0])
+
+    def test_call_has_no_deadline_by_default(self):
+        """Make sure calls wait forever unless given a timeout"""
+        sent = []
+        publisher_pool = rpc.PublisherPool.instance()
+        send = publisher_pool.send
+
+        def record(publisher_class, msg, **kwargs):
+            sent.append(dict(msg))
+            return send(publisher_class, msg, **kwargs)
+
+        self.stubs.Set(publisher_pool, 'send', record)
+        self.assertEqual(42, rpc.call(self.context, 'test',
+                                      {"method": "echo",
+                                       "args": {"value": 42}}))
+        self.assertFalse('_deadline' in sent[0])
+
+    def test_multicall(self):
+        """Make sure multicall gathers a reply from every topic"""
+        conn = rpc.Connection.instance(True)
+        consumer = rpc.TopicAdapterConsumer(connection=conn,
+                                            topic='test2',
+                                            proxy=TestReceiver())
+        consumer.attach_to_eventlet()
+        results, failures = rpc.multicall(self.context, ['test', 'test2'],
+                                          {"method": "echo",
+                                           "args": {"value": 42}})
+        self.assertEqual({'test': 42, 'test2': 42}, results)
+        self.assertEqual({}, failures)
+
+    def test_multicall_partial_results(self):
+        """Make sure multicall reports hosts that fail or never answer"""
+        results, failures = rpc.multicall(self.context, ['test', 'nobody'],
+                                          {"method": "echo",
+                                           "args": {"value": 42}},
+                                          timeout=1)
+        self.assertEqual({'test': 42}, results)
+        self.assertTrue(isinstance(failures['nobody'], rpc.Timeout))
+
+        results, failures = rpc.multicall(self.context, ['test'],
+                                          {"method": "fail",
+                                           "args": {"value": 42}})
+        self.assertEqual({}, results)
+        self.assertTrue(isinstance(failures['test'], rpc.RemoteError))
+
+    def test_topic_pool_size(self):
+        """Make sure host consumers share the sized pool of their topic"""
+        self.flags(rpc_topic_pool_sizes=['sized=2'])
+        conn = rpc.Connection.instance(True)
+        consumer = rpc.TopicAdapterConsumer(connection=conn,
+                                            topic='sized.host',
+                                            proxy=self.receiver)
+        self.assertEqual(2, consumer.pool.size)
+        self.assertEqual(consumer.pool, rpc._worker_pool('sized'))
+
+    def test_busy_consumer_leaves_messages_queued(self):
+        """Make sure a consumer only takes work it has a worker for"""
+        self.flags(rpc_topic_pool_sizes=['busy=1'])
+        done = event.Event()
+
+        class Blocker(object):
+            @staticmethod
+            def block(context):
+                done.wait()
+
+        conn = rpc.Connection.instance(True)
+        consumer = rpc.TopicAdapterConsumer(connection=conn,
+                                            topic='busy',
+                                            proxy=Blocker())
+        rpc.cast(self.context, 'busy', {"method": "block"})
+        rpc.cast(self.context, 'busy', {"method": "block"})
+        consumer.fetch(enable_callbacks=True)
+        consumer.fetch(enable_callbacks=True)
+        self.assertEqual({'topic': 'busy', 'workers': 1, 'running': 1,
+                          'queued': 1},
+                         consumer.stats())
+        done.send()
+        consumer.pool.waitall()
+
+    def test_cast_reuses_publisher(self):
+        """Make sure casts to the same topic share a pooled publisher"""
+        pool = rpc.PublisherPool.instance()
+        rpc.cast(self.context, 'test', {"method": "echo",
+                                        "args": {"value": 1}})
+        self.assertEqual(1, pool.size)
+        idle = pool.free.values()[0]
+        publisher = idle[0]
+        rpc.cast(self.context, 'test', {"method": "echo",
+                                        "args": {"value": 2}})
+        self.assertEqual(1, pool.size)
+        self.assertEqual([publisher], idle)
+
+    def test_publisher_pool_is_bounded(self):
+        """Make sure the pool closes publishers beyond its size"""
+        pool = rpc.PublisherPool(max_size=1)
+        pool.send(rpc.TopicPublisher, {}, topic='one')
+        pool.send(rpc.FanoutPublisher, {}, topic='two')
+        self.assertEqual(1, pool.size)
+        pool.close()
+        self.assertEqual(0, pool.size)
+
+    def test_publisher_pool_discards_failed_retry(self):
+        """Make sure a publisher that fails again is closed, not leaked"""
+        closed = []
+
+        class BrokenPublisher(object):
+            exchange = 'broken'
+
+            def __init__(self, connection):
+                self.connection = connection
+
+            def send(self, msg):
+                raise IOError('broken')
+
+            def close(self):
+                closed.append(self)
+
+        pool = rpc.PublisherPool(max_size=1)
+        self.assertRaises(IOError, pool.send, BrokenPublisher, {})
+        self.assertEqual(2, len(closed))
+        self.assertEqual(0, pool.size)
+
+    def test_stream_call(self):
+        """Make sure stream_call returns every item a generator yields"""
+        self.flags(rpc_stream_chunk_size=3)
+        result = rpc.stream_call(self.context, 'test',
+                                 {"method": "count", "args": {"value": 10}})
+        self.assertEqual(range(10), list(result))
+
+    def test_stream_call_single_value(self):
+        """Make sure a plain return value is streamed as a single item"""
+        result = rpc.stream_call(self.context, 'test',
+                                 {"method": "echo", "args": {"value": 42}})
+        self.assertEqual([42], list(result))
+
+    def test_call_collects_generator(self):
+        """Make sure a plain call gets a generator's items as a list"""
+        result = rpc.call(self.context, 'test',
+                          {"method": "count", "args": {"value": 3}})
+        self.assertEqual([0, 1, 2], result)
+
+    def test_stream_call_without_streaming_receiver(self):
+        """Make sure a single reply without ending ends the stream"""
+        def _reply_once(msg_id, result, window):
+            rpc.msg_reply(msg_id, rpc._materialize(result))
+
+        self.stubs.Set(rpc, '_stream_reply', _reply_once)
+        result = rpc.stream_call(self.context, 'test',
+                                 {"method": "count", "args": {"value": 3}})
+        self.assertEqual([0, 1, 2], list(result))
+        result = rpc.stream_call(self.context, 'test',
+                                 {"method": "echo", "args": {"value": 42}})
+        self.assertEqual([42], list(result))
+
+    def test_cast_runs_generator(self):
+        """Make sure a cast runs a method that yields its results"""
+        produced = []
+
+        class Producer(object):
+            @staticmethod
+            def produce(context):
+                produced.append(0)
+                yield 0
+
+        conn = rpc.Connection.instance(True)
+        consumer = rpc.TopicAdapterConsumer(connection=conn,
+                                            topic='produce',
+                                            proxy=Producer())
+        rpc.cast(self.context, 'produce', {"method": "produce"})
+        consumer.fetch(enable_callbacks=True)
+        consumer.pool.waitall()
+        self.assertEqual([0], produced)
+
+    def test_stream_call_exception(self):
+        """Make sure a failure part way through a stream is raised"""
+        self.flags(rpc_stream_chunk_size=1)
+        result = rpc.stream_call(self.context, 'test',
+                                 {"method": "count",
+                                  "args": {"value": 5, "fail_at": 2}})
+        self.assertEqual(0, result.next())
+        self.assertEqual(1, result.next())
+        self.assertRaises(rpc.RemoteError, result.next)
+
+    def test_stream_call_flow_control(self):
+        """Make sure the sender pauses while the caller lags behind"""
+        self.flags(rpc_stream_chunk_size=1, rpc_stream_window=2,
+                   rpc_stream_poll_interval=0.01)
+        produced = []
+
+        class Producer(object):
+            @staticmethod
+            def produce(context):
+                for i in xrange(50):
+                    produced.append(i)
+                    yield i
+
+        conn = rpc.Connection.instance(True)
+        consumer = rpc.TopicAdapterConsumer(connection=conn,
+                                            topic='stream',
+                                            proxy=Producer())
+        consumer.attach_to_eventlet()
+        result = rpc.stream_call(self.context, 'stream',
+                                 {"method": "produce"})
+        self.assertEqual(0, result.next())
+        time.sleep(0.1)
+        self.assertTrue(len(produced) < 10)
+        self.assertEqual(range(1, 50), list(result))
+
+    def test_stream_call_abandoned(self):
+        """Make sure the sender stops once the caller goes away"""
+        self.flags(rpc_stream_chunk_size=1, rpc_stream_window=1,
+                   rpc_stream_poll_interval=0.01)
+        result = rpc.stream_call(self.context, 'test',
+                                 {"method": "count", "args": {"value": 50}})
+        self.assertEqual(0, result.next())
+        result.close()
+        time.sleep(0.1)
+        self.assertEqual([], [name for name in fakerabbit.QUEUES
+                              if name != 'test'])
+
+
+class RpcReplyQueueTestCase(RpcTestCase):
+    """Runs the rpc tests with replies on a shared per-process queue"""
+    def setUp(self):
+        super(RpcReplyQueueTestCase, self).setUp()
+        self.flags(rpc_use_reply_queue=True)
+
+    def test_reply_queue_is_reused(self):
+        """Make sure every call waits on the same reply queue"""
+        rpc.call(self.context, 'test', {"method": "echo",
+                                        "args": {"value": 1}})
+        dispatcher = rpc.ReplyDispatcher.instance()
+        rpc.call(self.context, 'test', {"method": "echo",
+                                        "args": {"value": 2}})
+        self.assertEqual(dispatcher, rpc.ReplyDispatcher.instance())
+        self.assertEqual({}, dispatcher.waiters)
+
+    def test_concurrent_calls(self):
+        """Make sure concurrent callers each get their own reply"""
+        def _echo(value):
+            return rpc.call(self.context, 'test', {"method": "echo",
+                                                   "args": {"value": value}})
+
+        pool = greenpool.GreenPool()
+        self.assertEqual(range(10), list(pool.imap(_echo, range(10))))
+
+
+class RpcMsgpackTestCase(RpcTestCase):
+    """Runs the rpc tests with messages encoded as msgpack"""
+    def setUp(self):
+        super(RpcMsgpackTestCase, self).setUp()
+        self.flags(rpc_serializer='msgpack')
+
+    def test_publisher_serializer(self):
+        """Make sure publishers only use msgpack when it is installed"""
+        publisher = rpc.TopicPublisher(connection=self.conn, topic='test')
+        if rpc.msgpack:
+            self.assertEqual('msgpack', publisher.serializer)
+        else:
+            self.assertEqual('json', publisher.serializer)
+        publisher.close()
+
+
+class LocalDispatchTestCase(test.TestCase):
+    """Test cases for rpc to topics served in this process"""
+    def setUp(self):
+        super(LocalDispatchTestCase, self).setUp()
+        self.flags(rpc_local_dispatch=True)
+        self.conn = rpc.Connection.instance(True)
+        self.receiver = TestReceiver()
+        self.consumer = rpc.TopicAdapterConsumer(connection=self.conn,
+                                                 topic='local',
+                                                 proxy=self.receiver)
+        self.context = context.get_admin_context()
+
+    def test_call_skips_broker(self):
+        """Make sure a local call is answered without touching the queue"""
+        result = rpc.call(self.context, 'local', {"method": "echo",
+                                                  "args": {"value": 42}})
+        self.assertEqual(42, result)
+        self.assertEqual(0, rpc.PublisherPool.instance().size)
+
+    def test_call_exception(self):
+        """Make sure local failures are raised as RemoteError"""
+        try:
+            rpc.call(self.context, 'local', {"method": "fail",
+                                             "args": {"value": 42}})
+            self.fail("should have thrown rpc.RemoteError")
+        except rpc.RemoteError as exc:
+            self.assertEqual('Exception', exc.exc_type)
+            self.assertEqual(42, int(exc.value))
+
+    def test_cast_copies_args(self):
+        """Make sure a local cast can't see later changes to its args"""
+        seen = []
+
+        class Recorder(object):
+            @staticmethod
+            def record(context, values):
+                seen.append(values)
+
+        rpc.LocalDispatcher.instance().register('recorder', Recorder())
+        values = [1, 2]
+        rpc.cast(self.context, 'recorder', {"method": "record",
+                                            "args": {"values": values}})
+        values.append(3)
+        rpc._worker_pool('recorder').waitall()
+        self.assertEqual([[1, 2]], seen)
+
+    def test_call_flattens_result(self):
+        """Make sure a local call gets primitives, not the live model"""
+        service_ref = db.service_create(self.context, {'host': 'fake',
+                                                       'binary': 'fake',
+                                                       'topic': 'fake',
+                                                       'report_count': 0})
+
+        class Lookup(object):
+            @staticmethod
+            def get(context):
+                return service_ref
+
+        rpc.LocalDispatcher.instance().register('lookup', Lookup())
+        result = rpc.call(self.context, 'lookup', {"method": "get"})
+        self.assertEqual(dict, type(result))
+        self.assertEqual('fake', result['host'])
+        self.assertEqual(str(service_ref['created_at']),
+                         result['created_at'])
+
+    def test_call_collects_generator(self):
+        """Make sure a local call gets a generator's items as a list"""
+        result = rpc.call(self.context, 'local', {"method": "count",
+                                                  "args": {"value": 3}})
+        self.assertEqual([0, 1, 2], result)
+
+    def test_unserved_topic_uses_broker(self):
+        """Make sure topics nobody serves here still go to the broker"""
+        self.assertFalse(rpc.LocalDispatcher.instance().serves('remote'))
+        rpc.cast(self.context, 'remote', {"method": "echo",
+                                          "args": {"value": 42}})
+        self.assertEqual(1, rpc.PublisherPool.instance().size)
+
 
 class TestReceiver(object):
     """Simple Proxy class so the consumer has methods to call
@@ -130,3 +534,11 @@ class TestReceiver(object):
     def fail(context, value):
         """Raises an exception with the value sent in"""
         raise Exception(value)
+
+    @staticmethod
+    def count(context, value, fail_at=None):
+        """Yields the numbers up to value, failing at fail_at if set"""
+        for i in xrange(value):
+            if i == fail_at:
+                raise Exception(i)
+            yield i
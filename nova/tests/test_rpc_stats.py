@@ -0,0 +1,105 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For rpc instrumentation.
+"""
+
+from nova import context
+from nova import rpc
+from nova import rpc_stats
+from nova import test
+from nova.tests import test_rpc
+
+
+class MemorySinkTestCase(test.TestCase):
+    """Test cases for the in-memory counters"""
+
+    def test_record(self):
+        sink = rpc_stats.MemorySink()
+        sink.record('call', 'compute', 'echo', False, 10, {'total': 0.003})
+        sink.record('call', 'compute', 'echo', True, 20, {'total': 20})
+        stat = sink.snapshot()['compute']['echo']['call']
+        self.assertEqual(2, stat['count'])
+        self.assertEqual(1, stat['errors'])
+        self.assertEqual(30, stat['bytes'])
+        total = stat['timings']['total']
+        self.assertEqual(2, total['count'])
+        self.assertEqual(20000, total['max_ms'])
+        self.assertEqual(1, total['buckets'][1])
+        self.assertEqual(1, total['buckets'][-1])
+
+    def test_log_sink_resets_after_summary(self):
+        self.flags(rpc_stats_log_interval=0)
+        sink = rpc_stats.LogSink()
+        sink.record('cast', 'compute', 'echo', False, None, {'publish': 0})
+        self.assertEqual({}, sink.snapshot())
+
+    def test_statsd_sink(self):
+        sink = rpc_stats.StatsdSink()
+        sent = []
+
+        class FakeSocket(object):
+            def sendto(self, data, address):
+                sent.append(data)
+
+        sink.sock = FakeSocket()
+        sink.record('receive', 'compute.host', 'echo', True, 12,
+                    {'handler': 0.5})
+        self.assertEqual(['nova.rpc.compute_host.echo.receive.count:1|c\n'
+                          'nova.rpc.compute_host.echo.receive.errors:1|c\n'
+                          'nova.rpc.compute_host.echo.receive.bytes:12|c\n'
+                          'nova.rpc.compute_host.echo.receive.handler:500|ms'],
+                         sent)
+
+
+class RpcStatsTestCase(test.TestCase):
+    """Test cases for the samples nova.rpc records"""
+
+    def setUp(self):
+        super(RpcStatsTestCase, self).setUp()
+        self.conn = rpc.Connection.instance(True)
+        self.consumer = rpc.TopicAdapterConsumer(
+                connection=self.conn,
+                topic='stats',
+                proxy=test_rpc.TestReceiver())
+        self.consumer.attach_to_eventlet()
+        self.context = context.get_admin_context()
+
+    def test_call_and_receive_recorded(self):
+        rpc.call(self.context, 'stats', {"method": "echo",
+                                         "args": {"value": 42}})
+        stats = rpc_stats.snapshot()['stats']['echo']
+        self.assertEqual(1, stats['call']['count'])
+        self.assertTrue('total' in stats['call']['timings'])
+        self.assertEqual(1, stats['receive']['count'])
+        self.assertTrue(stats['receive']['bytes'] > 0)
+        self.assertEqual(['handler', 'queue', 'reply'],
+                         sorted(stats['receive']['timings'].keys()))
+
+    def test_failures_counted(self):
+        self.assertRaises(rpc.RemoteError, rpc.call, self.context, 'stats',
+                          {"method": "fail", "args": {"value": 42}})
+        stats = rpc_stats.snapshot()['stats']['fail']
+        self.assertEqual(1, stats['call']['errors'])
+        self.assertEqual(1, stats['receive']['errors'])
+
+    def test_disabled(self):
+        self.flags(rpc_stats_sinks=[])
+        rpc_stats.reset()
+        rpc.cast(self.context, 'stats', {"method": "echo",
+                                         "args": {"value": 42}})
+        self.assertEqual({}, rpc_stats.snapshot())
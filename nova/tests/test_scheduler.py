@@ -22,9 +22,11 @@ Tests For Scheduler
 import datetime
 import mox
 import novaclient.exceptions
+import socket
 import stubout
 import webob
 
+from eventlet import greenthread
 from mox import IgnoreArg
 from nova import context
 from nova import db
@@ -38,6 +40,8 @@ from nova.auth import manager as auth_manager
 from nova.scheduler import api
 from nova.scheduler import manager
 from nova.scheduler import driver
+from nova.scheduler import simple
+from nova.scheduler import zone_client
 from nova.compute import power_state
 from nova.db.sqlalchemy import models
 
@@ -102,6 +106,19 @@ class SchedulerTestCase(test.TestCase):
         self.mox.ReplayAll()
         scheduler.noexist(ctxt, 'topic', num=7)
 
+    def test_api_calls_are_bounded(self):
+        """Ensures calls made for the API don't wait forever"""
+        self.flags(rpc_api_call_timeout=5)
+        self.mox.StubOutWithMock(rpc, 'call', use_mock_anything=True)
+        ctxt = context.get_admin_context()
+        rpc.call(ctxt,
+                 FLAGS.scheduler_topic,
+                 {'method': 'get_zone_capabilities',
+                  'args': {}},
+                 timeout=5).AndReturn({})
+        self.mox.ReplayAll()
+        self.assertEqual({}, api.get_zone_capabilities(ctxt))
+
     def test_named_method(self):
         scheduler = manager.SchedulerManager()
         self.mox.StubOutWithMock(rpc, 'cast', use_mock_anything=True)
@@ -279,6 +296,7 @@ class SimpleDriverTestCase(test.TestCase):
         """Create a test volume"""
         vol = {}
         vol['size'] = 1
+        vol['status'] = 'creating'
         vol['availability_zone'] = 'test'
         return db.volume_create(self.context, vol)['id']
 
@@ -631,6 +649,111 @@ class SimpleDriverTestCase(test.TestCase):
         volume1.kill()
         volume2.kill()
 
+    def _report_volume_free(self, host, free_gb, updated_at=None):
+        self.scheduler.driver.update_service_capabilities('volume', host,
+                {'volume_group_total_gb': 100,
+                 'volume_group_free_gb': free_gb,
+                 'volume_group_updated_at': utils.isotime(updated_at)})
+
+    def test_host_with_most_free_space_gets_volume(self):
+        """Ensures the host with more free space gets the next one"""
+        volume1 = self.start_service('volume', host='host1')
+        volume2 = self.start_service('volume', host='host2')
+        volume_id1 = self._create_volume()
+        volume1.create_volume(self.context, volume_id1)
+        self._report_volume_free('host1', 50)
+        self._report_volume_free('host2', 20)
+        volume_id2 = self._create_volume()
+        host = self.scheduler.driver.schedule_create_volume(self.context,
+                                                            volume_id2)
+        self.assertEqual(host, 'host1')
+        volume1.delete_volume(self.context, volume_id1)
+        db.volume_destroy(self.context, volume_id2)
+        volume1.kill()
+        volume2.kill()
+
+    def test_volume_group_too_small(self):
+        """Ensures we don't go over the free space hosts report"""
+        volume1 = self.start_service('volume', host='host1')
+        self._report_volume_free('host1', 0.5)
+        volume_id = self._create_volume()
+        self.assertRaises(driver.NoValidHost,
+                          self.scheduler.driver.schedule_create_volume,
+                          self.context,
+                          volume_id)
+        db.volume_destroy(self.context, volume_id)
+        volume1.kill()
+
+    def test_volumes_claim_space_until_next_report(self):
+        """Ensures volumes are counted until a report read after them"""
+        volume1 = self.start_service('volume', host='host1')
+        volume2 = self.start_service('volume', host='host2')
+        now = datetime.datetime(2011, 7, 1, 12, 0, 0)
+        utils.set_time_override(now)
+        try:
+            self._report_volume_free('host1', 3)
+            self._report_volume_free('host2', 2)
+            utils.advance_time_seconds(1)
+            volume_ids = [self._create_volume() for _i in xrange(5)]
+            hosts = [self.scheduler.driver.schedule_create_volume(
+                             self.context, volume_id)
+                     for volume_id in volume_ids]
+            self.assertEqual(sorted(hosts), ['host1'] * 3 + ['host2'] * 2)
+            volume_id = self._create_volume()
+            self.assertRaises(driver.NoValidHost,
+                              self.scheduler.driver.schedule_create_volume,
+                              self.context,
+                              volume_id)
+            self._report_volume_free('host2', 2, now)
+            self.assertRaises(driver.NoValidHost,
+                              self.scheduler.driver.schedule_create_volume,
+                              self.context,
+                              volume_id)
+            utils.advance_time_seconds(1)
+            self._report_volume_free('host2', 2)
+            host = self.scheduler.driver.schedule_create_volume(self.context,
+                                                                volume_id)
+        finally:
+            utils.clear_time_override()
+        self.assertEqual(host, 'host2')
+        for volume_id in volume_ids + [volume_id]:
+            db.volume_destroy(self.context, volume_id)
+        volume1.kill()
+        volume2.kill()
+
+    def test_hosts_without_reports_keep_getting_volumes(self):
+        """Ensures hosts that don't report free space are still used"""
+        volume1 = self.start_service('volume', host='host1')
+        volume2 = self.start_service('volume', host='host2')
+        self._report_volume_free('host1', 0.5)
+        volume_id = self._create_volume()
+        host = self.scheduler.driver.schedule_create_volume(self.context,
+                                                            volume_id)
+        self.assertEqual(host, 'host2')
+        db.volume_destroy(self.context, volume_id)
+        volume1.kill()
+        volume2.kill()
+
+    def test_volume_sums_loaded_once(self):
+        """Ensures placements don't sum over the volumes table"""
+        volume1 = self.start_service('volume', host='host1')
+        volume2 = self.start_service('volume', host='host2')
+        self.mox.StubOutWithMock(db, 'service_get_all_volume_sorted')
+        self.mox.StubOutWithMock(db, 'volume_get_sums_by_host')
+        db.volume_get_sums_by_host(mox.IgnoreArg(),
+                                   mox.IgnoreArg()).AndReturn({'host1': 3})
+        self.mox.ReplayAll()
+        volume_ids = [self._create_volume() for _i in xrange(2)]
+        hosts = [self.scheduler.driver.schedule_create_volume(self.context,
+                                                              volume_id)
+                 for volume_id in volume_ids]
+        self.assertEqual(hosts, ['host2', 'host2'])
+        self.mox.VerifyAll()
+        for volume_id in volume_ids:
+            db.volume_destroy(self.context, volume_id)
+        volume1.kill()
+        volume2.kill()
+
     def test_scheduler_live_migration_with_volume(self):
         """scheduler_live_migration() works correctly as expected.
 
@@ -911,6 +1034,210 @@ class SimpleDriverTestCase(test.TestCase):
         db.service_destroy(self.context, s_ref2['id'])
 
 
+class HostStateTestCase(test.TestCase):
+    """Test case for the simple scheduler's host usage cache"""
+    def setUp(self):
+        super(HostStateTestCase, self).setUp()
+        self.flags(max_cores=4,
+                   scheduler_driver='nova.scheduler.simple.SimpleScheduler')
+        self.scheduler = manager.SchedulerManager()
+        self.context = context.get_admin_context()
+        for host in ('host1', 'host2'):
+            db.service_create(self.context, {'host': host,
+                                             'binary': 'nova-compute',
+                                             'topic': 'compute',
+                                             'report_count': 0})
+
+    def _create_instance(self, **kwargs):
+        """Create a test instance"""
+        inst = {'vcpus': kwargs.get('vcpus', 1),
+                'memory_mb': 10,
+                'local_gb': 20,
+                'host': kwargs.get('host')}
+        return db.instance_create(self.context, inst)['id']
+
+    def _schedule(self, **kwargs):
+        instance_id = self._create_instance(**kwargs)
+        return self.scheduler.driver.schedule_run_instance(self.context,
+                                                           instance_id)
+
+    def test_sums_loaded_once(self):
+        """Ensures placements don't sum over the instances table"""
+        self._create_instance(host='host1', vcpus=2)
+        self.mox.StubOutWithMock(db, 'instance_get_sums_by_host')
+        db.instance_get_sums_by_host(mox.IgnoreArg()).AndReturn(
+                {'host1': {'vcpus': 2, 'memory_mb': 10, 'local_gb': 20}})
+        self.mox.ReplayAll()
+        self.assertEqual('host2', self._schedule())
+        self.assertEqual('host2', self._schedule())
+        self.assertEqual('host1', self._schedule())
+        usage = self.scheduler.driver.host_state.usage
+        self.assertEqual(3, usage['host1']['vcpus'])
+        self.assertEqual(40, usage['host2']['local_gb'])
+
+    def test_own_placements_count_against_max_cores(self):
+        """Ensures cached placements are enough to hit max_cores"""
+        for i in xrange(FLAGS.max_cores * 2):
+            self._schedule()
+        self.assertRaises(driver.NoValidHost, self._schedule)
+
+    def test_reconcile_picks_up_deletes(self):
+        """Ensures a stale cache is reloaded from the database"""
+        self.flags(host_state_reconcile_interval=0)
+        instance_id = self._create_instance(host='host1', vcpus=4)
+        self.assertEqual('host2', self._schedule())
+        db.instance_destroy(self.context, instance_id)
+        self.assertEqual('host1', self._schedule())
+
+    def _report_usage(self, host, vcpus, updated_at):
+        self.scheduler.update_service_capabilities(self.context,
+                service_name='compute', host=host,
+                capabilities={'vcpus_used': vcpus, 'memory_mb_used': 0,
+                              'local_gb_used': 0,
+                              'usage_updated_at': utils.isotime(updated_at)})
+
+    def test_capability_report_replaces_usage(self):
+        """Ensures compute reports replace usage, keeping newer placements"""
+        now = datetime.datetime(2011, 7, 1, 12, 0, 0)
+        utils.set_time_override(now)
+        try:
+            self._create_instance(host='host1', vcpus=3)
+            self.assertEqual('host2', self._schedule())
+            utils.advance_time_seconds(1)
+            self._report_usage('host1', 0, utils.utcnow())
+            self._report_usage('host2', 0, now)
+        finally:
+            utils.clear_time_override()
+        usage = self.scheduler.driver.host_state.usage
+        self.assertEqual(0, usage['host1']['vcpus'])
+        self.assertEqual(1, usage['host2']['vcpus'])
+
+    def test_stale_report_is_dropped(self):
+        """Ensures reports summed up before the held usage are ignored"""
+        now = datetime.datetime(2011, 7, 1, 12, 0, 0)
+        utils.set_time_override(now)
+        try:
+            self._create_instance(host='host1', vcpus=3)
+            self.assertEqual('host2', self._schedule())
+            self._report_usage('host1', 0, now - datetime.timedelta(0, 120))
+            self._report_usage('host2', 0, now - datetime.timedelta(0, 120))
+            usage = self.scheduler.driver.host_state.usage
+            self.assertEqual(3, usage['host1']['vcpus'])
+            self.assertEqual(1, usage['host2']['vcpus'])
+            utils.advance_time_seconds(2)
+            self._report_usage('host1', 2, utils.utcnow())
+            self._report_usage('host1', 0, now + datetime.timedelta(0, 1))
+        finally:
+            utils.clear_time_override()
+        usage = self.scheduler.driver.host_state.usage
+        self.assertEqual(2, usage['host1']['vcpus'])
+
+    def test_claims_seen_by_other_schedulers(self):
+        """Ensures a placement counts for every scheduler right away"""
+        other = simple.SimpleScheduler()
+        other.host_state.get_all(self.context)
+        self._create_instance(host='host2', vcpus=1)
+        self.assertEqual('host1', self._schedule(vcpus=2))
+        instance_id = self._create_instance(vcpus=1)
+        self.assertEqual('host2', other.schedule_run_instance(self.context,
+                                                              instance_id))
+
+    def test_released_claims_are_not_counted(self):
+        """Ensures compute giving a claim back frees the resources"""
+        other = simple.SimpleScheduler()
+        other.host_state.get_all(self.context)
+        self._create_instance(host='host2', vcpus=1)
+        instance_id = self._create_instance(vcpus=2)
+        self.assertEqual('host1', self.scheduler.driver.schedule_run_instance(
+                self.context, instance_id))
+        db.compute_claim_finish(self.context, instance_id, 'released')
+        instance_id = self._create_instance(vcpus=1)
+        self.assertEqual('host1', other.schedule_run_instance(self.context,
+                                                              instance_id))
+
+    def test_claims_disabled(self):
+        """Ensures only own placements count without claims"""
+        self.flags(scheduler_claims=False)
+        other = simple.SimpleScheduler()
+        other.host_state.get_all(self.context)
+        self.assertEqual('host1', self._schedule(vcpus=2))
+        instance_id = self._create_instance(vcpus=1)
+        self.assertEqual('host1', other.schedule_run_instance(self.context,
+                                                              instance_id))
+
+
+class BatchPlacementTestCase(test.TestCase):
+    """Test case for placing a whole reservation at once"""
+    def setUp(self):
+        super(BatchPlacementTestCase, self).setUp()
+        self.flags(max_cores=4,
+                   scheduler_driver='nova.scheduler.simple.SimpleScheduler')
+        self.scheduler = manager.SchedulerManager()
+        self.context = context.get_admin_context()
+        for host in ('host1', 'host2', 'host3'):
+            db.service_create(self.context, {'host': host,
+                                             'binary': 'nova-compute',
+                                             'topic': 'compute',
+                                             'report_count': 0})
+        db.instance_create(self.context, {'host': 'host1', 'vcpus': 2})
+
+    def _create_instances(self, count):
+        return [db.instance_create(self.context, {'vcpus': 1})['id']
+                for i in xrange(count)]
+
+    def _schedule(self, count):
+        return self.scheduler.driver.schedule_run_instances(
+                self.context, 'compute', self._create_instances(count))
+
+    def test_spread(self):
+        """Ensures spread evens out the least loaded hosts"""
+        self.assertEqual(['host2', 'host3', 'host2', 'host3', 'host1'],
+                         self._schedule(5))
+
+    def test_pack(self):
+        """Ensures pack fills the busiest hosts first"""
+        self.flags(scheduler_batch_policy='pack')
+        self.assertEqual(['host1', 'host1', 'host3', 'host3', 'host3'],
+                         self._schedule(5))
+
+    def test_placements_recorded(self):
+        """Ensures placed instances get their host and count as used"""
+        instance_ids = self._create_instances(2)
+        self.scheduler.driver.schedule_run_instances(self.context,
+                                                     'compute', instance_ids)
+        hosts = [db.instance_get(self.context, instance_id)['host']
+                 for instance_id in instance_ids]
+        self.assertEqual(['host2', 'host3'], hosts)
+        self.assertEqual(['host2', 'host3'], self._schedule(2))
+
+    def test_instances_that_dont_fit(self):
+        """Ensures instances beyond max_cores get no host"""
+        hosts = self._schedule(11)
+        self.assertEqual(10, len(filter(None, hosts)))
+        self.assertEqual(None, hosts[-1])
+
+    def test_manager_casts_each_placement(self):
+        """Ensures the manager casts run_instance to every chosen host"""
+        casts = []
+        self.stubs.Set(rpc, 'cast', lambda ctxt, topic, msg: casts.append(
+                (topic, msg['args']['instance_id'])))
+        instance_ids = self._create_instances(11)
+        self.assertRaises(driver.NoValidHost,
+                          self.scheduler.run_instances, self.context,
+                          topic='compute', instance_ids=instance_ids,
+                          availability_zone=None)
+        self.assertEqual(10, len(casts))
+        self.assertEqual(('compute.host2', instance_ids[0]), casts[0])
+
+    def test_default_schedules_one_by_one(self):
+        """Ensures drivers without a batch method still place everything"""
+        scheduler = manager.SchedulerManager(
+                'nova.tests.test_scheduler.TestDriver')
+        self.assertEqual(['fallback_host', 'fallback_host'],
+                         scheduler.driver.schedule_run_instances(
+                                self.context, 'compute', [1, 2]))
+
+
 class FakeZone(object):
     def __init__(self, api_url, username, password):
         self.api_url = api_url
@@ -1063,3 +1390,98 @@ class DynamicNovaClientTest(test.TestCase):
         self.assertEquals(api._issue_novaclient_command(
                     FakeNovaClient(FakeEmptyServerCollection()),
                     zone, "servers", "any", "name"), None)
+
+
+class ZoneClientTest(test.TestCase):
+    def setUp(self):
+        super(ZoneClientTest, self).setUp()
+        self.zones = [FakeZone('http://zone1', 'bob', 'xxx'),
+                      FakeZone('http://zone2', 'bob', 'xxx')]
+        self.stubs.Set(db, 'zone_get_all', lambda context: self.zones)
+        self.flags(enable_zone_routing=True)
+        self.called = []
+
+        def fake_process(func, zone):
+            self.called.append(zone.api_url)
+            if zone.api_url == 'http://zone2':
+                collection = FakeServerCollection()
+            else:
+                collection = FakeEmptyServerCollection()
+            return func(FakeNovaClient(collection), zone)
+
+        self.stubs.Set(api, '_process', fake_process)
+
+    def test_fan_out_times_out_slow_zones(self):
+        self.flags(zone_call_timeout=1)
+
+        def call(zone):
+            if zone.api_url == 'http://zone1':
+                greenthread.sleep(2)
+            return zone.api_url
+
+        self.assertEquals([None, 'http://zone2'],
+                          zone_client.fan_out(self.zones, call))
+
+    def test_circuit_opens_after_failures(self):
+        self.flags(zone_circuit_failures=2, zone_circuit_reset_interval=60)
+        calls = []
+
+        def fail(zone):
+            calls.append(zone)
+            raise socket.error('kaboom')
+
+        utils.set_time_override()
+        try:
+            for i in xrange(3):
+                self.assertEquals(None, zone_client.call_zone(fail,
+                                                              self.zones[0]))
+            self.assertEquals(2, len(calls))
+            utils.advance_time_seconds(61)
+            self.assertEquals('ok', zone_client.call_zone(lambda zone: 'ok',
+                                                          self.zones[0]))
+            self.assertTrue(zone_client.breaker(self.zones[0]).allow())
+        finally:
+            utils.clear_time_override()
+
+    def test_zone_errors_are_raised(self):
+        self.flags(zone_circuit_failures=1)
+
+        def conflict(zone):
+            raise novaclient.exceptions.ClientException(409)
+
+        for i in xrange(2):
+            self.assertRaises(novaclient.exceptions.ClientException,
+                              zone_client.fan_out, self.zones, conflict)
+        self.assertTrue(zone_client.breaker(self.zones[0]).allow())
+
+    def test_unavailable_zone_opens_circuit(self):
+        self.flags(zone_circuit_failures=1)
+
+        def unavailable(zone):
+            raise novaclient.exceptions.ClientException(503)
+
+        self.assertEquals([None, None],
+                          zone_client.fan_out(self.zones, unavailable))
+        self.assertFalse(zone_client.breaker(self.zones[0]).allow())
+
+    def test_reroute_remembers_instance_zone(self):
+        decorator = api.reroute_compute('get')
+        result = api.redirect_handler(decorator(go_boom))(None, None, 1)
+        self.assertEquals(10, result['server']['a'])
+        self.assertEquals(['http://zone1', 'http://zone2'],
+                          sorted(self.called))
+
+        self.called = []
+        result = api.redirect_handler(decorator(go_boom))(None, None, 1)
+        self.assertEquals(10, result['server']['a'])
+        self.assertEquals(['http://zone2'], self.called)
+
+    def test_reroute_falls_back_when_instance_moved(self):
+        zone_client.instance_zones().remember('servers', 1, 'http://zone1')
+        decorator = api.reroute_compute('get')
+        result = api.redirect_handler(decorator(go_boom))(None, None, 1)
+        self.assertEquals(10, result['server']['a'])
+        self.assertEquals(['http://zone1', 'http://zone1', 'http://zone2'],
+                          sorted(self.called))
+        self.assertEquals('http://zone2', zone_client.instance_zones().get(
+                'servers', 1))
@@ -0,0 +1,70 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the scheduler benchmark.
+"""
+
+import os
+import tempfile
+
+from nova import context
+from nova import test
+from nova.scheduler import benchmark
+
+
+class SchedulerBenchmarkTestCase(test.TestCase):
+    """Test case for replaying traces through scheduler drivers"""
+
+    def setUp(self):
+        super(SchedulerBenchmarkTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.flags(bench_hosts=4, bench_volume_hosts=2, bench_requests=12,
+                   bench_volume_ratio=0.25, bench_report_every=3)
+
+    def test_generated_trace_is_repeatable(self):
+        self.assertEqual(benchmark.generate_trace(20, 0.5, seed=1),
+                         benchmark.generate_trace(20, 0.5, seed=1))
+
+    def test_trace_round_trip(self):
+        trace = benchmark.generate_trace(5, 0.5, seed=1)
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            benchmark.save_trace(path, trace)
+            self.assertEqual(trace, benchmark.load_trace(path))
+        finally:
+            os.unlink(path)
+
+    def _run(self, scheduler_driver):
+        report = benchmark.run(self.context, scheduler_driver)
+        self.assertEqual(12, report['decisions'])
+        self.assertTrue(report['statements_per_decision'] > 0)
+        self.assertTrue(report['latency_p99_ms'] >= report['latency_p50_ms'])
+        return report
+
+    def test_simple_scheduler(self):
+        self._run('nova.scheduler.simple.SimpleScheduler')
+
+    def test_least_cost_scheduler(self):
+        report = self._run('nova.scheduler.least_cost.LeastCostScheduler')
+        self.assertEqual(0, report['hosts_overcommitted'])
+
+    def test_host_filter_scheduler(self):
+        flavor_filter = 'nova.scheduler.host_filter.FlavorFilter'
+        self.flags(default_host_filter_driver=flavor_filter)
+        report = self._run('nova.scheduler.benchmark.HostFilterScheduler')
+        self.assertEqual(0, report['failures'])
@@ -275,3 +275,19 @@ class GenericUtilsTestCase(test.TestCase):
         # error case
         result = utils.parse_server_string('www.exa:mple.com:8443')
         self.assertEqual(('', ''), result)
+
+    def test_lru_cache_evicts_least_recently_used(self):
+        cache = utils.LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(1, cache.get('a'))
+        cache['c'] = 3
+        self.assertEqual(2, len(cache))
+        self.assertFalse('b' in cache)
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(3, cache.get('c'))
+        cache['a'] = 4
+        cache['d'] = 5
+        self.assertFalse('c' in cache)
+        self.assertEqual(4, cache.get('a'))
+        self.assertEqual(None, cache.get('c'))
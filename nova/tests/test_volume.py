@@ -21,6 +21,7 @@ Tests for Volume Code.
 """
 
 import cStringIO
+import datetime
 
 from nova import context
 from nova import exception
@@ -369,3 +370,32 @@ class ISCSITestCase(DriverTestCase):
         self.mox.UnsetStubs()
 
         self._detach_volume(volume_id_list)
+
+    def test_get_volume_stats(self):
+        """Size and free space of the volume group are reported in GB."""
+        self.output = "  100.00   42.50\n"
+        stats = self.volume.driver.get_volume_stats()
+        self.assertEqual(stats, {'volume_group_total_gb': 100.0,
+                                 'volume_group_free_gb': 42.5})
+
+    def test_get_volume_stats_without_volume_group(self):
+        """Nothing is reported when vgs doesn't list the volume group."""
+        self.output = ""
+        self.assertEqual(self.volume.driver.get_volume_stats(), None)
+
+    def test_report_volume_stats(self):
+        """Volumes still being created are taken off the free space."""
+        volume_ref = db.volume_create(self.context, {'host': self.volume.host,
+                                                     'size': 5,
+                                                     'status': 'creating'})
+        self.output = "  100.00   42.50\n"
+        now = datetime.datetime(2011, 7, 1, 12, 0, 0)
+        utils.set_time_override(now)
+        try:
+            self.volume.periodic_tasks(self.context)
+        finally:
+            utils.clear_time_override()
+        stats = self.volume.last_capabilities
+        self.assertEqual(stats['volume_group_free_gb'], 37.5)
+        self.assertEqual(stats['volume_group_updated_at'], utils.isotime(now))
+        db.volume_destroy(self.context, volume_ref['id'])
@@ -198,3 +198,71 @@ class ZoneManagerTestCase(test.TestCase):
         self.assertEquals(zone_state.attempt, 3)
         self.assertFalse(zone_state.is_active)
         self.assertEquals(zone_state.name, None)
+
+    def test_hosts_with_capacity(self):
+        zm = zone_manager.ZoneManager()
+        zm.update_service_capabilities('compute', 'host1',
+                dict(host_memory_free=512, disk_available=10))
+        zm.update_service_capabilities('compute', 'host2',
+                dict(host_memory_free=256, disk_available=100))
+        zm.update_service_capabilities('compute', 'host3',
+                dict(host_memory_free=1024, disk_available=100))
+        zm.update_service_capabilities('compute', 'host4', dict())
+        zm.update_service_capabilities('volume', 'host5',
+                dict(host_memory_free=4096, disk_available=1000))
+        self.assertEquals(['host2', 'host3'], zm.hosts_with_capacity(256, 20))
+        self.assertEquals(['host1', 'host3'], zm.hosts_with_capacity(300, 0))
+        self.assertEquals([], zm.hosts_with_capacity(2048, 0))
+
+        zm.update_service_capabilities('compute', 'host3',
+                dict(host_memory_free=128, disk_available=100))
+        self.assertEquals(['host2'], zm.hosts_with_capacity(256, 20))
+
+    def test_service_capabilities_decrease(self):
+        zm = zone_manager.ZoneManager()
+        zm.update_service_capabilities("svc1", "host1", dict(a=1))
+        zm.update_service_capabilities("svc1", "host2", dict(a=5))
+        zm.update_service_capabilities("svc1", "host3", dict(a=9))
+        zm.update_service_capabilities("svc1", "host3", dict(a=3))
+        zm.update_service_capabilities("svc1", "host1", dict(a=4))
+        caps = zm.get_zone_capabilities(None)
+        self.assertEquals(caps, dict(svc1_a=(3, 5)))
+
+    def test_stale_service_capabilities_expire(self):
+        self.flags(service_capabilities_ttl=60)
+        utils.set_time_override()
+        try:
+            zm = zone_manager.ZoneManager()
+            zm.update_service_capabilities("compute", "host1",
+                    dict(host_memory_free=10, disk_available=10))
+            utils.advance_time_seconds(45)
+            zm.update_service_capabilities("compute", "host2",
+                    dict(host_memory_free=20, disk_available=20))
+            zm.update_service_capabilities("svc1", "host1", dict(a=1))
+            utils.advance_time_seconds(30)
+            caps = zm.get_zone_capabilities(None)
+            self.assertEquals(caps, dict(compute_host_memory_free=(20, 20),
+                                         compute_disk_available=(20, 20),
+                                         svc1_a=(1, 1)))
+            self.assertEquals(['host2'], zm.hosts_with_capacity(0, 0))
+            self.assertEquals(dict(svc1=dict(a=1)), zm.service_states['host1'])
+
+            utils.advance_time_seconds(60)
+            self.assertEquals({}, zm.get_zone_capabilities(None))
+            self.assertEquals({}, zm.service_states)
+        finally:
+            utils.clear_time_override()
+
+    def test_service_capabilities_never_expire(self):
+        self.flags(service_capabilities_ttl=0)
+        utils.set_time_override()
+        try:
+            zm = zone_manager.ZoneManager()
+            for _i in xrange(10):
+                zm.update_service_capabilities("svc1", "host1", dict(a=1))
+                utils.advance_time_seconds(3600)
+            self.assertEquals(0, len(zm.reports))
+            self.assertEquals(dict(svc1_a=(1, 1)),
+                              zm.get_zone_capabilities(None))
+        finally:
+            utils.clear_time_override()
@@ -482,6 +482,67 @@ class LoopingCall(object):
         return self.done.wait()
 
 
+class LRUCache(object):
+    """A dict-like cache holding at most size items.
+
+    Once full, storing a new key evicts the least recently used one.
+    Entries live in a circular doubly linked list of
+    [prev, next, key, value] cells so that lookups, stores and evictions
+    are all O(1).
+
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._cells = {}
+        self._root = root = []
+        root[:] = [root, root, None, None]
+
+    def __len__(self):
+        return len(self._cells)
+
+    def __contains__(self, key):
+        return key in self._cells
+
+    def get(self, key, default=None):
+        cell = self._cells.get(key)
+        if cell is None:
+            return default
+        self._unlink(cell)
+        self._append(cell)
+        return cell[3]
+
+    def __setitem__(self, key, value):
+        cell = self._cells.get(key)
+        if cell is not None:
+            self._unlink(cell)
+        elif self.size <= 0:
+            return
+        elif len(self._cells) >= self.size:
+            oldest = self._root[1]
+            self._unlink(oldest)
+            del self._cells[oldest[2]]
+        cell = [None, None, key, value]
+        self._cells[key] = cell
+        self._append(cell)
+
+    def clear(self):
+        self._cells.clear()
+        self._root[:] = [self._root, self._root, None, None]
+
+    def _append(self, cell):
+        last = self._root[0]
+        cell[0] = last
+        cell[1] = self._root
+        last[1] = cell
+        self._root[0] = cell
+
+    @staticmethod
+    def _unlink(cell):
+        cell[0][1] = cell[1]
+        cell[1][0] = cell[0]
+
+
 def xhtml_escape(value):
     """Escapes a string so it is valid within XML or XHTML.
 
@@ -166,6 +166,11 @@ class ComputeDriver(object):
         """
         raise NotImplementedError()
 
+    def get_host_stats(self, refresh=False):
+        """Return the capabilities of the host for the schedulers, or None
+        if the driver doesn't report any.  See xenapi_conn.py."""
+        return None
+
     def live_migration(self, ctxt, instance_ref, dest,
                        post_method, recover_method):
         """Spawning live_migration operation for distributing high-load.
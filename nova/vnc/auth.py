@@ -73,7 +73,8 @@ class VNCNovaAuthMiddleware(object):
 
         rval = rpc.call(context.get_admin_context(),
                         FLAGS.vncproxy_topic,
-                        {"method": "check_token", "args": {'token': token}})
+                        {"method": "check_token", "args": {'token': token}},
+                        timeout=FLAGS.rpc_api_call_timeout)
         if rval:
             self.token_cache[token] = rval
         return rval
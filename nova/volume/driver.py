@@ -90,6 +90,22 @@ class VolumeDriver(object):
             raise exception.Error(_("volume group %s doesn't exist")
                                   % FLAGS.volume_group)
 
+    def get_volume_stats(self):
+        """Returns the size and free space of the volume group in GB as
+        capabilities for the schedulers, or None if they can't be read."""
+        try:
+            out, _err = self._execute('sudo', 'vgs', '--noheadings',
+                                      '--nosuffix', '--units', 'g',
+                                      '-o', 'size,free', FLAGS.volume_group)
+            total_gb, free_gb = [float(field) for field in out.split()]
+        except (exception.ProcessExecutionError, AttributeError,
+                TypeError, ValueError):
+            LOG.warn(_("Unable to read the size of volume group %s"),
+                     FLAGS.volume_group)
+            return None
+        return {'volume_group_total_gb': total_gb,
+                'volume_group_free_gb': free_gb}
+
     def create_volume(self, volume):
         """Creates a logical volume. Can optionally return a Dictionary of
         changes to the volume object to be persisted."""
@@ -537,6 +553,10 @@ class FakeISCSIDriver(ISCSIDriver):
 class RBDDriver(VolumeDriver):
     """Implements RADOS block device (RBD) volume commands"""
 
+    def get_volume_stats(self):
+        """There is no volume group to report on."""
+        return None
+
     def check_for_setup_error(self):
         """Returns an error if prerequisites aren't met"""
         (stdout, stderr) = self._execute('rados', 'lspools')
@@ -589,6 +609,10 @@ class RBDDriver(VolumeDriver):
 class SheepdogDriver(VolumeDriver):
     """Executes commands relating to Sheepdog Volumes"""
 
+    def get_volume_stats(self):
+        """There is no volume group to report on."""
+        return None
+
     def check_for_setup_error(self):
         """Returns an error if prerequisites aren't met"""
         try:
@@ -173,6 +173,29 @@ class VolumeManager(manager.SchedulerDependentManager):
         else:
             self.driver.undiscover_volume(volume_ref)
 
+    def periodic_tasks(self, context=None):
+        """Tasks to be run at a periodic interval."""
+        self._report_volume_stats()
+        return super(VolumeManager, self).periodic_tasks(context)
+
+    def _report_volume_stats(self):
+        """Queues the free space of the volume group for the schedulers,
+        less the volumes scheduled here that are still being created."""
+        # NOTE: take the time and read the volumes before the volume
+        #       group, a volume built in between is counted twice by the
+        #       schedulers rather than not at all
+        updated_at = utils.isotime()
+        ctxt = context.get_admin_context()
+        creating = self.db.volume_get_sums_by_host(ctxt, [self.host],
+                                                   status='creating')
+        stats = self.driver.get_volume_stats()
+        if not stats:
+            return
+        stats = dict(stats)
+        stats['volume_group_free_gb'] -= creating.get(self.host, 0)
+        stats['volume_group_updated_at'] = updated_at
+        self.update_service_capabilities(stats)
+
     def check_for_export(self, context, instance_id):
         """Make sure whether volume is exported."""
         instance_ref = self.db.instance_get(context, instance_id)
@@ -130,6 +130,7 @@ setup(name='nova',
                'bin/nova-network',
                'bin/nova-objectstore',
                'bin/nova-scheduler',
+               'bin/nova-scheduler-bench',
                'bin/nova-spoolsentry',
                'bin/stack',
                'bin/nova-volume',